@@ -1,30 +1,61 @@
 # app/__init__.py
 
+# Standard library imports.
+import sqlite3
+
 # Third-party imports.
 from flask import Flask
 from flask_bootstrap import Bootstrap
 from flask_login import LoginManager
 from flask_migrate import Migrate
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
 
 # Local imports.
 from config import app_config
+from .replica import RoutingSession
 
 # db variable initialization.
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 login_manager = LoginManager()
 
-def create_app(config_name='development'):
+@event.listens_for(Engine, 'connect')
+def enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    '''
+    SQLite ignores foreign keys, and with them ON DELETE CASCADE, unless
+    enabled on every connection.
+    '''
+
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA foreign_keys=ON')
+        cursor.close()
+
+def create_app(config_name='development', config_overrides=None):
     '''
     Factory function to create the flask app.
+    config_overrides are applied last, e.g. to point tools at another database.
+    instance/config.py is optional so tools and tests can run from a clean
+    checkout.
     '''
 
     app = Flask(__name__, instance_relative_config=True)
     app.config.from_object(app_config[config_name])
-    app.config.from_pyfile('config.py')
+    app.config.from_pyfile('config.py', silent=True)
+    if config_overrides:
+        app.config.update(config_overrides)
+
+    from .pool import configure_engine, engine_options
+    from .replica import replica_binds
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config)
+    app.config['SQLALCHEMY_BINDS'] = replica_binds(app.config)
 
     Bootstrap(app)
     db.init_app(app)
+    with app.app_context():
+        for engine in db.engines.values():
+            configure_engine(engine, app.config)
     login_manager.init_app(app)
     login_manager.login_message = "You must be logged in to access this page."
     login_manager.login_view = "auth.login"
@@ -32,6 +63,37 @@ def create_app(config_name='development'):
 
     from app import models
 
+    # Fee ledger listeners that keep the fee summary table current.
+    from app import fees
+
+    # Enrollment listeners that keep course seat counts current.
+    from app import enrollment
+    from .identity import identity_cache
+    identity_cache.init_app(app)
+
+    from .reference import reference_data
+    reference_data.init_app(app)
+
+    from .search import search_index
+    search_index.init_app(app)
+
+    from .httpcache import table_versions
+    table_versions.init_app(app)
+
+    from .instrumentation import instrumentation
+    instrumentation.init_app(app)
+
+    from .replica import replica_router
+    replica_router.init_app(app)
+
+    from .sessions import session_store
+    session_store.init_app(app)
+
+    # Background job kinds and the workers that run them.
+    from app import tasks
+    from .jobs import job_workers
+    job_workers.init_app(app)
+
     from .admin import admin as admin_blueprint
     app.register_blueprint(admin_blueprint, url_prefix='/admin')
 
@@ -41,4 +103,10 @@ def create_app(config_name='development'):
     from .home import home as home_blueprint
     app.register_blueprint(home_blueprint)
 
+    from .api import api as api_blueprint
+    app.register_blueprint(api_blueprint, url_prefix='/api/v1')
+
+    from .commands import register_commands
+    register_commands(app)
+
     return app
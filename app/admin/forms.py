@@ -1,9 +1,10 @@
 # app/admin/forms.py
 
 from flask_wtf import FlaskForm
-from wtforms import StringField, SubmitField, IntegerField, SelectField   
-from wtforms.validators import DataRequired, ValidationError
-from ..models import Teacher, Department
+from flask_wtf.file import FileAllowed, FileField, FileRequired
+from wtforms import StringField, SubmitField, IntegerField, SelectField, SelectMultipleField, HiddenField
+from wtforms.validators import DataRequired, NumberRange, Optional, ValidationError
+from ..reference import SPECIALITIES, reference_data
 
 class CourseForm(FlaskForm):
     '''
@@ -12,32 +13,50 @@ class CourseForm(FlaskForm):
 
     name = StringField('Name', validators=[DataRequired()])
     credits = IntegerField('Credits', validators=[DataRequired()])
-    teacher_id = IntegerField('Teacher ID', validators=[DataRequired()])
+    teacher_id = SelectField('Teacher', coerce=int, validate_choice=False, validators=[DataRequired()])
+    capacity = IntegerField('Capacity (blank for unlimited)', validators=[Optional(), NumberRange(min=0)])
     submit = SubmitField('Submit')
 
+    # Seats already taken in the course being edited.
+    seats_taken = 0
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.teacher_id.choices = reference_data.teacher_choices()
+
     def validate_teacher_id(self, field):
         '''
         Check if the teacher_id exists in the Teacher table.
         '''
 
-        teacher = Teacher.query.get(field.data)
-        if not teacher:
+        if not reference_data.has_teacher(field.data):
             raise ValidationError('Invalid Teacher ID!')
 
+    def validate_capacity(self, field):
+        '''
+        Check the capacity still fits the students already enrolled.
+        '''
+
+        if field.data is not None and field.data < self.seats_taken:
+            raise ValidationError(f'{self.seats_taken} students are already enrolled!')
+
 class StudentForm(FlaskForm):
     '''
     Form for admin to edit a student.
     '''
 
-    department_id = IntegerField('Department ID', validators=[DataRequired()])
+    department_id = SelectField('Department', coerce=int, validate_choice=False, validators=[DataRequired()])
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.department_id.choices = reference_data.department_choices()
 
     def validate_department_id(self, field):
         '''
         Check if the department_id exists in the Department table.
         '''
 
-        department = Department.query.get(field.data)
-        if not department:
+        if not reference_data.has_department(field.data):
             raise ValidationError('Invalid Department ID!')
         
 class TeacherForm(FlaskForm):
@@ -45,16 +64,14 @@ class TeacherForm(FlaskForm):
     Form for admin to edit a teacher.
     '''
 
-    speciality_choices = ['CS', 'NS', 'AI', 'EE', 'MG', 'MT']
-
     speciality = SelectField(
         'Speciality', 
-        choices=[('CS', 'CS'), ('NS', 'NS'), ('AI', 'AI'), ('EE', 'EE'), ('MG', 'MG'), ('MT', 'MT')],
+        choices=[(speciality, speciality) for speciality in SPECIALITIES],
         validators=[DataRequired()])
     submit = SubmitField('Submit')
 
-    def validate_specialifty(self, field):
-        if field.data not in self.speciality_choices:
+    def validate_speciality(self, field):
+        if field.data not in SPECIALITIES:
             raise ValidationError('Invalid speciality!')
         
 class VerifyUserForm(FlaskForm):
@@ -63,4 +80,43 @@ class VerifyUserForm(FlaskForm):
     '''
     
     submit = SubmitField('Verify User')
-        
\ No newline at end of file
+
+class DropForm(FlaskForm):
+    '''
+    Form for admin to drop a student from a course.
+    '''
+
+    submit = SubmitField('Drop')
+
+class JobForm(FlaskForm):
+    '''
+    Form for admin to start or cancel a background job.
+    '''
+
+    submit = SubmitField('Start')
+
+class BulkVerifyForm(FlaskForm):
+    '''
+    Form for admin to verify many users at once, either the selected ones
+    or every pending user matching the current filters.
+    '''
+
+    user_ids = SelectMultipleField('Users', coerce=int, validate_choice=False)
+    role = HiddenField('Role')
+    email_domain = HiddenField('Email Domain')
+    verify_selected = SubmitField('Verify Selected')
+    verify_all = SubmitField('Verify All Matching')
+
+class ImportForm(FlaskForm):
+    '''
+    Form for admin to bulk import records from a file.
+    '''
+
+    kind = SelectField(
+        'Import',
+        choices=[('students', 'Students'), ('teachers', 'Teachers'), ('users', 'Users'), ('enrollments', 'Enrollments')],
+        validators=[DataRequired()])
+    file = FileField(
+        'File (CSV, JSON Lines or JSON)',
+        validators=[FileRequired(), FileAllowed(['csv', 'json', 'jsonl'], 'CSV or JSON files only!')])
+    submit = SubmitField('Import')
@@ -1,12 +1,22 @@
 # app/admin/views.py
 
-from flask import abort, flash, redirect, render_template, url_for
+from flask import Response, abort, flash, jsonify, redirect, render_template, request, stream_with_context, url_for
 from flask_login import current_user, login_required
+from sqlalchemy import select
 
 from . import admin
-from .forms import CourseForm, StudentForm, TeacherForm,VerifyUserForm
-from .. import db
-from ..models import Course, Student, Teacher, User
+from .forms import BulkVerifyForm, CourseForm, DropForm, ImportForm, JobForm, StudentForm, TeacherForm,VerifyUserForm
+from .. import db, enrollment, exports, fees, grades, jobs, queries, search, timetable, verification
+from ..httpcache import render_listing, table_versions
+from ..identity import identity_cache
+from ..instrumentation import instrumentation
+from ..pool import pool_status
+from ..reference import SPECIALITIES, reference_data
+from ..replica import replica_reads, replica_router
+from ..search import search_index
+from ..tasks import MAINTENANCE
+from ..models import Course, Department, Enrollment, Fee, Student, Teacher, User
+from ..pagination import InvalidCursor
 
 def check_admin():
     '''
@@ -16,10 +26,22 @@ def check_admin():
     if not current_user.is_admin:
         abort(403)
 
+def listing_args():
+    '''
+    Read the sort, order and cursor arguments shared by every listing.
+    '''
+
+    return {
+        'sort': request.args.get('sort'),
+        'descending': request.args.get('order') == 'desc',
+        'cursor': request.args.get('cursor')
+    }
+
 # Course Views.
 
 @admin.route('/courses', methods=['GET', 'POST'])
 @login_required
+@replica_reads
 def list_courses():
     '''
     List all courses.
@@ -27,9 +49,24 @@ def list_courses():
 
     check_admin()
 
-    courses = Course.query.all()
-
-    return render_template('admin/courses/courses.html', courses=courses, title="Courses")
+    def load():
+        try:
+            page = queries.list_courses(
+                teacher_id=request.args.get('teacher', type=int),
+                credits=request.args.get('credits', type=int),
+                **listing_args()
+            )
+        except InvalidCursor:
+            abort(400)
+        return {'courses': page.items, 'page': page}
+
+    return render_listing(
+        (Course, Teacher, User, Enrollment),
+        'admin/courses/courses.html',
+        'admin/courses/table.html',
+        load,
+        title="Courses"
+    )
 
 @admin.route('/courses/add', methods=['GET', 'POST'])
 @login_required
@@ -47,7 +84,8 @@ def add_course():
         course = Course(
             course_name=form.name.data,
             credits=form.credits.data,
-            teacher_id=form.teacher_id.data
+            teacher_id=form.teacher_id.data,
+            capacity=form.capacity.data
         )
 
         try:
@@ -78,12 +116,17 @@ def edit_course(id):
 
     course = Course.query.get_or_404(id)
     form = CourseForm(obj=course)
+    form.seats_taken = course.seats_taken
     if form.validate_on_submit():
         course.course_name = form.name.data
         course.credits = form.credits.data
         course.teacher_id = form.teacher_id.data
+        course.capacity = form.capacity.data
         
         db.session.commit()
+
+        # Hand any newly freed seats to waitlisted students.
+        enrollment.fill_from_waitlist(id)
         flash('You have successfully edited the course.')
 
         # REdirect to the courses page.
@@ -92,6 +135,7 @@ def edit_course(id):
     form.name.data = course.course_name
     form.credits.data = course.credits
     form.teacher_id.data = course.teacher_id
+    form.capacity.data = course.capacity
 
     return render_template(
         'admin/courses/course.html', 
@@ -111,13 +155,16 @@ def delete_course(id):
 
     check_admin()
 
-    course = Course.query.get_or_404(id)
-    db.session.delete(course)
-    db.session.commit()
-    flash('You have successfully deleted the course.')
+    course = db.session.get(Course, id)
+    if course is None:
+        abort(404)
+
+    # Cascading deletes can take a while; hand them to the job workers.
+    job_id = jobs.enqueue('delete_course', f'Delete course {course.course_name}', {'course_id': id}, user_id=current_user.id)
+    flash('The course is being deleted in the background.')
 
-    # Redirect to the courses page.
-    return redirect(url_for('admin.list_courses'))
+    # Redirect to the job's page.
+    return redirect(url_for('admin.view_job', id=job_id))
 
     return render_template(title="Delete Course")
 
@@ -125,6 +172,7 @@ def delete_course(id):
 
 @admin.route('/students', methods=['GET', 'POST'])
 @login_required
+@replica_reads
 def list_students():
     '''
     List all students.
@@ -132,9 +180,24 @@ def list_students():
 
     check_admin()
 
-    students = Student.query.all()
-
-    return render_template('admin/students/students.html', students=students, title="Students")
+    def load():
+        try:
+            page = queries.list_students(
+                department_id=request.args.get('department', type=int),
+                **listing_args()
+            )
+        except InvalidCursor:
+            abort(400)
+        return {'students': page.items, 'page': page}
+
+    return render_listing(
+        (Student, User, Department, Enrollment, Fee),
+        'admin/students/students.html',
+        'admin/students/table.html',
+        load,
+        departments=reference_data.departments(),
+        title="Students"
+    )
 
 @admin.route('/students/edit/<int:id>', methods=['GET', 'POST'])
 @login_required
@@ -160,7 +223,9 @@ def edit_student(id):
         'admin/students/student.html', 
         action="Edit",
         form=form,
+        drop_form=DropForm(),
         student=student,
+        course_names=reference_data.course_names(),
         title="Edit Student"
     )
 
@@ -173,21 +238,50 @@ def delete_student(id):
 
     check_admin()
 
-    student = Student.query.get_or_404(id)
-    db.session.delete(student)
-    db.session.commit()
-    flash('You have successfully deleted the student.')
+    name = db.session.execute(
+        select(User.first_name, User.last_name).join(Student, Student.user_id == User.id).where(Student.roll_no == id)
+    ).first()
+    if name is None:
+        abort(404)
 
-    # Redirect to the students page.
-    return redirect(url_for('admin.list_students'))
+    job_id = jobs.enqueue(
+        'delete_student', f'Delete student {name.first_name} {name.last_name}', {'roll_no': id}, user_id=current_user.id
+    )
+    flash('The student is being deleted in the background.')
+
+    # Redirect to the job's page.
+    return redirect(url_for('admin.view_job', id=job_id))
 
     return render_template(title="Delete Student")
 
+@admin.route('/students/<int:id>/drop/<int:course_id>', methods=['POST'])
+@login_required
+def drop_enrollment(id, course_id):
+    '''
+    Drop a student from a course or its waitlist.
+    '''
+
+    check_admin()
+
+    form = DropForm()
+    if not form.validate_on_submit():
+        abort(400)
+
+    try:
+        enrollment.drop(id, course_id)
+    except enrollment.EnrollmentError:
+        abort(404)
+    flash('You have successfully dropped the course.')
+
+    # Redirect to the student's page.
+    return redirect(url_for('admin.edit_student', id=id))
+
 
 # Teacher Views.
 
 @admin.route('/teachers', methods=['GET', 'POST'])
 @login_required
+@replica_reads
 def list_teachers():
     '''
     List all teachers.
@@ -195,9 +289,24 @@ def list_teachers():
 
     check_admin()
 
-    teachers = Teacher.query.all()
-
-    return render_template('admin/teachers/teachers.html', teachers=teachers, title="Teachers")
+    def load():
+        try:
+            page = queries.list_teachers(
+                speciality=request.args.get('speciality') or None,
+                **listing_args()
+            )
+        except InvalidCursor:
+            abort(400)
+        return {'teachers': page.items, 'page': page}
+
+    return render_listing(
+        (Teacher, User, Course),
+        'admin/teachers/teachers.html',
+        'admin/teachers/table.html',
+        load,
+        specialities=SPECIALITIES,
+        title="Teachers"
+    )
 
 @admin.route('/teachers/edit/<int:id>', methods=['GET', 'POST'])
 @login_required
@@ -250,6 +359,7 @@ def delete_teacher(id):
 
 @admin.route('/unverified_users', methods=['GET', 'POST'])
 @login_required
+@replica_reads
 def list_unverified_users():
     '''
     List all unverified users.
@@ -257,15 +367,60 @@ def list_unverified_users():
 
     check_admin()
 
-    # Fetch all unverified users.
-    unverified_users = User.query.filter_by(status=False).all()
+    # Fetch a page of users, unverified ones unless asked otherwise.
+    status = {'unverified': False, 'verified': True, 'all': None}.get(request.args.get('status'), False)
+    role = request.args.get('role') or None
+    email_domain = request.args.get('domain') or None
+    try:
+        page = queries.list_users(
+            status=status,
+            role=role,
+            email_domain=email_domain,
+            **listing_args()
+        )
+    except InvalidCursor:
+        abort(400)
+
+    form = BulkVerifyForm(role=role, email_domain=email_domain)
+    pending = verification.count_pending(role=role, email_domain=email_domain)
     
     return render_template(
         'admin/user_verification/unverified_users.html', 
-        unverified_users=unverified_users,
+        unverified_users=page.items,
+        page=page,
+        form=form,
+        pending=pending,
         title="Unverified Users"
     )
 
+@admin.route('/unverified_users/verify', methods=['POST'])
+@login_required
+def verify_users():
+    '''
+    Verify the selected users, or every pending user matching the
+    filters, with a single UPDATE.
+    '''
+
+    check_admin()
+
+    form = BulkVerifyForm()
+    if form.validate_on_submit():
+        role = form.role.data or None
+        email_domain = form.email_domain.data or None
+
+        if form.verify_all.data:
+            verified = verification.verify_users(role=role, email_domain=email_domain)
+        else:
+            verified = verification.verify_users(user_ids=form.user_ids.data or [])
+
+        remaining = verification.count_pending(role=role, email_domain=email_domain)
+        flash(f'{verified} users successfully verified, {remaining} still pending.')
+
+        # Redirect to unverified users page, keeping the filters.
+        return redirect(url_for('admin.list_unverified_users', role=role, domain=email_domain))
+
+    abort(400)
+
 @admin.route('/unverified_users/verify_user/<int:id>', methods=['GET', 'POST'])
 @login_required
 def verify_user(id):
@@ -291,3 +446,302 @@ def verify_user(id):
         user=user,
         title="Verify User"
     )
+
+# Import Views.
+
+@admin.route('/import', methods=['GET', 'POST'])
+@login_required
+def import_data():
+    '''
+    Bulk import records from an uploaded file.
+    '''
+
+    check_admin()
+
+    form = ImportForm()
+    if form.validate_on_submit():
+        upload = form.file.data
+        job_id = jobs.enqueue(
+            'import_data',
+            f'Import {form.kind.data} from {upload.filename}',
+            {'kind': form.kind.data},
+            payload=upload.read(),
+            user_id=current_user.id
+        )
+        flash('The file is being imported in the background.')
+        return redirect(url_for('admin.view_job', id=job_id))
+
+    return render_template(
+        'admin/import/import.html',
+        form=form,
+        export_kinds=exports.KINDS,
+        title="Import"
+    )
+
+# Export Views.
+
+@admin.route('/export/<kind>.<fmt>')
+@login_required
+@replica_reads
+def export_data(kind, fmt):
+    '''
+    Stream a full export of students, courses, enrollments or fees.
+    '''
+
+    check_admin()
+
+    if kind not in exports.KINDS or fmt not in exports.FORMATS:
+        abort(404)
+
+    chunks = stream_with_context(exports.GENERATORS[fmt](kind))
+    return Response(
+        chunks,
+        mimetype=exports.MIMETYPES[fmt],
+        headers={'Content-Disposition': f'attachment; filename={kind}.{fmt}'}
+    )
+
+# Fee Views.
+
+@admin.route('/fees')
+@login_required
+@replica_reads
+def fee_report():
+    '''
+    Show fee totals per department, term, student and course with
+    aging of outstanding fees.
+    '''
+
+    check_admin()
+
+    term = request.args.get('term') or None
+    by_term = fees.by_term()
+
+    return render_template(
+        'admin/fees/fees.html',
+        term=term,
+        terms=[row.term for row in by_term],
+        totals=fees.totals(term),
+        by_term=by_term,
+        by_department=fees.by_department(term),
+        students=fees.top_outstanding('student', term),
+        courses=fees.top_outstanding('course', term),
+        aging=fees.aging(term=term),
+        title="Fees"
+    )
+
+# Ranking Views.
+
+@admin.route('/rankings')
+@login_required
+@replica_reads
+def rankings():
+    '''
+    Rank students by CGPA from the precomputed GPA summary.
+    '''
+
+    check_admin()
+
+    try:
+        page, rows = grades.ranking(cursor=request.args.get('cursor'))
+    except InvalidCursor:
+        abort(400)
+
+    return render_template('admin/rankings/rankings.html', page=page, rows=rows, title="Rankings")
+
+# Timetable Views.
+
+@admin.route('/timetable')
+@login_required
+@replica_reads
+def list_sections():
+    '''
+    List the scheduled sections in weekly order, optionally for one
+    course. Sections without a slot are listed last.
+    '''
+
+    check_admin()
+
+    course_id = request.args.get('course', type=int)
+    return render_template(
+        'admin/timetable/timetable.html',
+        sections=timetable.sections(course_id),
+        days=timetable.DAYS,
+        clock=timetable.clock,
+        course_id=course_id,
+        title="Timetable"
+    )
+
+# Job Views.
+
+@admin.route('/jobs')
+@login_required
+def list_jobs():
+    '''
+    List background jobs, newest first, with buttons to start the
+    maintenance jobs.
+    '''
+
+    check_admin()
+
+    try:
+        page, rows = jobs.recent(cursor=request.args.get('cursor'))
+    except InvalidCursor:
+        abort(400)
+
+    return render_template(
+        'admin/jobs/jobs.html',
+        page=page,
+        rows=rows,
+        maintenance=MAINTENANCE,
+        form=JobForm(),
+        title="Jobs"
+    )
+
+@admin.route('/jobs/start/<kind>', methods=['POST'])
+@login_required
+def start_job(kind):
+    '''
+    Queue one of the maintenance jobs.
+    '''
+
+    check_admin()
+
+    if kind not in MAINTENANCE:
+        abort(404)
+    if not JobForm().validate_on_submit():
+        abort(400)
+
+    job_id = jobs.enqueue(kind, MAINTENANCE[kind], user_id=current_user.id)
+    return redirect(url_for('admin.view_job', id=job_id))
+
+@admin.route('/jobs/<int:id>')
+@login_required
+def view_job(id):
+    '''
+    Show a job's progress and outcome. The page polls the same URL for
+    JSON until the job finishes.
+    '''
+
+    check_admin()
+
+    job = jobs.get(id)
+    if job is None:
+        abort(404)
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify(job)
+
+    return render_template('admin/jobs/job.html', job=job, form=JobForm(), title="Job")
+
+@admin.route('/jobs/<int:id>/cancel', methods=['POST'])
+@login_required
+def cancel_job(id):
+    '''
+    Cancel a queued job, or ask a running one to stop.
+    '''
+
+    check_admin()
+
+    if not JobForm().validate_on_submit():
+        abort(400)
+
+    if jobs.cancel(id):
+        flash('The job has been cancelled.')
+    else:
+        flash('The job has already finished.')
+    return redirect(url_for('admin.view_job', id=id))
+
+# Search Views.
+
+def search_result(kind, doc):
+    '''
+    Describe a search hit for the results page and autocomplete.
+    '''
+
+    result = {'kind': kind, 'id': doc.id, 'label': doc.label}
+    if kind == search.COURSES:
+        result['detail'] = doc.fields['instructor'] or 'No instructor'
+        result['url'] = url_for('admin.edit_course', id=doc.id)
+        return result
+
+    fields = doc.fields
+    result['detail'] = f"{fields['role']} - {fields['email']}"
+    if not fields['status']:
+        result['url'] = url_for('admin.verify_user', id=doc.id)
+    elif fields['roll_no'] is not None:
+        result['detail'] += f" - Roll No {fields['roll_no']}"
+        result['url'] = url_for('admin.edit_student', id=fields['roll_no'])
+    elif fields['teacher_id'] is not None:
+        result['url'] = url_for('admin.edit_teacher', id=fields['teacher_id'])
+    else:
+        result['url'] = None
+    return result
+
+@admin.route('/search')
+@login_required
+def search_page():
+    '''
+    Search people by name, email, username, contact or roll number and
+    courses by name or instructor.
+    '''
+
+    check_admin()
+
+    query = request.args.get('q', '').strip()
+    results = {
+        kind: [search_result(kind, doc) for doc in search_index.search(kind, query, limit=50)] if query else []
+        for kind in search.KINDS
+    }
+
+    return render_template(
+        'admin/search/search.html',
+        query=query,
+        people=results[search.PEOPLE],
+        courses=results[search.COURSES],
+        title="Search"
+    )
+
+@admin.route('/search/autocomplete')
+@login_required
+def autocomplete():
+    '''
+    Suggest people and courses matching a partial query, as JSON.
+    Pass kind=people or kind=courses to search only one of them.
+    '''
+
+    check_admin()
+
+    query = request.args.get('q', '').strip()
+    kind = request.args.get('kind')
+    kinds = [kind] if kind in search.KINDS else search.KINDS
+
+    return jsonify([
+        search_result(kind, doc)
+        for kind in kinds
+        for doc in (search_index.search(kind, query) if query else [])
+    ])
+
+# Instrumentation Views.
+
+@admin.route('/_perf')
+@login_required
+def perf():
+    '''
+    Show SQL activity of recent requests and per-endpoint averages.
+    '''
+
+    check_admin()
+
+    return render_template(
+        'admin/perf/perf.html',
+        enabled=instrumentation.enabled,
+        endpoints=instrumentation.endpoint_summary(),
+        recent=list(instrumentation.recent),
+        threshold=instrumentation.threshold,
+        identity_cache=identity_cache.stats(),
+        reference_data=reference_data.stats(),
+        search_index=search_index.stats(),
+        http_cache=table_versions.stats(),
+        pools=pool_status(db.engines),
+        replica=replica_router.stats(),
+        title="Performance"
+    )
@@ -0,0 +1,266 @@
+# app/api/resources.py
+
+import datetime
+
+from sqlalchemy import select
+from sqlalchemy.orm import aliased
+
+from ..models import Course, Department, Enrollment, Fee, Student, Teacher, User
+from ..reference import SPECIALITIES, reference_data
+
+# Oracle accepts at most 1000 expressions in an IN list.
+IN_CHUNK = 1000
+
+class RowError(Exception):
+    '''
+    Raised when a row sent to an upsert endpoint is invalid.
+    '''
+
+class Join(object):
+    '''
+    An outer join a field needs, added to a query only when one of the
+    requested fields uses it.
+    '''
+
+    def __init__(self, target, onclause, requires=None):
+        self.target = target
+        self.onclause = onclause
+        self.requires = requires
+
+class Writable(object):
+    '''
+    A column clients may set, with an optional extra check returning an
+    error message for invalid values.
+    '''
+
+    def __init__(self, attribute, check=None):
+        column = attribute.property.columns[0]
+        self.column = column
+        self.check = check
+        self.nullable = column.nullable
+        self.required = not column.nullable and column.default is None and column.server_default is None
+
+    def parse(self, name, value):
+        if value is None:
+            if not self.nullable:
+                raise RowError(f'{name} may not be null.')
+            return None
+
+        kind = self.column.type.python_type
+        if kind is int and (isinstance(value, bool) or not isinstance(value, int)):
+            raise RowError(f'{name} must be an integer.')
+        if kind is float:
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                raise RowError(f'{name} must be a number.')
+            value = float(value)
+        if kind is bool and not isinstance(value, bool):
+            raise RowError(f'{name} must be true or false.')
+        if kind is str:
+            if not isinstance(value, str):
+                raise RowError(f'{name} must be a string.')
+            if self.column.type.length and len(value) > self.column.type.length:
+                raise RowError(f'{name} must be at most {self.column.type.length} characters.')
+        if kind is datetime.date:
+            try:
+                value = datetime.date.fromisoformat(value)
+            except (TypeError, ValueError):
+                raise RowError(f'{name} must be a YYYY-MM-DD date.')
+
+        if self.check is not None:
+            message = self.check(value)
+            if message:
+                raise RowError(f'{name}: {message}')
+        return value
+
+class Resource(object):
+    '''
+    A collection exposed by the API: the columns it can return, the
+    equality filters it accepts and the columns clients may write.
+    Reads select plain columns, so rows are serialised without building
+    ORM objects.
+    '''
+
+    def __init__(self, name, model, key, fields, joins=None, filters=(), writable=None, insertable=False):
+        self.name = name
+        self.model = model
+        self.key = key
+        self.key_name = key.key
+        self.fields = fields
+        self.joins = joins or {}
+        self.filters = {name: fields[name] for name in filters}
+        self.writable = writable or {}
+        self.insertable = insertable
+
+    def select(self, names):
+        '''
+        Select the key and the named fields, joining only the tables
+        those fields need.
+        '''
+
+        columns, needed = [], set()
+        for name in names:
+            column, join = self.fields[name]
+            columns.append(column.label(name))
+            while join is not None:
+                needed.add(join)
+                join = self.joins[join].requires
+
+        stmt = select(*columns).select_from(self.model)
+        # Joins are declared after the joins they require.
+        for name, join in self.joins.items():
+            if name in needed:
+                stmt = stmt.outerjoin(join.target, join.onclause)
+        return stmt
+
+    def parse(self, row):
+        '''
+        Validate a row sent for upsert. Returns (key, values); key is
+        None for rows to insert.
+        '''
+
+        if not isinstance(row, dict):
+            raise RowError('Each row must be an object.')
+
+        unknown = set(row) - set(self.writable) - {self.key_name}
+        if unknown:
+            raise RowError(f'Unknown or read-only fields: {", ".join(sorted(unknown))}.')
+
+        key = row.get(self.key_name)
+        if key is not None and (isinstance(key, bool) or not isinstance(key, int)):
+            raise RowError(f'{self.key_name} must be an integer.')
+        if key is None:
+            if not self.insertable:
+                raise RowError(f'{self.key_name} is required; {self.name} are created through the importer.')
+            missing = [name for name, field in self.writable.items() if field.required and name not in row]
+            if missing:
+                raise RowError(f'Missing {", ".join(missing)}.')
+
+        values = {name: self.writable[name].parse(name, value) for name, value in row.items() if name != self.key_name}
+        return key, values
+
+def _choice(choices):
+    def check(value):
+        if value not in choices:
+            return f'must be one of {", ".join(str(choice) for choice in choices)}.'
+    return check
+
+def _at_least(minimum):
+    def check(value):
+        if value < minimum:
+            return f'must be at least {minimum}.'
+    return check
+
+def _department(dep_id):
+    if not reference_data.has_department(dep_id):
+        return 'no such department.'
+
+def _teacher(teacher_id):
+    if not reference_data.has_teacher(teacher_id):
+        return 'no such teacher.'
+
+def _resources():
+    instructor = aliased(User)
+
+    user_columns = ('email', 'username', 'first_name', 'last_name', 'contact', 'address')
+    users = Resource(
+        'users', User, User.id,
+        fields=dict(
+            {'id': (User.id, None)},
+            **{name: (getattr(User, name), None) for name in user_columns + ('role', 'is_admin', 'status')}
+        ),
+        filters=('role', 'status', 'is_admin'),
+        writable=dict(
+            {name: Writable(getattr(User, name)) for name in user_columns},
+            status=Writable(User.status)
+        )
+    )
+
+    students = Resource(
+        'students', Student, Student.roll_no,
+        fields=dict(
+            {
+                'roll_no': (Student.roll_no, None),
+                'user_id': (Student.user_id, None),
+                'department_id': (Student.department_id, None),
+                'department': (Department.dep_name, 'department')
+            },
+            **{name: (getattr(User, name), 'user') for name in ('first_name', 'last_name', 'email', 'contact', 'status')}
+        ),
+        joins={
+            'user': Join(User, Student.user_id == User.id),
+            'department': Join(Department, Student.department_id == Department.dep_id)
+        },
+        filters=('department_id', 'user_id'),
+        writable={'department_id': Writable(Student.department_id, _department)}
+    )
+
+    teachers = Resource(
+        'teachers', Teacher, Teacher.teacher_id,
+        fields=dict(
+            {
+                'teacher_id': (Teacher.teacher_id, None),
+                'user_id': (Teacher.user_id, None),
+                'speciality': (Teacher.speciality, None)
+            },
+            **{name: (getattr(User, name), 'user') for name in ('first_name', 'last_name', 'email', 'contact')}
+        ),
+        joins={'user': Join(User, Teacher.user_id == User.id)},
+        filters=('speciality', 'user_id'),
+        writable={'speciality': Writable(Teacher.speciality, _choice(SPECIALITIES))}
+    )
+
+    courses = Resource(
+        'courses', Course, Course.course_id,
+        fields={
+            'course_id': (Course.course_id, None),
+            'course_name': (Course.course_name, None),
+            'credits': (Course.credits, None),
+            'teacher_id': (Course.teacher_id, None),
+            'capacity': (Course.capacity, None),
+            'seats_taken': (Course.seats_taken, None),
+            'instructor_first_name': (instructor.first_name, 'instructor'),
+            'instructor_last_name': (instructor.last_name, 'instructor')
+        },
+        joins={
+            'teacher': Join(Teacher, Course.teacher_id == Teacher.teacher_id),
+            'instructor': Join(instructor, Teacher.user_id == instructor.id, requires='teacher')
+        },
+        filters=('teacher_id', 'credits'),
+        writable={
+            'course_name': Writable(Course.course_name),
+            'credits': Writable(Course.credits, _choice((1, 2, 3))),
+            'teacher_id': Writable(Course.teacher_id, _teacher),
+            'capacity': Writable(Course.capacity, _at_least(0))
+        },
+        insertable=True
+    )
+
+    enrollments = Resource(
+        'enrollments', Enrollment, Enrollment.enrollment_id,
+        fields={
+            'enrollment_id': (Enrollment.enrollment_id, None),
+            'student_id': (Enrollment.student_id, None),
+            'course_id': (Enrollment.course_id, None)
+        },
+        filters=('student_id', 'course_id')
+    )
+
+    fees = Resource(
+        'fees', Fee, Fee.fee_id,
+        fields={name: (getattr(Fee, name), None) for name in
+                ('fee_id', 'student_id', 'course_id', 'amount', 'fee_status', 'term', 'due_date')},
+        filters=('student_id', 'course_id', 'fee_status', 'term'),
+        writable={
+            'student_id': Writable(Fee.student_id),
+            'course_id': Writable(Fee.course_id),
+            'amount': Writable(Fee.amount, _at_least(0)),
+            'fee_status': Writable(Fee.fee_status, _choice(('Paid', 'Pending'))),
+            'term': Writable(Fee.term),
+            'due_date': Writable(Fee.due_date)
+        },
+        insertable=True
+    )
+
+    return {resource.name: resource for resource in (users, students, teachers, courses, enrollments, fees)}
+
+RESOURCES = _resources()
@@ -0,0 +1,265 @@
+# app/api/views.py
+
+import datetime
+import functools
+
+from flask import abort, current_app, jsonify, request
+from flask_login import current_user
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from werkzeug.exceptions import HTTPException
+
+from . import api
+from .resources import IN_CHUNK, RESOURCES, RowError
+from .. import db, enrollment
+from ..pagination import InvalidCursor, paginate
+from ..replica import replica_reads
+
+def api_admin_required(view):
+    '''
+    Require an admin, signed in or identified by an API key.
+    '''
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if not current_user.is_authenticated:
+            abort(401)
+        if not current_user.is_admin:
+            abort(403)
+        return view(*args, **kwargs)
+
+    return wrapper
+
+@api.errorhandler(HTTPException)
+def http_error(e):
+    return jsonify(error=e.description), e.code
+
+def get_resource(name):
+    resource = RESOURCES.get(name)
+    if resource is None:
+        abort(404, f'Unknown resource: {name}')
+    return resource
+
+def requested_fields(resource, fields):
+    '''
+    Parse a sparse fieldset, given as a comma separated string or a
+    list. The key is always included.
+    '''
+
+    if not fields:
+        return list(resource.fields)
+    if isinstance(fields, str):
+        fields = [name.strip() for name in fields.split(',') if name.strip()]
+
+    unknown = [name for name in fields if name not in resource.fields]
+    if unknown:
+        abort(400, f'Unknown fields: {", ".join(unknown)}')
+    return [resource.key_name] + [name for name in fields if name != resource.key_name]
+
+def serialise(names, rows):
+    '''
+    Turn plain result rows into dicts, with dates in ISO format.
+    '''
+
+    items = []
+    for row in rows:
+        item = dict(zip(names, row))
+        for name, value in item.items():
+            if isinstance(value, datetime.date):
+                item[name] = value.isoformat()
+        items.append(item)
+    return items
+
+def parse_filter(resource, name, raw):
+    column, _ = resource.filters[name]
+    kind = column.type.python_type
+    if kind is bool:
+        if raw not in ('true', 'false'):
+            abort(400, f'{name} must be true or false.')
+        return raw == 'true'
+    if kind is int:
+        try:
+            return int(raw)
+        except ValueError:
+            abort(400, f'{name} must be an integer.')
+    return raw
+
+def json_body():
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        abort(400, 'Expected a JSON object body.')
+    return body
+
+@api.route('/<name>')
+@api_admin_required
+@replica_reads
+def list_items(name):
+    '''
+    Return a page of a resource in key order. Pass the returned next
+    cursor as ?cursor= to get the following page.
+    '''
+
+    resource = get_resource(name)
+    fields = requested_fields(resource, request.args.get('fields'))
+    config = current_app.config
+    limit = request.args.get('limit', config['API_PAGE_SIZE'], type=int)
+    if not 1 <= limit <= config['API_MAX_PAGE_SIZE']:
+        abort(400, f'limit must be between 1 and {config["API_MAX_PAGE_SIZE"]}.')
+
+    stmt = resource.select(fields)
+    for filter_name in resource.filters:
+        raw = request.args.get(filter_name)
+        if raw is not None:
+            column, _ = resource.filters[filter_name]
+            stmt = stmt.where(column == parse_filter(resource, filter_name, raw))
+
+    try:
+        page = paginate(stmt, resource.key, resource.key, request.args.get('cursor'), limit)
+    except InvalidCursor:
+        abort(400, 'Invalid cursor.')
+
+    rows = page.items if len(fields) > 1 else [(item,) for item in page.items]
+    return jsonify(data=serialise(fields, rows), next=page.next_cursor)
+
+@api.route('/<name>/<int:id>')
+@api_admin_required
+@replica_reads
+def get_item(name, id):
+    resource = get_resource(name)
+    fields = requested_fields(resource, request.args.get('fields'))
+
+    row = db.session.execute(resource.select(fields).where(resource.key == id)).first()
+    if row is None:
+        abort(404, f'No {name} with {resource.key_name} {id}.')
+    return jsonify(data=serialise(fields, [row])[0])
+
+@api.route('/<name>/fetch', methods=['POST'])
+@api_admin_required
+def fetch_items(name):
+    '''
+    Return many records by key: {"ids": [...], "fields": [...]}. Keys
+    are looked up in IN lists of up to 1000, and keys that do not exist
+    are listed under "missing".
+    '''
+
+    resource = get_resource(name)
+    body = json_body()
+    fields = requested_fields(resource, body.get('fields'))
+
+    ids = body.get('ids')
+    if not isinstance(ids, list) or not all(isinstance(ident, int) and not isinstance(ident, bool) for ident in ids):
+        abort(400, 'ids must be a list of integers.')
+    if len(ids) > current_app.config['API_MAX_BATCH']:
+        abort(400, f'At most {current_app.config["API_MAX_BATCH"]} ids per request.')
+
+    ids = list(dict.fromkeys(ids))
+    found = {}
+    for start in range(0, len(ids), IN_CHUNK):
+        chunk = ids[start:start + IN_CHUNK]
+        for row in db.session.execute(resource.select(fields).where(resource.key.in_(chunk))):
+            found[row[0]] = row
+
+    return jsonify(
+        data=serialise(fields, [found[ident] for ident in ids if ident in found]),
+        missing=[ident for ident in ids if ident not in found]
+    )
+
+@api.route('/<name>/upsert', methods=['POST'])
+@api_admin_required
+def upsert_items(name):
+    '''
+    Create or update many records in one transaction: {"rows": [...]}.
+    Rows carrying the key update that record; others create one. Every
+    row is validated first and nothing is written unless all are valid.
+    Writes go through the ORM, so the fee summary, dashboard counters
+    and caches stay current. Enrollment rows ({"student_id", "course_id"})
+    enroll or waitlist the student and are safe to repeat.
+    '''
+
+    resource = get_resource(name)
+    rows = json_body().get('rows')
+    if not isinstance(rows, list) or not rows:
+        abort(400, 'rows must be a non-empty list.')
+    if len(rows) > current_app.config['API_MAX_BATCH']:
+        abort(400, f'At most {current_app.config["API_MAX_BATCH"]} rows per request.')
+
+    if name == 'enrollments':
+        return enroll_rows(rows)
+
+    parsed, errors = [], []
+    for index, row in enumerate(rows):
+        try:
+            parsed.append(resource.parse(row))
+        except RowError as e:
+            errors.append({'index': index, 'error': str(e)})
+
+    if errors:
+        return jsonify(errors=errors), 422
+
+    # Load every record to update with one query per 1000 keys.
+    keys = [key for key, _ in parsed if key is not None]
+    existing = {}
+    for start in range(0, len(keys), IN_CHUNK):
+        stmt = select(resource.model).where(resource.key.in_(keys[start:start + IN_CHUNK]))
+        for instance in db.session.execute(stmt).scalars():
+            existing[getattr(instance, resource.key_name)] = instance
+
+    errors = [
+        {'index': index, 'error': f'No {name} with {resource.key_name} {key}.'}
+        for index, (key, _) in enumerate(parsed) if key is not None and key not in existing
+    ]
+    if errors:
+        db.session.rollback()
+        return jsonify(errors=errors), 422
+
+    instances, created, capacity_changed = [], 0, []
+    for key, values in parsed:
+        if key is None:
+            instance = resource.model(**values)
+            db.session.add(instance)
+            created += 1
+        else:
+            instance = existing[key]
+            if 'capacity' in values and values['capacity'] != getattr(instance, 'capacity'):
+                capacity_changed.append(key)
+            for field, value in values.items():
+                setattr(instance, field, value)
+        instances.append(instance)
+
+    try:
+        db.session.flush()
+        ids = [getattr(instance, resource.key_name) for instance in instances]
+        db.session.commit()
+    except IntegrityError as e:
+        db.session.rollback()
+        abort(409, f'Rejected by the database: {e.orig}')
+
+    # Hand any newly freed seats to waitlisted students.
+    for course_id in dict.fromkeys(capacity_changed):
+        enrollment.fill_from_waitlist(course_id)
+
+    return jsonify(ids=ids, created=created, updated=len(ids) - created)
+
+def enroll_rows(rows):
+    '''
+    Enroll each (student_id, course_id) row, one transaction per row as
+    in the enrollment views. Returns the status of each row, or the
+    reason it failed.
+    '''
+
+    pairs, errors = [], []
+    for index, row in enumerate(rows):
+        pair = (row.get('student_id'), row.get('course_id')) if isinstance(row, dict) else (None, None)
+        if not all(isinstance(value, int) and not isinstance(value, bool) for value in pair):
+            errors.append({'index': index, 'error': 'student_id and course_id must be integers.'})
+        pairs.append(pair)
+    if errors:
+        return jsonify(errors=errors), 422
+
+    results = []
+    for student_id, course_id in pairs:
+        try:
+            results.append({'status': enrollment.enroll(student_id, course_id)})
+        except enrollment.EnrollmentError as e:
+            results.append({'error': str(e)})
+    return jsonify(results=results)
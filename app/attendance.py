@@ -0,0 +1,294 @@
+# app/attendance.py
+
+from flask import current_app
+from sqlalchemy import and_, bindparam, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from . import db
+from .fees import NO_TERM
+from .models import Attendance, AttendanceSession, Course, Enrollment, Student, User
+
+PRESENT = 'P'
+LATE = 'L'
+ABSENT = 'A'
+
+# Each session takes two bits of a bitmap; 0 means not marked.
+CODES = {PRESENT: 1, LATE: 2, ABSENT: 3}
+STATUSES = {code: status for status, code in CODES.items()}
+
+# Attendance rows recounted per query by rebuild.
+REBUILD_BATCH_SIZE = 5000
+
+class AttendanceError(Exception):
+    '''
+    Raised when a course to mark does not exist or a status is invalid.
+    '''
+
+def current_term():
+    return current_app.config.get('CURRENT_TERM') or NO_TERM
+
+def get_mark(marks, session_no):
+    '''
+    Return the status recorded for a session in a bitmap, or None.
+    '''
+
+    index, slot = divmod(session_no, 4)
+    if marks is None or index >= len(marks):
+        return None
+    return STATUSES.get(marks[index] >> slot * 2 & 3)
+
+def set_mark(marks, session_no, status):
+    '''
+    Return a copy of a bitmap with a session's status set, growing it as
+    needed.
+    '''
+
+    index, slot = divmod(session_no, 4)
+    marks = bytearray(marks or b'')
+    if index >= len(marks):
+        marks.extend(bytes(index + 1 - len(marks)))
+    marks[index] = marks[index] & ~(3 << slot * 2) & 0xFF | CODES[status] << slot * 2
+    return bytes(marks)
+
+def tally(marks):
+    '''
+    Count the present, late and absent sessions in a bitmap. The whole
+    bitmap is read as one integer and the low and high bit of every slot
+    are masked out at once, so counting takes a few big-integer
+    operations however many sessions there are.
+    '''
+
+    value = int.from_bytes(marks, 'little')
+    low_bits = int.from_bytes(b'\x55' * len(marks), 'little')
+    low = value & low_bits
+    high = value >> 1 & low_bits
+    return bin(low & ~high).count('1'), bin(high & ~low).count('1'), bin(low & high).count('1')
+
+def percentage(present, late, absent):
+    '''
+    Return the share of marked sessions attended (present or late), or
+    None before any session is marked.
+    '''
+
+    marked = (present or 0) + (late or 0) + (absent or 0)
+    if not marked:
+        return None
+    return round(100.0 * ((present or 0) + (late or 0)) / marked, 1)
+
+def _find_session(course_id, term, held_on):
+    stmt = select(AttendanceSession.session_no).where(
+        AttendanceSession.course_id == course_id,
+        AttendanceSession.term == term,
+        AttendanceSession.held_on == held_on
+    )
+    return db.session.execute(stmt).scalar()
+
+def _open_session(course_id, term, held_on):
+    '''
+    Return the session number of a course's meeting on a date, numbering
+    a new meeting after the term's last one.
+    '''
+
+    for _ in range(3):
+        session_no = _find_session(course_id, term, held_on)
+        if session_no is not None:
+            return session_no
+
+        in_term = and_(AttendanceSession.course_id == course_id, AttendanceSession.term == term)
+        next_no = select(func.coalesce(func.max(AttendanceSession.session_no) + 1, 0)).where(in_term).scalar_subquery()
+        try:
+            with db.session.begin_nested():
+                db.session.execute(
+                    insert(AttendanceSession).values(course_id=course_id, term=term, held_on=held_on, session_no=next_no)
+                )
+        except IntegrityError:
+            # Another request opened a session at the same moment; look again.
+            continue
+    return _find_session(course_id, term, held_on)
+
+def _lock_course_term(course_id, term):
+    '''
+    Take the row lock of the term's first session with a no-op UPDATE,
+    so two requests marking the same course apply their bitmap changes
+    one after the other instead of overwriting each other.
+    '''
+
+    table = AttendanceSession.__table__
+    db.session.execute(
+        update(table)
+        .where(table.c.course_id == course_id, table.c.term == term, table.c.session_no == 0)
+        .values(session_no=table.c.session_no)
+    )
+
+def mark_class(course_id, held_on, statuses, term=None):
+    '''
+    Record a class meeting: statuses maps student ids to PRESENT, LATE or
+    ABSENT. Students left out keep whatever was recorded before, so a
+    register can be corrected by marking it again. Changed rows are
+    written with one executemany UPDATE and one INSERT for students
+    marked for the first time this term, with their counts recomputed
+    from the bitmap. Returns the number of students marked.
+    '''
+
+    term = term or current_term()
+    if db.session.get(Course, course_id) is None:
+        raise AttendanceError('Invalid course ID!')
+    if any(status not in CODES for status in statuses.values()):
+        raise AttendanceError('Invalid attendance status!')
+
+    session_no = _open_session(course_id, term, held_on)
+    _lock_course_term(course_id, term)
+
+    stmt = (
+        select(Enrollment.enrollment_id, Enrollment.student_id, Attendance.marks)
+        .outerjoin(Attendance, and_(Attendance.enrollment_id == Enrollment.enrollment_id, Attendance.term == term))
+        .where(Enrollment.course_id == course_id)
+    )
+    updates, inserts = [], []
+    for enrollment_id, student_id, marks in db.session.execute(stmt):
+        status = statuses.get(student_id)
+        if status is None or get_mark(marks, session_no) == status:
+            continue
+        new_marks = set_mark(marks, session_no, status)
+        present, late, absent = tally(new_marks)
+        row = {'b_enrollment_id': enrollment_id, 'b_term': term, 'b_marks': new_marks,
+               'b_present': present, 'b_late': late, 'b_absent': absent}
+        (inserts if marks is None else updates).append(row)
+
+    table = Attendance.__table__
+    if updates:
+        db.session.execute(
+            update(table)
+            .where(table.c.enrollment_id == bindparam('b_enrollment_id'), table.c.term == bindparam('b_term'))
+            .values(marks=bindparam('b_marks'), present=bindparam('b_present'),
+                    late=bindparam('b_late'), absent=bindparam('b_absent')),
+            updates
+        )
+    if inserts:
+        db.session.execute(
+            insert(table).values(enrollment_id=bindparam('b_enrollment_id'), term=bindparam('b_term'),
+                                 marks=bindparam('b_marks'), present=bindparam('b_present'),
+                                 late=bindparam('b_late'), absent=bindparam('b_absent')),
+            inserts
+        )
+    db.session.commit()
+    return len(updates) + len(inserts)
+
+def roster(course_id, held_on=None, term=None):
+    '''
+    Return a course's students in name order with their attendance
+    counts, percentage and, when held_on is given, their status for that
+    day's session. Reads one attendance row per student.
+    '''
+
+    term = term or current_term()
+    session_no = _find_session(course_id, term, held_on) if held_on else None
+
+    stmt = (
+        select(Enrollment.student_id, User.first_name, User.last_name,
+               Attendance.marks, Attendance.present, Attendance.late, Attendance.absent)
+        .join(Student, Enrollment.student_id == Student.roll_no)
+        .join(User, Student.user_id == User.id)
+        .outerjoin(Attendance, and_(Attendance.enrollment_id == Enrollment.enrollment_id, Attendance.term == term))
+        .where(Enrollment.course_id == course_id)
+        .order_by(User.last_name, User.first_name, Enrollment.student_id)
+    )
+    return [
+        {
+            'student_id': row.student_id,
+            'name': f'{row.first_name} {row.last_name}',
+            'present': row.present or 0,
+            'late': row.late or 0,
+            'absent': row.absent or 0,
+            'percentage': percentage(row.present, row.late, row.absent),
+            'status': get_mark(row.marks, session_no) if session_no is not None else None
+        }
+        for row in db.session.execute(stmt)
+    ]
+
+def class_percentage(students):
+    '''
+    Return a course's overall attendance from its roster rows.
+    '''
+
+    return percentage(*(sum(student[key] for student in students) for key in ('present', 'late', 'absent')))
+
+def sessions(course_id, term=None):
+    '''
+    Return the dates of a course's sessions this term, oldest first.
+    '''
+
+    stmt = (
+        select(AttendanceSession.held_on)
+        .where(AttendanceSession.course_id == course_id, AttendanceSession.term == (term or current_term()))
+        .order_by(AttendanceSession.held_on)
+    )
+    return list(db.session.execute(stmt).scalars())
+
+def student_summary(student_id, term=None):
+    '''
+    Return a student's attendance in each of their courses, from the
+    precomputed counts.
+    '''
+
+    term = term or current_term()
+    stmt = (
+        select(Course.course_id, Course.course_name, Attendance.present, Attendance.late, Attendance.absent)
+        .select_from(Enrollment)
+        .join(Course, Enrollment.course_id == Course.course_id)
+        .outerjoin(Attendance, and_(Attendance.enrollment_id == Enrollment.enrollment_id, Attendance.term == term))
+        .where(Enrollment.student_id == student_id)
+        .order_by(Course.course_name)
+    )
+    return [
+        {
+            'course_id': row.course_id,
+            'course_name': row.course_name,
+            'present': row.present or 0,
+            'late': row.late or 0,
+            'absent': row.absent or 0,
+            'percentage': percentage(row.present, row.late, row.absent)
+        }
+        for row in db.session.execute(stmt)
+    ]
+
+def rebuild(batch_size=REBUILD_BATCH_SIZE, progress=None):
+    '''
+    Recount every attendance row from its bitmap and fix counts that
+    disagree. progress, if given, is called with the number of rows
+    checked after each batch. Returns the number of rows corrected.
+    '''
+
+    table = Attendance.__table__
+    corrected, checked, after = 0, 0, None
+    while True:
+        stmt = select(table).order_by(table.c.enrollment_id, table.c.term).limit(batch_size)
+        if after is not None:
+            stmt = stmt.where(
+                (table.c.enrollment_id > after[0])
+                | and_(table.c.enrollment_id == after[0], table.c.term > after[1])
+            )
+        rows = db.session.execute(stmt).all()
+        if not rows:
+            break
+
+        fixes = []
+        for row in rows:
+            counts = tally(row.marks)
+            if counts != (row.present, row.late, row.absent):
+                fixes.append({'b_enrollment_id': row.enrollment_id, 'b_term': row.term,
+                              'b_present': counts[0], 'b_late': counts[1], 'b_absent': counts[2]})
+        if fixes:
+            db.session.execute(
+                update(table)
+                .where(table.c.enrollment_id == bindparam('b_enrollment_id'), table.c.term == bindparam('b_term'))
+                .values(present=bindparam('b_present'), late=bindparam('b_late'), absent=bindparam('b_absent')),
+                fixes
+            )
+        db.session.commit()
+        corrected += len(fixes)
+        checked += len(rows)
+        after = (rows[-1].enrollment_id, rows[-1].term)
+        if progress is not None:
+            progress(checked)
+    return corrected
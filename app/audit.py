@@ -0,0 +1,222 @@
+# app/audit.py
+
+import datetime
+import json
+import re
+
+from sqlalchemy import event, func, select
+
+from . import attendance, db, enrollment, fees, grades, jobs, queries, stats, timetable, verification
+from .sessions import DatabaseSessions
+from .models import Course, Department, Student, Teacher, User
+
+class AuditError(Exception):
+    '''
+    Raised when the database's query plans cannot be inspected.
+    '''
+
+class Shape(object):
+    '''
+    A query shape to audit. run(sample) calls the app code that issues
+    the statements; tables in allow may be scanned in full, for reports
+    that read a whole table by design.
+    '''
+
+    def __init__(self, name, run, allow=()):
+        self.name = name
+        self.run = run
+        self.allow = set(allow)
+
+def _next_page(run):
+    page = run()
+    return run(cursor=page.next_cursor) if page.next_cursor else page
+
+def shapes():
+    '''
+    The app's query shapes: listings, relationship loads used by the
+    views and by cascading deletes, enrollment checks, fee reports, the
+    dashboard, attendance and grades.
+    '''
+
+    return [
+        Shape('list_students', lambda s: queries.list_students()),
+        Shape('list_students_next_page', lambda s: _next_page(queries.list_students)),
+        Shape('list_students_by_name', lambda s: queries.list_students(sort='name')),
+        Shape('list_students_by_department', lambda s: queries.list_students(department_id=s['department_id'])),
+        Shape('list_teachers', lambda s: queries.list_teachers()),
+        Shape('list_teachers_by_speciality', lambda s: queries.list_teachers(speciality=s['speciality'])),
+        Shape('list_courses', lambda s: queries.list_courses()),
+        Shape('list_courses_by_teacher', lambda s: queries.list_courses(teacher_id=s['teacher_id'])),
+        Shape('list_courses_by_credits', lambda s: queries.list_courses(credits=s['credits'])),
+        Shape('list_unverified_users', lambda s: queries.list_users()),
+        Shape('list_unverified_users_by_role', lambda s: queries.list_users(role='Student')),
+        Shape('count_pending_users', lambda s: verification.count_pending()),
+        Shape('login', lambda s: User.query.filter_by(email=s['email']).first()),
+        Shape('user_student', lambda s: db.session.get(User, s['user_id']).students),
+        Shape('user_teacher', lambda s: db.session.get(User, s['teacher_user_id']).teachers),
+        Shape('student_enrollments', lambda s: db.session.get(Student, s['roll_no']).enrollments),
+        Shape('student_fees', lambda s: db.session.get(Student, s['roll_no']).fees),
+        Shape('student_waitlists', lambda s: db.session.get(Student, s['roll_no']).waitlists),
+        Shape('course_enrollments', lambda s: db.session.get(Course, s['course_id']).enrollments),
+        Shape('course_fees', lambda s: db.session.get(Course, s['course_id']).fees),
+        Shape('course_waitlists', lambda s: db.session.get(Course, s['course_id']).waitlists),
+        Shape('teacher_courses', lambda s: db.session.get(Teacher, s['teacher_id']).courses),
+        Shape('department_students', lambda s: db.session.get(Department, s['department_id']).students[:1]),
+        Shape('enrollment_statuses', lambda s: enrollment.statuses(s['roll_no'], [s['course_id']])),
+        Shape('waitlist_position', lambda s: enrollment.waitlist_position(s['roll_no'], s['course_id'])),
+        Shape('fee_totals', lambda s: fees.totals()),
+        Shape('fee_by_department', lambda s: fees.by_department()),
+        Shape('fee_by_term', lambda s: fees.by_term()),
+        Shape('fee_top_students', lambda s: fees.top_outstanding('student')),
+        Shape('fee_top_courses', lambda s: fees.top_outstanding('course')),
+        Shape('dashboard', lambda s: stats.dashboard()),
+        Shape('attendance_roster', lambda s: attendance.roster(s['course_id'], datetime.date.today())),
+        Shape('attendance_student', lambda s: attendance.student_summary(s['roll_no'])),
+        Shape('grade_book', lambda s: grades.grade_book(s['course_id'])),
+        Shape('transcript', lambda s: grades.transcript(s['roll_no'])),
+        Shape('ranking', lambda s: grades.ranking()),
+        Shape('student_timetable', lambda s: timetable.student_schedule(s['roll_no'])),
+        Shape('teacher_timetable', lambda s: timetable.teacher_schedule(s['teacher_id'])),
+        Shape('course_sections', lambda s: timetable.sections(s['course_id'])),
+        Shape('jobs', lambda s: jobs.recent()),
+        Shape('session_lookup', lambda s: DatabaseSessions().load('0' * 64)),
+        Shape('fee_aging', lambda s: fees.aging()),
+        Shape('fee_aging_by_term', lambda s: fees.aging(term=fees.NO_TERM)),
+    ]
+
+def sample():
+    '''
+    Pick existing keys to run the shapes with, so plans reflect real
+    parameter values.
+    '''
+
+    def first(*columns):
+        return db.session.execute(select(*columns).limit(1)).first() or (None,) * len(columns)
+
+    roll_no, user_id, department_id = first(Student.roll_no, Student.user_id, Student.department_id)
+    teacher_id, teacher_user_id, speciality = first(Teacher.teacher_id, Teacher.user_id, Teacher.speciality)
+    course_id, credits = first(Course.course_id, Course.credits)
+    email, = first(User.email)
+    return {
+        'roll_no': roll_no, 'user_id': user_id, 'department_id': department_id or 0,
+        'teacher_id': teacher_id, 'teacher_user_id': teacher_user_id, 'speciality': speciality or 'CS',
+        'course_id': course_id, 'credits': credits or 1, 'email': email
+    }
+
+def capture(run, sample):
+    '''
+    Run a shape and return the (statement, parameters) pairs it sent to
+    the database. Nothing is committed.
+    '''
+
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+            statements.append((statement, parameters))
+
+    db.session.expunge_all()
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        run(sample)
+    except AttributeError:
+        # The sample row is missing (e.g. an empty table); nothing to load.
+        pass
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+        db.session.rollback()
+    return statements
+
+def _table_name(name):
+    '''
+    Map a plan's table or alias name (e.g. users_1) back to a table.
+    '''
+
+    name = name.lower()
+    if name in db.metadata.tables:
+        return name
+    base = re.sub(r'_\d+$', '', name)
+    return base if base in db.metadata.tables else None
+
+def _sqlite_scans(connection, statement, parameters):
+    details = [row[-1] for row in connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters)]
+
+    # "SCAN t" reads the table in rowid order and "SCAN t USING INDEX" walks
+    # an index. When the driving scan already matches the ORDER BY (no temp
+    # B-tree) a LIMIT stops it early, so it is not a full scan.
+    streamed = ' LIMIT ' in statement and not any('TEMP B-TREE FOR ORDER BY' in detail for detail in details)
+    found = []
+    for position, detail in enumerate(details):
+        match = re.match(r'SCAN (?:TABLE )?(\w+)(?: AS \w+)?$', detail)
+        if match and not (streamed and position == 0):
+            found.append(match.group(1))
+    return found
+
+def _postgresql_scans(connection, statement, parameters):
+    plan = connection.exec_driver_sql('EXPLAIN (FORMAT JSON) ' + statement, parameters).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+
+    found, nodes = [], [plan[0]['Plan']]
+    while nodes:
+        node = nodes.pop()
+        if node['Node Type'] == 'Seq Scan':
+            found.append(node['Relation Name'])
+        nodes.extend(node.get('Plans', ()))
+    return found
+
+def _mysql_scans(connection, statement, parameters):
+    rows = connection.exec_driver_sql('EXPLAIN ' + statement, parameters).mappings().all()
+    return [row['table'] for row in rows if row['type'] == 'ALL' and row['table']]
+
+def _oracle_scans(connection, statement, parameters):
+    connection.exec_driver_sql("EXPLAIN PLAN SET STATEMENT_ID = 'ums_audit' FOR " + statement, parameters)
+    found = connection.exec_driver_sql(
+        "SELECT object_name FROM plan_table WHERE statement_id = 'ums_audit' "
+        "AND operation = 'TABLE ACCESS' AND options = 'FULL'"
+    ).scalars().all()
+    connection.exec_driver_sql("DELETE FROM plan_table WHERE statement_id = 'ums_audit'")
+    return found
+
+SCANNERS = {
+    'sqlite': _sqlite_scans,
+    'postgresql': _postgresql_scans,
+    'mysql': _mysql_scans,
+    'mariadb': _mysql_scans,
+    'oracle': _oracle_scans,
+}
+
+def audit(threshold=1000, names=None):
+    '''
+    EXPLAIN every statement issued by the app's query shapes and report
+    full table scans of tables holding more than threshold rows. Returns
+    (shape name, table, row count, statement) findings.
+    '''
+
+    connection = db.session.connection()
+    scanner = SCANNERS.get(connection.dialect.name)
+    if scanner is None:
+        raise AuditError(f'Query plans are not supported on {connection.dialect.name}.')
+
+    values = sample()
+    counts = {}
+    findings = []
+    for shape in shapes():
+        if names and shape.name not in names:
+            continue
+
+        for statement, parameters in capture(shape.run, values):
+            connection = db.session.connection()
+            for name in scanner(connection, statement, parameters):
+                table = _table_name(name)
+                if table is None or table in shape.allow:
+                    continue
+                if table not in counts:
+                    counts[table] = db.session.execute(
+                        select(func.count()).select_from(db.metadata.tables[table])
+                    ).scalar()
+                if counts[table] > threshold:
+                    findings.append((shape.name, table, counts[table], statement))
+
+    db.session.rollback()
+    return findings
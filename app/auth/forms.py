@@ -3,9 +3,18 @@
 from flask_wtf import FlaskForm
 from wtforms import PasswordField, StringField, SubmitField, ValidationError, SelectField
 from wtforms.validators import DataRequired, Email, EqualTo, Length 
+from sqlalchemy import or_, select
 
+from .. import db
 from ..models import User
 
+# Unique User columns and the error shown when a value is already taken.
+UNIQUE_FIELDS = {
+    'email': 'Email is already in use!',
+    'username': 'Username is already in use!',
+    'contact': 'Contact number is already in use!'
+}
+
 class RegistrationForm(FlaskForm):
     '''
     Form for users to create new account.
@@ -26,17 +35,40 @@ class RegistrationForm(FlaskForm):
     confirm_password = PasswordField('Confirm Password')
     submit = SubmitField('Register')
 
-    def validate_email(self, field):
-        if User.query.filter_by(email=field.data).first():
-            raise ValidationError('Email is already in use!')
-    
-    def validate_username(self, field):
-        if User.query.filter_by(username=field.data).first():
-            raise ValidationError('Username is already in use!')
-        
-    def validate_contact(self, field):
-        if User.query.filter_by(contact=field.data).first():
-            raise ValidationError('Contact number is already in use!')
+    def validate(self, extra_validators=None):
+        '''
+        Run the field validators, then check email, username and contact
+        for duplicates with a single query.
+        '''
+
+        if not super().validate(extra_validators):
+            return False
+
+        columns = [getattr(User, name) for name in UNIQUE_FIELDS]
+        taken = db.session.execute(
+            select(*columns).where(or_(*[column == self[column.key].data for column in columns]))
+        ).all()
+
+        for row in taken:
+            for name, message in UNIQUE_FIELDS.items():
+                if getattr(row, name) == self[name].data and message not in self[name].errors:
+                    self[name].errors.append(message)
+
+        return not taken
+
+    def flag_duplicates(self, error):
+        '''
+        Map a unique constraint violation raised on commit back to the
+        offending fields. Returns False if no field could be matched.
+        '''
+
+        message = str(error.orig).lower()
+        flagged = False
+        for name, text in UNIQUE_FIELDS.items():
+            if name in message:
+                self[name].errors = list(self[name].errors) + [text]
+                flagged = True
+        return flagged
         
     def validate_role(self, field):
         if field.data not in ['Student', 'Teacher', 'Admin']:
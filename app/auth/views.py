@@ -2,6 +2,7 @@
 
 from flask import flash, redirect, render_template, url_for
 from flask_login import login_required, login_user, logout_user
+from sqlalchemy.exc import IntegrityError
 
 from .forms import LoginForm, RegistrationForm
 from . import auth
@@ -33,30 +34,24 @@ def register():
             status=status_flag
         )
 
-        # Add user to the database.
-        db.session.add(user)
-        db.session.commit()
-        flash('Registration successful!')
-
+        # Create the student or teacher row in the same transaction.
         if form.role.data == 'Student':
-            student = Student(
-                user_id=user.id,
-                department_id=None
-            )
-
-            # Add student to the database.
-            db.session.add(student)
-            db.session.commit()
-
+            user.students = Student(department_id=None)
         elif form.role.data == 'Teacher':
-            teacher = Teacher(
-                user_id=user.id,
-                speciality=None
-            )
+            user.teachers = Teacher(speciality=None)
 
-            # Add teacher to the database.
-            db.session.add(teacher)
+        # Add user to the database.
+        db.session.add(user)
+        try:
             db.session.commit()
+        except IntegrityError as e:
+            # A concurrent signup took the same email, username or contact.
+            db.session.rollback()
+            if not form.flag_duplicates(e):
+                raise
+            return render_template('auth/register.html', form=form, title='Register')
+
+        flash('Registration successful!')
 
         # Redirect to the login page.
         return redirect(url_for('auth.login'))
@@ -0,0 +1,121 @@
+# app/cache.py
+
+import threading
+import time
+from collections import OrderedDict
+
+class LRUCache(object):
+    '''
+    Thread-safe in-process LRU cache whose entries expire after a TTL.
+    '''
+
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        '''
+        Return the cached value for key, or default when it is missing or
+        has expired.
+        '''
+
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires = entry
+                if expires is None or expires > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl=None):
+        '''
+        Store value under key, evicting the least recently used entry
+        when the cache is full.
+        '''
+
+        ttl = self.ttl if ttl is None else ttl
+        expires = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        '''
+        Return the hit/miss counters and current size.
+        '''
+
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._data)}
+
+class MemoryStore(object):
+    '''
+    Local stand-in for a shared key-value store such as Redis.
+    Implements the subset of the redis-py client API used by the app, so
+    a real client can be dropped in without code changes.
+    '''
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        with self._lock:
+            entry = self._data.get(name)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires is not None and expires <= time.monotonic():
+                del self._data[name]
+                return None
+            return value
+
+    def set(self, name, value, ex=None):
+        expires = time.monotonic() + ex if ex else None
+        with self._lock:
+            self._data[name] = (value, expires)
+        return True
+
+    def delete(self, *names):
+        with self._lock:
+            return sum(self._data.pop(name, None) is not None for name in names)
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            value, expires = self._data.get(name, (0, None))
+            value = int(value) + amount
+            self._data[name] = (value, expires)
+            return value
+
+def connect_store(url):
+    '''
+    Create a shared store from a URL. "memory://" returns the local
+    stand-in; redis:// URLs require the redis package.
+    '''
+
+    if not url:
+        return None
+    if url.startswith('memory://'):
+        return MemoryStore()
+
+    import redis
+    return redis.Redis.from_url(url)
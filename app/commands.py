@@ -0,0 +1,279 @@
+# app/commands.py
+
+import sys
+import time
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy.exc import IntegrityError
+
+from . import attendance, audit, db, exports, fees, grades, jobs, stats, timetable
+from .importer import CHUNK_SIZE, KINDS, Importer
+from .models import Room
+from .replica import REPLICA_BIND, copy_sqlite
+from .sessions import SWEEP_BATCH_SIZE, session_store
+
+@click.command('import-data')
+@click.argument('kind', type=click.Choice(KINDS))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--chunk-size', default=CHUNK_SIZE, show_default=True, help='Rows written per transaction.')
+@click.option('--unverified', is_flag=True, help='Leave imported accounts pending admin verification.')
+@with_appcontext
+def import_data(kind, path, chunk_size, unverified):
+    '''
+    Bulk import users, students, teachers or enrollments from a CSV,
+    JSON Lines or JSON file.
+    '''
+
+    with open(path, encoding='utf-8', newline='') as stream:
+        report = Importer(kind, chunk_size=chunk_size, verified=not unverified).run(stream)
+
+    for line, message in report.errors:
+        click.echo(f'Line {line}: {message}', err=True)
+    click.echo(f'Imported {report.created} {kind}, rejected {len(report.errors)}.')
+
+@click.command('export-data')
+@click.argument('kind', type=click.Choice(exports.KINDS))
+@click.option('--format', 'fmt', type=click.Choice(exports.FORMATS), default='csv', show_default=True)
+@click.option('--output', type=click.Path(dir_okay=False), help='Write to this file instead of stdout.')
+@with_appcontext
+def export_data(kind, fmt, output):
+    '''
+    Stream students, courses, enrollments or fees to CSV or XLSX.
+    '''
+
+    if fmt == 'xlsx' and not output:
+        raise click.UsageError('XLSX exports need --output.')
+
+    chunks = exports.GENERATORS[fmt](kind)
+    if output is None:
+        for chunk in chunks:
+            sys.stdout.write(chunk)
+        return
+
+    mode, encoding = ('wb', None) if fmt == 'xlsx' else ('w', 'utf-8')
+    with open(output, mode, encoding=encoding, newline=None if encoding is None else '') as f:
+        for chunk in chunks:
+            f.write(chunk)
+
+@click.command('rebuild-fee-summary')
+@with_appcontext
+def rebuild_fee_summary():
+    '''
+    Recompute the fee summary table from the fee ledger.
+    '''
+
+    fees.rebuild()
+    click.echo('Fee summary rebuilt.')
+
+@click.command('rebuild-attendance')
+@with_appcontext
+def rebuild_attendance():
+    '''
+    Recount the attendance counts from the attendance bitmaps.
+    '''
+
+    corrected = attendance.rebuild()
+    click.echo(f'Attendance counts rebuilt; {corrected} corrected.')
+
+@click.command('rebuild-gpa')
+@with_appcontext
+def rebuild_gpa():
+    '''
+    Recompute every student's GPA and CGPA from their grades.
+    '''
+
+    grades.rebuild()
+    click.echo('GPA summary rebuilt.')
+
+@click.command('add-room')
+@click.argument('name')
+@click.argument('capacity', type=click.IntRange(min=1))
+@with_appcontext
+def add_room(name, capacity):
+    '''
+    Add a room the timetable can schedule sections into.
+    '''
+
+    db.session.add(Room(name=name, capacity=capacity))
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        raise click.ClickException(f'Room {name} already exists.')
+    click.echo(f'Added room {name} for {capacity} students.')
+
+@click.command('build-timetable')
+@click.option('--seconds', type=float, help='Time limit for the solver; defaults to TIMETABLE_SOLVER_SECONDS.')
+@click.option('--seed', default=0, show_default=True, help='Seed for the solver\'s tie breaking.')
+@with_appcontext
+def build_timetable(seconds, seed):
+    '''
+    Schedule every course section into a slot and room, replacing the
+    current timetable.
+    '''
+
+    result = timetable.build(seconds, seed)
+    click.echo(
+        f'Scheduled {len(result.assignments)} sections in {result.seconds:.1f}s: '
+        f'{len(result.clashing)} clashing, {len(result.unplaced)} unplaced.'
+    )
+    if not result.conflict_free:
+        sys.exit(1)
+
+@click.command('check-timetable')
+@with_appcontext
+def check_timetable():
+    '''
+    Report teacher, room and student clashes in the current timetable.
+    '''
+
+    clashes = timetable.clashes()
+    click.echo(
+        f'{len(clashes.teachers)} teacher, {len(clashes.rooms)} room and {sum(clashes.courses.values())} '
+        f'student clashes ({clashes.students} students affected).'
+    )
+    if clashes.total:
+        sys.exit(1)
+
+@click.command('reconcile-stats')
+@click.option('--every', type=float, help='Keep reconciling, every this many seconds.')
+@with_appcontext
+def reconcile_stats(every):
+    '''
+    Recount the dashboard counters from the base tables and fix any
+    drift.
+    '''
+
+    while True:
+        drift = stats.reconcile()
+        for (name, scope_id), delta in sorted(drift.items()):
+            click.echo(f'{name} {scope_id}: corrected by {delta:+d}')
+        click.echo(f'Dashboard counters reconciled; {len(drift)} corrected.')
+        if not every:
+            return
+        time.sleep(every)
+
+@click.command('retire-term')
+@click.argument('term')
+@click.option('--no-archive', is_flag=True, help='Delete the fees without copying them to the archive.')
+@click.option('--batch-size', default=fees.RETIRE_BATCH_SIZE, show_default=True, help='Fees moved per transaction.')
+@click.confirmation_option(prompt='Remove every fee of this term from the ledger?')
+@with_appcontext
+def retire_term(term, no_archive, batch_size):
+    '''
+    Move a term's fees out of the live ledger into the fee archive.
+    '''
+
+    retired = fees.retire_term(term, archive=not no_archive, batch_size=batch_size)
+    click.echo(f'Retired {retired} fees from {term}.')
+
+@click.command('audit-queries')
+@click.option('--threshold', default=1000, show_default=True, help='Flag full scans of tables with more rows than this.')
+@click.option('--shape', 'names', multiple=True, help='Only audit these query shapes.')
+@click.option('--list', 'list_shapes', is_flag=True, help='List the query shapes and exit.')
+@with_appcontext
+def audit_queries(threshold, names, list_shapes):
+    '''
+    EXPLAIN the app's query shapes and flag full table scans. Exits 1
+    when any are found.
+    '''
+
+    if list_shapes:
+        for shape in audit.shapes():
+            click.echo(shape.name)
+        return
+
+    try:
+        findings = audit.audit(threshold, set(names))
+    except audit.AuditError as e:
+        raise click.ClickException(str(e))
+
+    for name, table, rows, statement in findings:
+        click.echo(f'{name}: full scan of {table} ({rows} rows)', err=True)
+        click.echo(f'    {" ".join(statement.split())}', err=True)
+
+    if findings:
+        sys.exit(1)
+    click.echo('No full table scans above the threshold.')
+
+@click.command('sync-replica')
+@click.option('--every', type=float, help='Keep copying, every this many seconds.')
+@with_appcontext
+def sync_replica(every):
+    '''
+    Copy a SQLite primary database over the SQLite replica in
+    DB_REPLICA_URL, to try read replica routing locally. Real replicas
+    are kept in sync by the database's own replication.
+    '''
+
+    if REPLICA_BIND not in db.engines:
+        raise click.ClickException('DB_REPLICA_URL is not set.')
+
+    primary, replica = db.engines[None].url, db.engines[REPLICA_BIND].url
+    if primary.get_backend_name() != 'sqlite' or replica.get_backend_name() != 'sqlite':
+        raise click.ClickException('Only SQLite databases can be copied; use replication for other databases.')
+
+    while True:
+        copy_sqlite(primary.database, replica.database)
+        click.echo(f'Copied {primary.database} to {replica.database}.')
+        if not every:
+            return
+        time.sleep(every)
+
+@click.command('run-jobs')
+@click.option('--workers', type=click.IntRange(min=1), help='Worker threads; defaults to JOB_WORKERS.')
+@click.option('--once', is_flag=True, help='Run the jobs that are due one after another, then exit.')
+@with_appcontext
+def run_jobs(workers, once):
+    '''
+    Run queued background jobs in this process, for deployments that
+    keep them out of the web processes.
+    '''
+
+    pool = jobs.job_workers
+    if once:
+        click.echo(f'Ran {pool.run_pending()} jobs.')
+        return
+
+    pool.start(current_app._get_current_object(), size=workers or pool.size or 1)
+    click.echo(f'Running jobs with {len(pool.threads) - 1} workers; press Ctrl+C to stop.')
+    try:
+        while pool.started:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        click.echo('Stopping after the running jobs finish.')
+        pool.stop()
+
+@click.command('sweep-sessions')
+@click.option('--batch-size', default=SWEEP_BATCH_SIZE, show_default=True, help='Sessions deleted per transaction.')
+@with_appcontext
+def sweep_sessions(batch_size):
+    '''
+    Delete expired server-side sessions.
+    '''
+
+    if not session_store.enabled:
+        raise click.ClickException('SESSION_STORE is not set; sessions live in signed cookies.')
+    click.echo(f'Deleted {session_store.sweep(batch_size)} expired sessions.')
+
+def register_commands(app):
+    '''
+    Attach the app's CLI commands to the flask command.
+    '''
+
+    app.cli.add_command(import_data)
+    app.cli.add_command(export_data)
+    app.cli.add_command(rebuild_fee_summary)
+    app.cli.add_command(rebuild_attendance)
+    app.cli.add_command(rebuild_gpa)
+    app.cli.add_command(add_room)
+    app.cli.add_command(build_timetable)
+    app.cli.add_command(check_timetable)
+    app.cli.add_command(reconcile_stats)
+    app.cli.add_command(retire_term)
+    app.cli.add_command(audit_queries)
+    app.cli.add_command(sync_replica)
+    app.cli.add_command(run_jobs)
+    app.cli.add_command(sweep_sessions)
@@ -0,0 +1,64 @@
+# app/deletion.py
+
+from sqlalchemy import delete, select
+
+from . import db, enrollment, fees, grades, stats
+from .identity import identity_cache
+from .reference import reference_data
+from .search import search_index
+from .sessions import session_store
+from .models import Course, Enrollment, Fee, Grade, Student, User, Waitlist
+
+def delete_student(roll_no):
+    '''
+    Delete a student and their user account. Enrollments, waitlist
+    entries and fees go with them through ON DELETE CASCADE, so the
+    number of statements does not depend on how many rows they own.
+    The fee summary, seat counts and dashboard counters are adjusted
+    with set-based statements first, and freed seats are offered to
+    waitlisted students. Returns False if there is no such student.
+    '''
+
+    user_id = db.session.execute(select(Student.user_id).where(Student.roll_no == roll_no)).scalar()
+    if user_id is None:
+        return False
+
+    fees.subtract(Fee.student_id == roll_no)
+    course_ids = enrollment.release_seats(Enrollment.student_id == roll_no)
+    stats.remove_students(Student.roll_no == roll_no)
+    stats.remove_users(User.id == user_id)
+    db.session.execute(delete(Student).where(Student.roll_no == roll_no))
+    db.session.execute(delete(User).where(User.id == user_id))
+    db.session.commit()
+
+    # Bulk DELETEs bypass the ORM events that normally invalidate the cache.
+    identity_cache.invalidate(user_id)
+    session_store.revoke(user_id)
+    search_index.refresh(user_ids=[user_id])
+
+    if course_ids:
+        waiting = db.session.execute(
+            select(Waitlist.course_id).where(Waitlist.course_id.in_(course_ids)).distinct()
+        ).scalars()
+        for course_id in list(waiting):
+            enrollment.fill_from_waitlist(course_id)
+    return True
+
+def delete_course(course_id):
+    '''
+    Delete a course. Its enrollments, waitlist, fees and grades go with
+    it through ON DELETE CASCADE after the fee summary, enrollment count
+    and GPA summary are adjusted. Returns False if there is no such
+    course.
+    '''
+
+    fees.subtract(Fee.course_id == course_id)
+    grades.subtract(Grade.course_id == course_id)
+    stats.remove_enrollments(Enrollment.course_id == course_id)
+    deleted = db.session.execute(delete(Course).where(Course.course_id == course_id)).rowcount
+    db.session.commit()
+
+    # Bulk DELETEs bypass the ORM events that bump the reference data version.
+    reference_data.invalidate()
+    search_index.refresh(course_ids=[course_id])
+    return deleted == 1
@@ -0,0 +1,295 @@
+# app/enrollment.py
+
+from sqlalchemy import bindparam, delete, event, exists, func, insert, literal, or_, select, union_all, update
+from sqlalchemy.exc import IntegrityError
+
+from . import db, stats
+from .models import Course, Enrollment, Student, Waitlist
+
+ENROLLED = 'enrolled'
+WAITLISTED = 'waitlisted'
+DROPPED = 'dropped'
+
+class EnrollmentError(Exception):
+    '''
+    Raised when a student or course to enroll does not exist.
+    '''
+
+def _status(student_id, course_id):
+    '''
+    Return ENROLLED, WAITLISTED or None for a student in a course, with a
+    single query.
+    '''
+
+    enrolled = exists().where(Enrollment.student_id == student_id, Enrollment.course_id == course_id)
+    waitlisted = exists().where(Waitlist.student_id == student_id, Waitlist.course_id == course_id)
+    row = db.session.execute(select(enrolled.label('enrolled'), waitlisted.label('waitlisted'))).one()
+    if row.enrolled:
+        return ENROLLED
+    if row.waitlisted:
+        return WAITLISTED
+    return None
+
+def _lock_student(student_id):
+    '''
+    Take the student's row lock with a no-op UPDATE, so concurrent
+    requests for the same student run one after another and cannot both
+    enroll and waitlist them. Requests for different students do not
+    block each other here.
+    '''
+
+    table = Student.__table__
+    result = db.session.execute(
+        update(table).where(table.c.roll_no == student_id).values(department_id=table.c.department_id)
+    )
+    if result.rowcount == 0:
+        raise EnrollmentError('Invalid student ID!')
+
+def _take_seat(course_id):
+    '''
+    Atomically claim a seat: the conditional UPDATE only matches while
+    the course has room, and the row lock it takes serialises concurrent
+    claims, so seats can never be over-allocated. Every seat taken is an
+    enrollment, so the dashboard's enrollment count moves with it.
+    '''
+
+    stmt = (
+        update(Course)
+        .where(Course.course_id == course_id)
+        .where(or_(Course.capacity.is_(None), Course.seats_taken < Course.capacity))
+        .values(seats_taken=Course.seats_taken + 1)
+        .execution_options(synchronize_session=False)
+    )
+    taken = db.session.execute(stmt).rowcount == 1
+    if taken:
+        stats.adjust(db.session, {(stats.ENROLLMENTS, 0): 1}, key=course_id)
+    return taken
+
+def _release_seat(course_id):
+    stmt = (
+        update(Course)
+        .where(Course.course_id == course_id)
+        .values(seats_taken=Course.seats_taken - 1)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.execute(stmt)
+    stats.adjust(db.session, {(stats.ENROLLMENTS, 0): -1}, key=course_id)
+
+def _promote(course_id):
+    '''
+    Hand a freed seat to the longest waiting student. The waitlist entry
+    is claimed by deleting it, so concurrent drops never promote the same
+    student twice. Returns the promoted student's id, or None if nobody
+    is waiting.
+    '''
+
+    while True:
+        entry = db.session.execute(
+            select(Waitlist.waitlist_id, Waitlist.student_id)
+            .where(Waitlist.course_id == course_id)
+            .order_by(Waitlist.waitlist_id)
+            .limit(1)
+        ).first()
+        if entry is None:
+            return None
+
+        claimed = db.session.execute(
+            delete(Waitlist).where(Waitlist.waitlist_id == entry.waitlist_id)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if claimed and _status(entry.student_id, course_id) is None:
+            db.session.execute(insert(Enrollment).values(student_id=entry.student_id, course_id=course_id))
+            return entry.student_id
+
+def enroll(student_id, course_id):
+    '''
+    Enroll a student in a course, or put them on its waitlist when the
+    course is full. Repeating the call is safe: a student who is already
+    enrolled or waitlisted keeps their place. Returns ENROLLED or
+    WAITLISTED.
+    '''
+
+    status = _status(student_id, course_id)
+    if status is not None:
+        return status
+
+    try:
+        # Re-check under the student's lock; a duplicate request may have
+        # finished while this one waited.
+        _lock_student(student_id)
+        status = _status(student_id, course_id)
+        if status is not None:
+            db.session.commit()
+            return status
+
+        if _take_seat(course_id):
+            db.session.execute(insert(Enrollment).values(student_id=student_id, course_id=course_id))
+            status = ENROLLED
+        else:
+            if db.session.get(Course, course_id) is None:
+                raise EnrollmentError('Invalid course ID!')
+            db.session.execute(insert(Waitlist).values(student_id=student_id, course_id=course_id))
+            status = WAITLISTED
+        db.session.commit()
+    except IntegrityError:
+        # A promotion from the waitlist got in first; the rollback also
+        # returns any seat this request claimed.
+        db.session.rollback()
+        status = _status(student_id, course_id)
+        if status is None:
+            raise
+    except EnrollmentError:
+        db.session.rollback()
+        raise
+
+    return status
+
+def drop(student_id, course_id):
+    '''
+    Drop a student from a course or its waitlist. A freed seat goes to
+    the first waitlisted student. Dropping a course the student is not
+    in is a no-op. Returns DROPPED. Raises EnrollmentError for an unknown
+    student.
+    '''
+
+    try:
+        _lock_student(student_id)
+    except EnrollmentError:
+        db.session.rollback()
+        raise
+
+    dropped = db.session.execute(
+        delete(Enrollment)
+        .where(Enrollment.student_id == student_id, Enrollment.course_id == course_id)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+
+    if dropped:
+        if _promote(course_id) is None:
+            _release_seat(course_id)
+    else:
+        db.session.execute(
+            delete(Waitlist)
+            .where(Waitlist.student_id == student_id, Waitlist.course_id == course_id)
+            .execution_options(synchronize_session=False)
+        )
+
+    db.session.commit()
+    return DROPPED
+
+def fill_from_waitlist(course_id):
+    '''
+    Promote waitlisted students into any free seats, e.g. after the
+    capacity was raised or students were deleted. Returns the promoted
+    student ids.
+    '''
+
+    promoted = []
+    while _take_seat(course_id):
+        student_id = _promote(course_id)
+        if student_id is None:
+            _release_seat(course_id)
+            break
+        promoted.append(student_id)
+
+    db.session.commit()
+    return promoted
+
+def add_seats(counts):
+    '''
+    Add {course_id: count} to the seats taken, for enrollments written
+    with bulk INSERTs.
+    '''
+
+    if not counts:
+        return
+
+    table = Course.__table__
+    db.session.execute(
+        update(table)
+        .where(table.c.course_id == bindparam('b_course_id'))
+        .values(seats_taken=table.c.seats_taken + bindparam('b_count')),
+        [{'b_course_id': course_id, 'b_count': count} for course_id, count in counts.items()]
+    )
+    stats.adjust(db.session, {(stats.ENROLLMENTS, 0): sum(counts.values())})
+
+def release_seats(*conditions):
+    '''
+    Give back the seats held by enrollments matching conditions, before
+    they are deleted in bulk or through ON DELETE CASCADE. Returns the
+    ids of the courses that gained seats.
+    '''
+
+    course_ids = list(db.session.execute(select(Enrollment.course_id).where(*conditions).distinct()).scalars())
+    if course_ids:
+        table = Course.__table__
+        held = select(func.count()).where(*conditions, Enrollment.course_id == table.c.course_id).scalar_subquery()
+        db.session.execute(
+            update(table).where(table.c.course_id.in_(course_ids)).values(seats_taken=table.c.seats_taken - held)
+        )
+        stats.remove_enrollments(*conditions)
+    return course_ids
+
+def recount_seats(course_ids=None):
+    '''
+    Recompute seats taken from the enrollments table with one correlated
+    UPDATE. Use after bulk loads, or to repair drift.
+    '''
+
+    table = Course.__table__
+    count = (
+        select(func.count())
+        .where(Enrollment.course_id == table.c.course_id)
+        .scalar_subquery()
+    )
+    stmt = update(table).values(seats_taken=count)
+    if course_ids is not None:
+        stmt = stmt.where(table.c.course_id.in_(course_ids))
+    db.session.execute(stmt)
+    db.session.commit()
+
+def statuses(student_id, course_ids):
+    '''
+    Return {course_id: ENROLLED or WAITLISTED} for a student across the
+    given courses, with a single query.
+    '''
+
+    stmt = union_all(
+        select(Enrollment.course_id, literal(ENROLLED))
+        .where(Enrollment.student_id == student_id, Enrollment.course_id.in_(course_ids)),
+        select(Waitlist.course_id, literal(WAITLISTED))
+        .where(Waitlist.student_id == student_id, Waitlist.course_id.in_(course_ids))
+    )
+    return dict(db.session.execute(stmt).all())
+
+def waitlist_position(student_id, course_id):
+    '''
+    Return a student's 1-based place on a course's waitlist, or None.
+    '''
+
+    mine = (
+        select(Waitlist.waitlist_id)
+        .where(Waitlist.student_id == student_id, Waitlist.course_id == course_id)
+        .scalar_subquery()
+    )
+    stmt = select(func.count()).where(Waitlist.course_id == course_id, Waitlist.waitlist_id <= mine)
+    position = db.session.execute(stmt).scalar()
+    return position or None
+
+# Enrollments added or removed through the ORM (e.g. cascades from
+# deleting a student) keep the seat count in step. The engine above
+# writes with bulk statements, which do not fire these.
+
+@event.listens_for(Enrollment, 'after_insert')
+def _enrollment_inserted(mapper, connection, target):
+    table = Course.__table__
+    connection.execute(
+        update(table).where(table.c.course_id == target.course_id).values(seats_taken=table.c.seats_taken + 1)
+    )
+
+@event.listens_for(Enrollment, 'after_delete')
+def _enrollment_deleted(mapper, connection, target):
+    table = Course.__table__
+    connection.execute(
+        update(table).where(table.c.course_id == target.course_id).values(seats_taken=table.c.seats_taken - 1)
+    )
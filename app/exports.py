@@ -0,0 +1,105 @@
+# app/exports.py
+
+import csv
+import io
+import tempfile
+
+from sqlalchemy import select
+from sqlalchemy.orm import aliased
+
+from . import db
+from .models import Course, Department, Enrollment, Fee, Student, Teacher, User
+
+KINDS = ('students', 'courses', 'enrollments', 'fees')
+FORMATS = ('csv', 'xlsx')
+CHUNK_SIZE = 2000
+
+def _exports():
+    '''
+    Map each export to its column headers and a column-only select, so
+    rows are streamed as plain tuples without building ORM objects.
+    '''
+
+    instructor = aliased(User)
+
+    return {
+        'students': (
+            ('roll_no', 'first_name', 'last_name', 'email', 'contact', 'department', 'verified'),
+            select(Student.roll_no, User.first_name, User.last_name, User.email, User.contact,
+                   Department.dep_name, User.status)
+            .join(User, Student.user_id == User.id)
+            .outerjoin(Department, Student.department_id == Department.dep_id)
+            .order_by(Student.roll_no)
+        ),
+        'courses': (
+            ('course_id', 'course_name', 'credits', 'teacher_id', 'instructor_first_name', 'instructor_last_name'),
+            select(Course.course_id, Course.course_name, Course.credits, Course.teacher_id,
+                   instructor.first_name, instructor.last_name)
+            .outerjoin(Teacher, Course.teacher_id == Teacher.teacher_id)
+            .outerjoin(instructor, Teacher.user_id == instructor.id)
+            .order_by(Course.course_id)
+        ),
+        'enrollments': (
+            ('enrollment_id', 'student_id', 'course_id'),
+            select(Enrollment.enrollment_id, Enrollment.student_id, Enrollment.course_id)
+            .order_by(Enrollment.enrollment_id)
+        ),
+        'fees': (
+            ('fee_id', 'student_id', 'course_id', 'amount', 'fee_status', 'term', 'due_date'),
+            select(Fee.fee_id, Fee.student_id, Fee.course_id, Fee.amount, Fee.fee_status, Fee.term, Fee.due_date)
+            .order_by(Fee.fee_id)
+        )
+    }
+
+def stream_rows(kind, chunk_size=CHUNK_SIZE):
+    '''
+    Yield the header row and then lists of rows for an export, read
+    through a server-side cursor (yield_per) chunk_size rows at a time.
+    '''
+
+    headers, stmt = _exports()[kind]
+    result = db.session.execute(stmt.execution_options(yield_per=chunk_size))
+
+    yield [headers]
+    for partition in result.partitions(chunk_size):
+        yield partition
+
+def generate_csv(kind, chunk_size=CHUNK_SIZE):
+    '''
+    Yield an export as CSV text, one chunk of rows at a time.
+    '''
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for rows in stream_rows(kind, chunk_size):
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+def generate_xlsx(kind, chunk_size=CHUNK_SIZE):
+    '''
+    Yield an export as an XLSX workbook. XLSX is a zip archive and cannot
+    be written incrementally, so the workbook is built in write-only mode
+    in a temporary file and then streamed from disk. Requires openpyxl.
+    '''
+
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(kind)
+    for rows in stream_rows(kind, chunk_size):
+        for row in rows:
+            sheet.append(list(row))
+
+    with tempfile.TemporaryFile() as f:
+        workbook.save(f)
+        f.seek(0)
+        for chunk in iter(lambda: f.read(64 * 1024), b''):
+            yield chunk
+
+GENERATORS = {'csv': generate_csv, 'xlsx': generate_xlsx}
+MIMETYPES = {
+    'csv': 'text/csv',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+}
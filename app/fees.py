@@ -0,0 +1,328 @@
+# app/fees.py
+
+import datetime
+
+from sqlalchemy import and_, case, delete, event, func, insert, inspect, literal, select, update
+from sqlalchemy.exc import IntegrityError
+
+from . import db
+from .models import ArchivedFee, Course, Department, Fee, FeeSummary, Student
+
+# Term key used for fees that are not assigned to a term.
+NO_TERM = '-'
+
+# Aging buckets for pending fees as (label, minimum days overdue).
+AGING_BUCKETS = (('90+ days', 91), ('61-90 days', 61), ('31-60 days', 31), ('1-30 days', 1))
+
+# Fees moved to the archive per transaction when retiring a term.
+RETIRE_BATCH_SIZE = 5000
+
+def _department_of(connection, student_id):
+    if student_id is None:
+        return 0
+    stmt = select(Student.department_id).where(Student.roll_no == student_id)
+    return connection.execute(stmt).scalar() or 0
+
+def _bump(connection, scope, scope_id, term, paid_amount=0, paid_count=0, pending_amount=0, pending_count=0):
+    '''
+    Add the given deltas to one summary row, creating it if needed. The
+    row is inserted in a savepoint, so a request that loses the race to
+    create it adds to the winner's row instead of failing.
+    '''
+
+    table = FeeSummary.__table__
+    key = and_(table.c.scope == scope, table.c.scope_id == scope_id, table.c.term == term)
+    add = update(table).where(key).values(
+        paid_amount=table.c.paid_amount + paid_amount,
+        paid_count=table.c.paid_count + paid_count,
+        pending_amount=table.c.pending_amount + pending_amount,
+        pending_count=table.c.pending_count + pending_count
+    )
+    if connection.execute(add).rowcount:
+        return
+    try:
+        with connection.begin_nested():
+            connection.execute(insert(table).values(
+                scope=scope, scope_id=scope_id, term=term,
+                paid_amount=paid_amount, paid_count=paid_count,
+                pending_amount=pending_amount, pending_count=pending_count
+            ))
+    except IntegrityError:
+        # Another request created the row first; add to it instead.
+        connection.execute(add)
+
+def _apply(connection, values, sign):
+    '''
+    Add (sign=1) or remove (sign=-1) a single fee's contribution to every
+    summary row it belongs to.
+    '''
+
+    amount = values['amount'] * sign
+    deltas = {'paid_amount': amount, 'paid_count': sign} if values['fee_status'] == 'Paid' \
+        else {'pending_amount': amount, 'pending_count': sign}
+    term = values['term'] or NO_TERM
+
+    _bump(connection, 'total', 0, term, **deltas)
+    if values['student_id'] is not None:
+        _bump(connection, 'student', values['student_id'], term, **deltas)
+        _bump(connection, 'department', _department_of(connection, values['student_id']), term, **deltas)
+    if values['course_id'] is not None:
+        _bump(connection, 'course', values['course_id'], term, **deltas)
+
+LEDGER_FIELDS = ('student_id', 'course_id', 'amount', 'fee_status', 'term')
+
+@event.listens_for(Fee, 'after_insert')
+def _fee_inserted(mapper, connection, target):
+    _apply(connection, {field: getattr(target, field) for field in LEDGER_FIELDS}, 1)
+
+@event.listens_for(Fee, 'after_delete')
+def _fee_deleted(mapper, connection, target):
+    _apply(connection, {field: getattr(target, field) for field in LEDGER_FIELDS}, -1)
+
+@event.listens_for(Fee, 'after_update')
+def _fee_updated(mapper, connection, target):
+    state = inspect(target)
+    old, new, changed = {}, {}, False
+    for field in LEDGER_FIELDS:
+        history = state.attrs[field].history
+        new[field] = getattr(target, field)
+        old[field] = history.deleted[0] if history.deleted else new[field]
+        changed = changed or bool(history.deleted)
+
+    if changed:
+        _apply(connection, old, -1)
+        _apply(connection, new, 1)
+
+@event.listens_for(Student, 'after_update')
+def _student_moved(mapper, connection, target):
+    '''
+    Move a student's totals to their new department.
+    '''
+
+    history = inspect(target).attrs.department_id.history
+    if not history.deleted:
+        return
+
+    old_department = history.deleted[0] or 0
+    new_department = target.department_id or 0
+    table = FeeSummary.__table__
+    rows = connection.execute(
+        select(table).where(table.c.scope == 'student', table.c.scope_id == target.roll_no)
+    ).all()
+    for row in rows:
+        totals = {
+            'paid_amount': row.paid_amount, 'paid_count': row.paid_count,
+            'pending_amount': row.pending_amount, 'pending_count': row.pending_count
+        }
+        _bump(connection, 'department', old_department, row.term, **{k: -v for k, v in totals.items()})
+        _bump(connection, 'department', new_department, row.term, **totals)
+
+def rebuild():
+    '''
+    Recompute the whole summary table from the fee ledger with one
+    grouped INSERT ... SELECT per scope. Use after bulk loads that bypass
+    the ORM, or to repair drift.
+    '''
+
+    table = FeeSummary.__table__
+    term = func.coalesce(Fee.term, NO_TERM)
+    paid = Fee.fee_status == 'Paid'
+    totals = (
+        func.coalesce(func.sum(case((paid, Fee.amount), else_=0)), 0),
+        func.coalesce(func.sum(case((paid, 1), else_=0)), 0),
+        func.coalesce(func.sum(case((paid, 0), else_=Fee.amount)), 0),
+        func.coalesce(func.sum(case((paid, 0), else_=1)), 0)
+    )
+    columns = ['scope', 'scope_id', 'term', 'paid_amount', 'paid_count', 'pending_amount', 'pending_count']
+    department = func.coalesce(Student.department_id, 0)
+
+    queries = (
+        select(literal('total'), literal(0), term, *totals).group_by(term),
+        select(literal('student'), Fee.student_id, term, *totals)
+        .where(Fee.student_id.isnot(None)).group_by(Fee.student_id, term),
+        select(literal('course'), Fee.course_id, term, *totals)
+        .where(Fee.course_id.isnot(None)).group_by(Fee.course_id, term),
+        select(literal('department'), department, term, *totals)
+        .join(Student, Fee.student_id == Student.roll_no).group_by(department, term)
+    )
+
+    db.session.execute(delete(table))
+    for query in queries:
+        db.session.execute(insert(table).from_select(columns, query))
+    db.session.commit()
+
+def subtract(*conditions):
+    '''
+    Remove the contribution of every fee matching conditions from the
+    summary, with one correlated UPDATE per scope. Call before deleting
+    those fees in bulk or through ON DELETE CASCADE, which bypass the
+    ledger listeners.
+    '''
+
+    table = FeeSummary.__table__
+    term = func.coalesce(Fee.term, NO_TERM)
+    paid = Fee.fee_status == 'Paid'
+    department = (
+        select(func.coalesce(Student.department_id, 0))
+        .where(Student.roll_no == Fee.student_id)
+        .scalar_subquery()
+    )
+    keys = {'total': literal(0), 'student': Fee.student_id, 'course': Fee.course_id, 'department': department}
+
+    for scope, key in keys.items():
+        matching = (*conditions, key == table.c.scope_id, term == table.c.term)
+
+        def removed(expr):
+            return select(func.coalesce(func.sum(expr), 0)).where(*matching).scalar_subquery()
+
+        db.session.execute(
+            update(table)
+            .where(table.c.scope == scope, table.c.scope_id.in_(select(key).where(*conditions)))
+            .values(
+                paid_amount=table.c.paid_amount - removed(case((paid, Fee.amount), else_=0)),
+                paid_count=table.c.paid_count - removed(case((paid, 1), else_=0)),
+                pending_amount=table.c.pending_amount - removed(case((paid, 0), else_=Fee.amount)),
+                pending_count=table.c.pending_count - removed(case((paid, 0), else_=1))
+            )
+        )
+
+    db.session.execute(delete(table).where(table.c.paid_count == 0, table.c.pending_count == 0))
+
+def retire_term(term, archive=True, batch_size=RETIRE_BATCH_SIZE, progress=None):
+    '''
+    Delete every fee of a term, copying it to the fee archive first
+    unless archive is False. Fees are moved in fee_id ranges of
+    batch_size, each in its own transaction with the summary adjusted
+    to match, so a large term never holds one huge transaction. progress,
+    if given, is called with the running count after each batch. Returns
+    the number of fees retired.
+    '''
+
+    in_term = Fee.term.is_(None) if term == NO_TERM else Fee.term == term
+    columns = ['fee_id', 'student_id', 'course_id', 'amount', 'fee_status', 'term', 'due_date']
+    retired, low = 0, None
+
+    while True:
+        stmt = select(Fee.fee_id).where(in_term).order_by(Fee.fee_id).limit(batch_size)
+        if low is not None:
+            stmt = stmt.where(Fee.fee_id > low)
+        ids = list(db.session.execute(stmt).scalars())
+        if not ids:
+            break
+
+        batch = [in_term, Fee.fee_id.between(ids[0], ids[-1])]
+        if archive:
+            archived_at = datetime.datetime.now()
+            db.session.execute(insert(ArchivedFee.__table__).from_select(
+                columns + ['archived_at'],
+                select(*[getattr(Fee, column) for column in columns], literal(archived_at)).where(*batch)
+            ))
+        subtract(*batch)
+        db.session.execute(delete(Fee).where(*batch).execution_options(synchronize_session=False))
+        db.session.commit()
+
+        retired += len(ids)
+        low = ids[-1]
+        if progress is not None:
+            progress(retired)
+
+    return retired
+
+def _summed(scope, term=None):
+    '''
+    Select summary totals for a scope, per scope_id, across all terms or
+    for a single term.
+    '''
+
+    stmt = (
+        select(
+            FeeSummary.scope_id,
+            func.sum(FeeSummary.paid_amount).label('paid_amount'),
+            func.sum(FeeSummary.paid_count).label('paid_count'),
+            func.sum(FeeSummary.pending_amount).label('pending_amount'),
+            func.sum(FeeSummary.pending_count).label('pending_count')
+        )
+        .where(FeeSummary.scope == scope)
+        .group_by(FeeSummary.scope_id)
+    )
+    if term is not None:
+        stmt = stmt.where(FeeSummary.term == term)
+    return stmt
+
+def totals(term=None):
+    '''
+    Return overall paid and outstanding totals.
+    '''
+
+    totals = {'paid_amount': 0, 'paid_count': 0, 'pending_amount': 0, 'pending_count': 0}
+    row = db.session.execute(_summed('total', term)).first()
+    if row is not None:
+        totals.update({key: getattr(row, key) for key in totals})
+    return totals
+
+def by_department(term=None):
+    '''
+    Return (department name, totals) rows; students without a department
+    are grouped as "Not Assigned".
+    '''
+
+    summed = _summed('department', term).subquery()
+    stmt = (
+        select(func.coalesce(Department.dep_name, 'Not Assigned').label('name'), summed)
+        .outerjoin(Department, Department.dep_id == summed.c.scope_id)
+        .order_by(summed.c.pending_amount.desc())
+    )
+    return db.session.execute(stmt).all()
+
+def by_term():
+    '''
+    Return totals per term.
+    '''
+
+    stmt = (
+        select(FeeSummary.term, FeeSummary.paid_amount, FeeSummary.paid_count,
+               FeeSummary.pending_amount, FeeSummary.pending_count)
+        .where(FeeSummary.scope == 'total')
+        .order_by(FeeSummary.term)
+    )
+    return db.session.execute(stmt).all()
+
+def top_outstanding(scope, term=None, limit=20):
+    '''
+    Return the students or courses with the largest outstanding amounts.
+    '''
+
+    summed = _summed(scope, term).order_by(func.sum(FeeSummary.pending_amount).desc()).limit(limit).subquery()
+    if scope == 'course':
+        stmt = select(Course.course_name.label('name'), summed).join(Course, Course.course_id == summed.c.scope_id)
+    else:
+        stmt = select(summed.c.scope_id.label('name'), summed)
+    return db.session.execute(stmt.order_by(summed.c.pending_amount.desc())).all()
+
+def aging(as_of=None, term=None):
+    '''
+    Bucket pending fees by how many days they are past their due date.
+    Aging shifts with time, so it is computed with one grouped query over
+    pending fees rather than kept in the summary; an index on (fee_status,
+    term, due_date, amount) answers it without reading the ledger rows.
+    '''
+
+    as_of = as_of or datetime.date.today()
+    whens = [
+        (Fee.due_date <= as_of - datetime.timedelta(days=days), literal(label))
+        for label, days in AGING_BUCKETS
+    ]
+    bucket = case(*whens, else_=literal('Not due')).label('bucket')
+
+    stmt = (
+        select(bucket, func.count().label('count'), func.sum(Fee.amount).label('amount'))
+        .where(Fee.fee_status == 'Pending')
+        .group_by(bucket)
+    )
+    if term is not None:
+        stmt = stmt.where(Fee.term.is_(None) if term == NO_TERM else Fee.term == term)
+
+    found = {row.bucket: row for row in db.session.execute(stmt)}
+    labels = ['Not due'] + [label for label, _ in reversed(AGING_BUCKETS)]
+    return [(label, found[label].count if label in found else 0, found[label].amount if label in found else 0)
+            for label in labels]
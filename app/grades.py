@@ -0,0 +1,289 @@
+# app/grades.py
+
+import bisect
+import statistics
+from collections import defaultdict
+
+from flask import current_app
+from sqlalchemy import and_, bindparam, case, delete, func, insert, literal, select, update
+from sqlalchemy.exc import IntegrityError
+
+from . import db
+from .attendance import current_term
+from .models import Course, Enrollment, GpaSummary, Grade, Student, User
+from .pagination import PER_PAGE, paginate
+
+# Term key of each student's cumulative (CGPA) summary row.
+ALL_TERMS = '*'
+
+# Oracle accepts at most 1000 expressions in an IN list.
+IN_CHUNK = 1000
+
+class GradeError(Exception):
+    '''
+    Raised when marks cannot be recorded for a course.
+    '''
+
+def _clamp(marks):
+    return [min(max(mark, 0), 100) for mark in marks]
+
+def _no_curve(marks):
+    return list(marks)
+
+def _top_curve(marks):
+    '''
+    Lift every mark by the gap between the class's top mark and 100.
+    '''
+
+    shift = 100 - max(marks)
+    return _clamp([mark + shift for mark in marks])
+
+def _bell_curve(marks):
+    '''
+    Rescale the class's marks to GRADE_BELL_MEAN and GRADE_BELL_SD.
+    '''
+
+    config = current_app.config
+    mean, spread = statistics.fmean(marks), statistics.pstdev(marks)
+    if not spread:
+        return [config['GRADE_BELL_MEAN']] * len(marks)
+    scale = config['GRADE_BELL_SD'] / spread
+    return _clamp([config['GRADE_BELL_MEAN'] + (mark - mean) * scale for mark in marks])
+
+CURVES = {'none': _no_curve, 'top': _top_curve, 'bell': _bell_curve}
+
+def assign(marks, curve='none'):
+    '''
+    Curve a class's marks and map them to letters and grade points with
+    GRADE_SCALE and GRADE_POINTS. Works on the whole list at once, since
+    the curves depend on the class's distribution. Returns parallel
+    (letters, points) lists.
+    '''
+
+    config = current_app.config
+    scale = sorted(config['GRADE_SCALE'])
+    minimums = [minimum for minimum, _ in scale]
+    letters = [scale[bisect.bisect_right(minimums, mark) - 1][1] for mark in CURVES[curve](marks)]
+    return letters, [config['GRADE_POINTS'][letter] for letter in letters]
+
+def _apply(deltas):
+    '''
+    Add {(student_id, term): [credits, quality points]} deltas to the GPA
+    summary with one executemany UPDATE for existing rows and one INSERT
+    for new ones, recomputing their GPA in the same statements.
+    '''
+
+    deltas = {key: delta for key, delta in deltas.items() if delta[0] or delta[1]}
+    if not deltas:
+        return
+
+    table = GpaSummary.__table__
+    student_ids = sorted({student_id for student_id, _ in deltas})
+    existing = set()
+    for start in range(0, len(student_ids), IN_CHUNK):
+        stmt = select(table.c.student_id, table.c.term).where(table.c.student_id.in_(student_ids[start:start + IN_CHUNK]))
+        existing.update(tuple(row) for row in db.session.execute(stmt))
+
+    updates, inserts = [], []
+    for (student_id, term), (credits, points) in deltas.items():
+        if (student_id, term) in existing:
+            updates.append({'b_student_id': student_id, 'b_term': term, 'b_credits': credits, 'b_points': points})
+        else:
+            inserts.append({'student_id': student_id, 'term': term, 'credits': credits, 'quality_points': points,
+                            'gpa': points / credits if credits > 0 else None})
+
+    if updates:
+        credits = table.c.credits + bindparam('b_credits')
+        points = table.c.quality_points + bindparam('b_points')
+        db.session.execute(
+            update(table)
+            .where(table.c.student_id == bindparam('b_student_id'), table.c.term == bindparam('b_term'))
+            .values(credits=credits, quality_points=points, gpa=case((credits > 0, points / credits), else_=None)),
+            updates
+        )
+        # Students left without graded credits in a term drop out of it.
+        for start in range(0, len(student_ids), IN_CHUNK):
+            db.session.execute(
+                delete(table).where(table.c.student_id.in_(student_ids[start:start + IN_CHUNK]), table.c.credits <= 0)
+            )
+    if inserts:
+        try:
+            with db.session.begin_nested():
+                db.session.execute(insert(table), inserts)
+        except IntegrityError:
+            # Another request created some of these rows first; add to them instead.
+            _apply({(row['student_id'], row['term']): (row['credits'], row['quality_points']) for row in inserts})
+
+def record_course(course_id, marks, term=None, curve=None):
+    '''
+    Grade a whole course at once: marks maps student ids to marks out of
+    100. The curve is applied across the marks given together, then the
+    grades are written with one executemany UPDATE and one INSERT, and
+    the term and cumulative GPA of every affected student are adjusted
+    by the difference in the same pass. Regrading a student replaces
+    their previous grade. Returns the number of students graded.
+    '''
+
+    term = term or current_term()
+    curve = curve or current_app.config['GRADE_CURVE']
+    if curve not in CURVES:
+        raise GradeError(f'Unknown curve: {curve}')
+    if any(isinstance(mark, bool) or not isinstance(mark, int) or not 0 <= mark <= 100 for mark in marks.values()):
+        raise GradeError('Marks must be whole numbers from 0 to 100.')
+
+    credits = db.session.execute(select(Course.credits).where(Course.course_id == course_id)).scalar()
+    if credits is None:
+        raise GradeError('Invalid course ID!')
+    enrolled = set(db.session.execute(select(Enrollment.student_id).where(Enrollment.course_id == course_id)).scalars())
+    unknown = sorted(set(marks) - enrolled)
+    if unknown:
+        raise GradeError(f'Not enrolled in this course: {", ".join(str(student_id) for student_id in unknown)}.')
+    if not marks:
+        return 0
+
+    student_ids = list(marks)
+    letters, points = assign([marks[student_id] for student_id in student_ids], curve)
+
+    previous = {
+        row.student_id: row for row in db.session.execute(
+            select(Grade.student_id, Grade.term, Grade.points, Grade.credits).where(Grade.course_id == course_id)
+        )
+    }
+
+    deltas = defaultdict(lambda: [0, 0.0])
+    updates, inserts = [], []
+    for student_id, letter, point in zip(student_ids, letters, points):
+        row = {'student_id': student_id, 'course_id': course_id, 'term': term, 'marks': marks[student_id],
+               'grade': letter, 'points': point, 'credits': credits}
+        old = previous.get(student_id)
+        if old is None:
+            inserts.append(row)
+        else:
+            updates.append({'b_' + name: value for name, value in row.items()})
+            for key in ((student_id, old.term), (student_id, ALL_TERMS)):
+                deltas[key][0] -= old.credits
+                deltas[key][1] -= old.credits * old.points
+        for key in ((student_id, term), (student_id, ALL_TERMS)):
+            deltas[key][0] += credits
+            deltas[key][1] += credits * point
+
+    table = Grade.__table__
+    if updates:
+        db.session.execute(
+            update(table)
+            .where(table.c.student_id == bindparam('b_student_id'), table.c.course_id == bindparam('b_course_id'))
+            .values(term=bindparam('b_term'), marks=bindparam('b_marks'), grade=bindparam('b_grade'),
+                    points=bindparam('b_points'), credits=bindparam('b_credits')),
+            updates
+        )
+    if inserts:
+        db.session.execute(insert(table), inserts)
+
+    _apply(deltas)
+    db.session.commit()
+    return len(student_ids)
+
+def subtract(*conditions):
+    '''
+    Remove the contribution of every grade matching conditions from the
+    GPA summary, with one grouped read. Call before deleting those grades
+    in bulk or through ON DELETE CASCADE.
+    '''
+
+    stmt = (
+        select(Grade.student_id, Grade.term, func.sum(Grade.credits), func.sum(Grade.credits * Grade.points))
+        .where(*conditions)
+        .group_by(Grade.student_id, Grade.term)
+    )
+    deltas = defaultdict(lambda: [0, 0.0])
+    for student_id, term, credits, points in db.session.execute(stmt):
+        for key in ((student_id, term), (student_id, ALL_TERMS)):
+            deltas[key][0] -= credits
+            deltas[key][1] -= points
+
+    _apply(deltas)
+
+def rebuild():
+    '''
+    Recompute the whole GPA summary from the grades with one grouped
+    INSERT ... SELECT per scope. Use after bulk loads, or to repair
+    drift.
+    '''
+
+    table = GpaSummary.__table__
+    totals = (func.sum(Grade.credits), func.sum(Grade.credits * Grade.points))
+    columns = ['student_id', 'term', 'credits', 'quality_points']
+
+    db.session.execute(delete(table))
+    db.session.execute(insert(table).from_select(
+        columns, select(Grade.student_id, Grade.term, *totals).group_by(Grade.student_id, Grade.term)
+    ))
+    db.session.execute(insert(table).from_select(
+        columns, select(Grade.student_id, literal(ALL_TERMS), *totals).group_by(Grade.student_id)
+    ))
+    db.session.execute(
+        update(table).values(gpa=case((table.c.credits > 0, table.c.quality_points / table.c.credits), else_=None))
+    )
+    db.session.commit()
+
+def grade_book(course_id):
+    '''
+    Return a course's enrolled students in name order with their current
+    marks and grade, if graded.
+    '''
+
+    stmt = (
+        select(Enrollment.student_id, User.first_name, User.last_name, Grade.marks, Grade.grade, Grade.term)
+        .join(Student, Enrollment.student_id == Student.roll_no)
+        .join(User, Student.user_id == User.id)
+        .outerjoin(Grade, and_(Grade.student_id == Enrollment.student_id, Grade.course_id == Enrollment.course_id))
+        .where(Enrollment.course_id == course_id)
+        .order_by(User.last_name, User.first_name, Enrollment.student_id)
+    )
+    return db.session.execute(stmt).all()
+
+def transcript(student_id):
+    '''
+    Return a student's grades in term and course order, and their GPA
+    summary rows keyed by term, with the cumulative row under ALL_TERMS.
+    '''
+
+    grades = db.session.execute(
+        select(Grade.term, Course.course_name, Grade.credits, Grade.marks, Grade.grade, Grade.points)
+        .join(Course, Grade.course_id == Course.course_id)
+        .where(Grade.student_id == student_id)
+        .order_by(Grade.term, Course.course_name)
+    ).all()
+    summaries = db.session.execute(
+        select(GpaSummary.term, GpaSummary.credits, GpaSummary.gpa).where(GpaSummary.student_id == student_id)
+    ).all()
+    return grades, {row.term: row for row in summaries}
+
+def ranking(cursor=None, per_page=PER_PAGE):
+    '''
+    Return a page of students by CGPA, highest first, and its rows as
+    dicts with each student's rank. Tied students share a rank.
+    '''
+
+    columns = ('student_id', 'first_name', 'last_name', 'credits', 'gpa')
+    stmt = (
+        select(GpaSummary.student_id, User.first_name, User.last_name, GpaSummary.credits, GpaSummary.gpa)
+        .join(Student, GpaSummary.student_id == Student.roll_no)
+        .join(User, Student.user_id == User.id)
+        .where(GpaSummary.term == ALL_TERMS, GpaSummary.gpa.isnot(None))
+    )
+    page = paginate(stmt, GpaSummary.gpa, GpaSummary.student_id, cursor, per_page, descending=True)
+    rows = [dict(zip(columns, item)) for item in page.items]
+    if not rows:
+        return page, rows
+
+    # Rank the first row by counting higher CGPAs on the index; the rest follow from the page.
+    above = db.session.execute(
+        select(func.count()).select_from(GpaSummary)
+        .where(GpaSummary.term == ALL_TERMS, GpaSummary.gpa > rows[0]['gpa'])
+    ).scalar()
+    for position, row in enumerate(rows):
+        if position == 0 or row['gpa'] < rows[position - 1]['gpa']:
+            rank = above + position + 1
+        row['rank'] = rank
+    return page, rows
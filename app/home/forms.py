@@ -0,0 +1,30 @@
+# app/home/forms.py
+
+from flask_wtf import FlaskForm
+from wtforms import DateField, SelectField, SubmitField
+from wtforms.validators import DataRequired
+
+class EnrollmentForm(FlaskForm):
+    '''
+    Form for a student to enroll in or drop a course.
+    '''
+
+    submit = SubmitField('Submit')
+
+class AttendanceForm(FlaskForm):
+    '''
+    Form for a teacher to mark a class. Each student's status is posted
+    as status-<roll number>.
+    '''
+
+    held_on = DateField('Date', validators=[DataRequired()])
+    submit = SubmitField('Save Attendance')
+
+class GradeBookForm(FlaskForm):
+    '''
+    Form for a teacher to grade a class. Each student's marks are posted
+    as marks-<roll number>.
+    '''
+
+    curve = SelectField('Curve', choices=[('none', 'No Curve'), ('top', 'Top Mark to 100'), ('bell', 'Bell Curve')])
+    submit = SubmitField('Save Grades')
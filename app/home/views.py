@@ -1,9 +1,17 @@
 # app/home/views.py
 
-from flask import abort, render_template
+import datetime
+
+from flask import abort, flash, jsonify, redirect, render_template, request, url_for
 from flask_login import current_user, login_required
+from sqlalchemy import select
 
 from . import home
+from .forms import AttendanceForm, EnrollmentForm, GradeBookForm
+from .. import attendance, db, enrollment, grades, queries, stats, timetable
+from ..models import Course, Student, Teacher
+from ..pagination import InvalidCursor
+from ..replica import replica_reads
 
 @home.route('/')
 def homepage():
@@ -15,6 +23,7 @@ def homepage():
 
 @home.route('/dashboard')
 @login_required
+@replica_reads
 def dashboard():
     '''
     Render the dashboard template on the /dashboard route.
@@ -24,12 +33,271 @@ def dashboard():
 
 @home.route('/admin/dashboard')
 @login_required
+@replica_reads
 def admin_dashboard():
+    '''
+    Render the admin dashboard from the precomputed counters.
+    '''
+
     # Prevent non-admins from accessing the page
     if not current_user.is_admin:
         abort(403)
 
-    return render_template('home/admin_dashboard.html', title="Dashboard")
+    return render_template('home/admin_dashboard.html', stats=stats.dashboard(), title="Dashboard")
+
+def current_student_id():
+    '''
+    Return the logged in user's roll number; only students can enroll.
+    '''
+
+    roll_no = db.session.execute(select(Student.roll_no).where(Student.user_id == current_user.id)).scalar()
+    if roll_no is None:
+        abort(403)
+    return roll_no
+
+def wants_json():
+    return request.accept_mimetypes.best == 'application/json'
+
+@home.route('/courses')
+@login_required
+@replica_reads
+def courses():
+    '''
+    List courses with their seats and the student's enrollment status.
+    '''
+
+    student_id = current_student_id()
+
+    try:
+        page = queries.list_courses(
+            sort=request.args.get('sort'),
+            descending=request.args.get('order') == 'desc',
+            cursor=request.args.get('cursor')
+        )
+    except InvalidCursor:
+        abort(400)
+
+    statuses = enrollment.statuses(student_id, [course.course_id for course in page.items])
+
+    return render_template(
+        'home/courses.html',
+        courses=page.items,
+        page=page,
+        statuses=statuses,
+        form=EnrollmentForm(),
+        title="Courses"
+    )
+
+@home.route('/courses/<int:id>/enroll', methods=['POST'])
+@login_required
+def enroll(id):
+    '''
+    Enroll the student in a course, or waitlist them if it is full.
+    Repeated requests leave the enrollment unchanged.
+    '''
+
+    student_id = current_student_id()
+    form = EnrollmentForm()
+    if not form.validate_on_submit():
+        abort(400)
+
+    try:
+        status = enrollment.enroll(student_id, id)
+    except enrollment.EnrollmentError:
+        abort(404)
+
+    position = enrollment.waitlist_position(student_id, id) if status == enrollment.WAITLISTED else None
+    if wants_json():
+        return jsonify(course_id=id, status=status, waitlist_position=position)
+
+    if position:
+        flash(f'The course is full. You are number {position} on the waitlist.')
+    else:
+        flash('You have successfully enrolled in the course.')
+
+    # Redirect to the courses page.
+    return redirect(url_for('home.courses'))
+
+@home.route('/courses/<int:id>/drop', methods=['POST'])
+@login_required
+def drop(id):
+    '''
+    Drop a course or leave its waitlist. Repeated requests are no-ops.
+    '''
+
+    student_id = current_student_id()
+    form = EnrollmentForm()
+    if not form.validate_on_submit():
+        abort(400)
+
+    status = enrollment.drop(student_id, id)
+    if wants_json():
+        return jsonify(course_id=id, status=status)
+
+    flash('You have successfully dropped the course.')
+
+    # Redirect to the courses page.
+    return redirect(url_for('home.courses'))
+
+@home.route('/attendance')
+@login_required
+@replica_reads
+def my_attendance():
+    '''
+    Show the student's attendance in each of their courses.
+    '''
+
+    student_id = current_student_id()
+    return render_template(
+        'home/attendance/student.html',
+        courses=attendance.student_summary(student_id),
+        term=attendance.current_term(),
+        title="Attendance"
+    )
+
+def taught_courses():
+    '''
+    Select the courses the logged in user may mark: every course for
+    admins, their own courses for teachers.
+    '''
+
+    stmt = select(Course.course_id, Course.course_name, Course.seats_taken).order_by(Course.course_name)
+    if current_user.is_admin:
+        return stmt
+    teacher_id = db.session.execute(select(Teacher.teacher_id).where(Teacher.user_id == current_user.id)).scalar()
+    if teacher_id is None:
+        abort(403)
+    return stmt.where(Course.teacher_id == teacher_id)
+
+@home.route('/teaching')
+@login_required
+@replica_reads
+def teaching():
+    '''
+    List the courses the teacher can take attendance for and grade.
+    '''
+
+    courses = db.session.execute(taught_courses()).all()
+    return render_template('home/teaching.html', courses=courses, title="Teaching")
+
+@home.route('/teaching/<int:id>/attendance', methods=['GET', 'POST'])
+@login_required
+def mark_attendance(id):
+    '''
+    Show a course's register for a day and record it in one bulk write.
+    '''
+
+    course = db.session.execute(taught_courses().where(Course.course_id == id)).first()
+    if course is None:
+        abort(404)
+
+    form = AttendanceForm()
+    if form.validate_on_submit():
+        statuses = {}
+        for name, value in request.form.items():
+            if name.startswith('status-') and name[7:].isdigit():
+                statuses[int(name[7:])] = value
+        try:
+            marked = attendance.mark_class(id, form.held_on.data, statuses)
+        except attendance.AttendanceError:
+            abort(400)
+        flash(f'Attendance saved for {form.held_on.data.isoformat()}; {marked} students updated.')
+
+        # Redirect to the register for the same day.
+        return redirect(url_for('home.mark_attendance', id=id, date=form.held_on.data.isoformat()))
+
+    try:
+        held_on = datetime.date.fromisoformat(request.args['date']) if 'date' in request.args else datetime.date.today()
+    except ValueError:
+        abort(400)
+    form.held_on.data = held_on
+
+    students = attendance.roster(id, held_on)
+    return render_template(
+        'home/attendance/class.html',
+        course=course,
+        students=students,
+        overall=attendance.class_percentage(students),
+        sessions=attendance.sessions(id),
+        statuses=[(attendance.PRESENT, 'Present'), (attendance.LATE, 'Late'), (attendance.ABSENT, 'Absent')],
+        form=form,
+        title="Attendance"
+    )
+
+@home.route('/teaching/<int:id>/grades', methods=['GET', 'POST'])
+@login_required
+def grade_book(id):
+    '''
+    Show a course's grade book and grade the whole class in one batch.
+    Students whose marks are left blank are not graded.
+    '''
+
+    course = db.session.execute(taught_courses().where(Course.course_id == id)).first()
+    if course is None:
+        abort(404)
+
+    form = GradeBookForm()
+    if form.validate_on_submit():
+        try:
+            marks = {
+                int(name[6:]): int(value) for name, value in request.form.items()
+                if name.startswith('marks-') and name[6:].isdigit() and value.strip()
+            }
+            graded = grades.record_course(id, marks, curve=form.curve.data)
+        except ValueError:
+            flash('Marks must be whole numbers from 0 to 100.')
+        except grades.GradeError as e:
+            flash(str(e))
+        else:
+            flash(f'Grades saved; {graded} students graded.')
+
+        # Redirect to the grade book.
+        return redirect(url_for('home.grade_book', id=id))
+
+    return render_template(
+        'home/grades/class.html',
+        course=course,
+        students=grades.grade_book(id),
+        form=form,
+        title="Grade Book"
+    )
+
+@home.route('/transcript')
+@login_required
+@replica_reads
+def transcript():
+    '''
+    Show the student's grades with their term GPAs and CGPA.
+    '''
+
+    student_id = current_student_id()
+    rows, summaries = grades.transcript(student_id)
+    return render_template(
+        'home/grades/transcript.html',
+        grades=rows,
+        summaries=summaries,
+        all_terms=grades.ALL_TERMS,
+        title="Transcript"
+    )
+
+@home.route('/timetable')
+@login_required
+@replica_reads
+def my_timetable():
+    '''
+    Show the week's classes of the logged in student or teacher.
+    '''
+
+    if current_user.is_admin:
+        return redirect(url_for('admin.list_sections'))
+    if current_user.role == 'Teacher':
+        teacher_id = db.session.execute(select(Teacher.teacher_id).where(Teacher.user_id == current_user.id)).scalar()
+        if teacher_id is None:
+            abort(403)
+        classes = timetable.teacher_schedule(teacher_id)
+    else:
+        classes = timetable.student_schedule(current_student_id())
+    return render_template('home/timetable.html', classes=classes, title="Timetable")
 
 # @home.route('/student/dashboard')
 # @login_required
@@ -0,0 +1,239 @@
+# app/httpcache.py
+
+import datetime
+import hashlib
+import threading
+import time
+import uuid
+
+from flask import Response, g, make_response, render_template, request, session
+from flask_login import current_user
+from markupsafe import Markup
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from werkzeug.http import is_resource_modified
+
+from . import db
+from .cache import LRUCache, connect_store
+from .replica import replica_router
+
+STALE_KEY = 'table_versions.stale'
+
+def _cascades():
+    '''
+    Map each table to the tables whose rows the database changes when
+    one of its rows is deleted (ON DELETE CASCADE or SET NULL), directly
+    or through further cascades.
+    '''
+
+    children = {}
+    for table in db.metadata.tables.values():
+        for key in table.foreign_keys:
+            if key.ondelete:
+                children.setdefault(key.column.table.name, set()).add(table.name)
+
+    def reach(name, seen):
+        for child in children.get(name, ()):
+            if child not in seen:
+                seen.add(child)
+                reach(child, seen)
+        return seen
+
+    return {name: reach(name, set()) for name in children}
+
+class Stamp(object):
+    '''
+    The validators of a page built from some tables: a weak ETag over
+    their versions and the viewer, and the time of their latest change.
+    '''
+
+    def __init__(self, versions, modified):
+        self.versions = versions
+        self.modified = modified
+        digest = hashlib.sha1(repr((versions, current_user.get_id())).encode()).hexdigest()
+        self.etag = digest[:20]
+        # HTTP dates have whole seconds.
+        self.last_modified = datetime.datetime.fromtimestamp(int(modified), datetime.timezone.utc)
+
+    def not_modified(self):
+        return not is_resource_modified(request.environ, etag=self.etag, last_modified=self.last_modified)
+
+    def apply(self, response):
+        response.set_etag(self.etag, weak=True)
+        response.last_modified = self.last_modified
+        return response
+
+class TableVersions(object):
+    '''
+    Version number and last change time per table, for conditional GETs
+    and fragment caching.
+
+    Committed ORM writes, session.execute() DML and the rows the
+    database changes through ON DELETE cascades bump the tables they
+    touch. With HTTP_CACHE_URL set the versions live in a shared store,
+    checked at most every HTTP_CACHE_CHECK_INTERVAL seconds, so every
+    worker sees an edit made in any of them; otherwise versions are
+    local and pages served by other workers stay valid for at most
+    HTTP_CACHE_TTL seconds.
+    '''
+
+    def __init__(self):
+        self.shared = None
+        self.enabled = True
+        self.ttl = 60
+        self.check_interval = 1
+        self.prefix = 'table:'
+        self.started = time.time()
+        self.token = ''
+        self.not_modified = 0
+        self.fragments = LRUCache()
+        self._versions = {}
+        self._modified = {}
+        self._checked_at = {}
+        self._cascades = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.enabled = app.config.get('HTTP_CACHE_ENABLED', True)
+        self.shared = connect_store(app.config.get('HTTP_CACHE_URL'))
+        self.ttl = app.config.get('HTTP_CACHE_TTL', 60)
+        self.check_interval = app.config.get('HTTP_CACHE_CHECK_INTERVAL', 1)
+        self.fragments = LRUCache(app.config.get('HTTP_CACHE_FRAGMENTS', 256), self.ttl)
+        self.started = time.time()
+        # Local versions restart at zero, so tell them apart from a
+        # previous process's.
+        self.token = '' if self.shared is not None else uuid.uuid4().hex
+        self.not_modified = 0
+        self._versions, self._modified, self._checked_at = {}, {}, {}
+
+    def cascaded(self, names, deleted=()):
+        '''
+        Return names plus the tables changed by cascades from deleting
+        rows of the tables in deleted.
+        '''
+
+        if self._cascades is None:
+            self._cascades = _cascades()
+        names = set(names)
+        for name in deleted:
+            names |= self._cascades.get(name, set())
+        return names
+
+    def bump(self, *names):
+        now = time.time()
+        with self._lock:
+            for name in names:
+                if self.shared is not None:
+                    self._versions[name] = int(self.shared.incr(self.prefix + name))
+                    self.shared.set(self.prefix + name + ':modified', now)
+                    self._checked_at[name] = time.monotonic()
+                else:
+                    self._versions[name] = self._versions.get(name, 0) + 1
+                self._modified[name] = now
+
+    def _current(self, name):
+        if self.shared is None:
+            return self._versions.get(name, 0), self._modified.get(name, self.started)
+
+        now = time.monotonic()
+        if now - self._checked_at.get(name, 0.0) >= self.check_interval:
+            self._checked_at[name] = now
+            self._versions[name] = int(self.shared.get(self.prefix + name) or 0)
+            self._modified[name] = float(self.shared.get(self.prefix + name + ':modified') or self.started)
+        return self._versions.get(name, 0), self._modified.get(name, self.started)
+
+    def stamp(self, names):
+        '''
+        Return the Stamp of a page built from the named tables.
+        '''
+
+        current = [self._current(name) for name in sorted(names)]
+        versions = [version for version, _ in current]
+        modified = max([self.started] + [changed for _, changed in current])
+        if self.shared is None:
+            # Other workers' writes are invisible here; let pages age out.
+            window = int(time.time() // self.ttl)
+            versions.append(window)
+            modified = max(modified, window * self.ttl)
+        return Stamp((self.token, tuple(versions)), modified)
+
+    def stats(self):
+        stats = self.fragments.stats()
+        stats.update(enabled=self.enabled, not_modified=self.not_modified, versions=dict(sorted(self._versions.items())))
+        return stats
+
+table_versions = TableVersions()
+
+def _cacheable(stamp):
+    '''
+    Whether a response may carry validators and feed the fragment cache.
+    Only GETs qualify; pages showing flashed messages are one-off, and a
+    replica may not have caught up with the latest change yet.
+    '''
+
+    if not table_versions.enabled or request.method != 'GET' or session.get('_flashes'):
+        return False
+    if g.get('read_replica'):
+        return time.time() - stamp.modified > replica_router.max_lag + replica_router.interval
+    return True
+
+def render_listing(tables, template, fragment, load, **context):
+    '''
+    Render a listing page built from the given models' tables. Answers
+    304 when the client's copy is current; otherwise the table part,
+    rendered from fragment with load()'s context, comes from the
+    fragment cache when none of the tables changed since it was stored.
+    '''
+
+    names = [model.__tablename__ for model in tables]
+    stamp = table_versions.stamp(names)
+    cacheable = _cacheable(stamp)
+
+    if cacheable and stamp.not_modified():
+        table_versions.not_modified += 1
+        response = stamp.apply(Response(status=304))
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        return response
+
+    key = (request.endpoint, tuple(sorted(request.args.items(multi=True))), stamp.versions)
+    table = table_versions.fragments.get(key) if cacheable else None
+    if table is None:
+        table = render_template(fragment, **load())
+        if cacheable:
+            table_versions.fragments.set(key, table)
+
+    response = make_response(render_template(template, table=Markup(table), **context))
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    if cacheable:
+        stamp.apply(response)
+    return response
+
+@event.listens_for(Session, 'do_orm_execute')
+def _statement_executed(state):
+    if state.is_insert or state.is_update or state.is_delete:
+        name = state.statement.table.name
+        deleted = (name,) if state.is_delete else ()
+        stale = state.session.info.setdefault(STALE_KEY, set())
+        stale |= table_versions.cascaded((name,), deleted)
+
+@event.listens_for(Session, 'after_flush')
+def _flushed(session, flush_context):
+    names = set()
+    for instance in session.new | session.dirty:
+        names.add(inspect(instance).mapper.local_table.name)
+    deleted = {inspect(instance).mapper.local_table.name for instance in session.deleted}
+    if names or deleted:
+        stale = session.info.setdefault(STALE_KEY, set())
+        stale |= table_versions.cascaded(names | deleted, deleted)
+
+@event.listens_for(Session, 'after_commit')
+def _bump_committed(session):
+    stale = session.info.pop(STALE_KEY, None)
+    if stale:
+        table_versions.bump(*sorted(stale))
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_stale(session):
+    session.info.pop(STALE_KEY, None)
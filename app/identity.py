@@ -0,0 +1,122 @@
+# app/identity.py
+
+import json
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, make_transient_to_detached, object_session
+
+from . import db
+from .cache import LRUCache, connect_store
+
+STALE_KEY = 'identity_cache.stale'
+
+class IdentityCache(object):
+    '''
+    Cache in front of the flask_login user loader.
+
+    Column values of loaded users are kept in an in-process LRU with a
+    TTL and, optionally, in a shared store. A hit rebuilds the user and
+    attaches it to the current session without touching the database.
+    Columns excluded in watch() are never cached and load from the
+    database when first read.
+    Entries are dropped once a transaction that updates or deletes the
+    user commits. Other processes only see the change once their local
+    entry expires, so keep IDENTITY_CACHE_TTL short.
+    '''
+
+    def __init__(self):
+        self.local = LRUCache()
+        self.shared = None
+        self.ttl = None
+        self.prefix = 'identity:'
+        self.shared_hits = 0
+        self.excluded = {}
+
+    def init_app(self, app):
+        self.ttl = app.config.get('IDENTITY_CACHE_TTL', 60)
+        self.local = LRUCache(app.config.get('IDENTITY_CACHE_SIZE', 10000), self.ttl)
+        self.shared = connect_store(app.config.get('IDENTITY_CACHE_URL'))
+        self.shared_hits = 0
+
+    def watch(self, model, exclude=()):
+        '''
+        Invalidate cached identities whenever a row of model is updated
+        or deleted. Columns in exclude, such as credentials, are kept out
+        of the cache.
+        '''
+
+        self.excluded[model] = frozenset(exclude)
+        event.listen(model, 'after_update', self._mark_stale)
+        event.listen(model, 'after_delete', self._mark_stale)
+
+    def load(self, model, ident):
+        '''
+        Return the instance of model with the given primary key, from
+        cache when possible.
+        '''
+
+        values = self.local.get(ident)
+        if values is None and self.shared is not None:
+            raw = self.shared.get(self.prefix + str(ident))
+            if raw is not None:
+                values = json.loads(raw)
+                self.local.set(ident, values)
+                self.shared_hits += 1
+
+        if values is None:
+            instance = db.session.get(model, ident)
+            if instance is not None:
+                self.store(instance)
+            return instance
+
+        instance = model(**values)
+        make_transient_to_detached(instance)
+        return db.session.merge(instance, load=False)
+
+    def store(self, instance):
+        '''
+        Cache the column values of instance.
+        '''
+
+        mapper = inspect(instance).mapper
+        excluded = self.excluded.get(mapper.class_, ())
+        values = {attr.key: getattr(instance, attr.key) for attr in mapper.column_attrs if attr.key not in excluded}
+        ident = mapper.primary_key_from_instance(instance)[0]
+
+        self.local.set(ident, values)
+        if self.shared is not None:
+            self.shared.set(self.prefix + str(ident), json.dumps(values), ex=self.ttl)
+
+    def invalidate(self, *idents):
+        '''
+        Drop the cached entries for the given primary keys.
+        '''
+
+        for ident in idents:
+            self.local.delete(ident)
+        if self.shared is not None and idents:
+            self.shared.delete(*[self.prefix + str(ident) for ident in idents])
+
+    def stats(self):
+        '''
+        Return hit/miss counters for the local cache and the shared store.
+        '''
+
+        stats = self.local.stats()
+        stats['shared_hits'] = self.shared_hits
+        return stats
+
+    def _mark_stale(self, mapper, connection, target):
+        session = object_session(target)
+        ident = mapper.primary_key_from_instance(target)[0]
+        session.info.setdefault(STALE_KEY, set()).add(ident)
+
+identity_cache = IdentityCache()
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_committed(session):
+    identity_cache.invalidate(*session.info.pop(STALE_KEY, ()))
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_stale(session):
+    session.info.pop(STALE_KEY, None)
@@ -0,0 +1,308 @@
+# app/importer.py
+
+import csv
+import itertools
+import json
+from collections import Counter
+
+from sqlalchemy import func, insert, select, text
+from sqlalchemy.exc import IntegrityError
+
+from . import db, stats
+from .enrollment import add_seats
+from .models import Course, Enrollment, Student, Teacher, User
+from .reference import SPECIALITIES, reference_data
+from .search import search_index
+
+KINDS = ('users', 'students', 'teachers', 'enrollments')
+ROLES = ('Student', 'Teacher', 'Admin')
+USER_FIELDS = ('email', 'username', 'password', 'first_name', 'last_name', 'contact', 'address')
+CHUNK_SIZE = 1000
+
+class RowError(Exception):
+    '''
+    Raised when a single row of an import file is invalid.
+    '''
+
+class ImportReport(object):
+    '''
+    Outcome of an import: how many rows were created and which rows
+    were rejected, with the reason.
+    '''
+
+    def __init__(self):
+        self.created = 0
+        self.errors = []
+
+    def reject(self, line, message):
+        self.errors.append((line, message))
+
+def read_rows(stream):
+    '''
+    Yield (line, row) pairs from a CSV, JSON Lines or JSON array text
+    stream. CSV and JSON Lines are read one line at a time; a JSON array
+    has to be parsed in full.
+    '''
+
+    lines = iter(stream)
+    first = next((line for line in lines if line.strip()), '')
+    lines = itertools.chain([first], lines)
+
+    if first.lstrip().startswith('['):
+        for line, row in enumerate(json.loads(''.join(lines)), start=1):
+            yield line, row
+    elif first.lstrip().startswith('{'):
+        for line, raw in enumerate(lines, start=1):
+            if not raw.strip():
+                continue
+            try:
+                yield line, json.loads(raw)
+            except ValueError:
+                yield line, None
+    else:
+        reader = csv.DictReader(lines)
+        for row in reader:
+            yield reader.line_num, row
+
+def allocate_ids(sequence, column, count):
+    '''
+    Reserve count primary key values up front so that parent and child
+    rows can be inserted with executemany and no RETURNING round trip.
+    '''
+
+    if count == 0:
+        return []
+
+    connection = db.session.connection()
+    dialect = connection.dialect.name
+
+    if dialect == 'postgresql':
+        stmt = select(sequence.next_value()).select_from(func.generate_series(1, count))
+        return list(connection.execute(stmt).scalars())
+    if dialect == 'oracle':
+        stmt = text(f'SELECT {sequence.name}.NEXTVAL FROM dual CONNECT BY LEVEL <= :count')
+        return list(connection.execute(stmt, {'count': count}).scalars())
+    if connection.dialect.supports_sequences:
+        return [connection.execute(select(sequence.next_value())).scalar() for _ in range(count)]
+
+    # No sequences (e.g. SQLite): continue from the current maximum.
+    start = connection.execute(select(func.coalesce(func.max(column), 0))).scalar() + 1
+    return list(range(start, start + count))
+
+class Importer(object):
+    '''
+    Bulk loader for users, students, teachers and enrollments.
+
+    Rows are processed in chunks. Uniqueness and reference checks run
+    against sets loaded once at the start instead of one query per row,
+    and each chunk is written with a single executemany per table.
+    '''
+
+    def __init__(self, kind, chunk_size=CHUNK_SIZE, verified=True):
+        if kind not in KINDS:
+            raise ValueError(f'Unknown import kind: {kind}')
+
+        self.kind = kind
+        self.chunk_size = chunk_size
+        self.verified = verified
+        self.report = ImportReport()
+
+    def run(self, stream, progress=None):
+        '''
+        Import every row from stream and return an ImportReport. progress,
+        if given, is called with the last line read after each chunk.
+        '''
+
+        self._preload()
+
+        rows = read_rows(stream)
+        while True:
+            chunk = list(itertools.islice(rows, self.chunk_size))
+            if not chunk:
+                break
+            self._import_chunk(chunk)
+            if progress is not None:
+                progress(chunk[-1][0])
+
+        # Teachers are written with bulk INSERTs, which do not bump the
+        # reference data version.
+        if self.kind in ('users', 'teachers') and self.report.created:
+            reference_data.invalidate()
+
+        return self.report
+
+    def _preload(self):
+        if self.kind == 'enrollments':
+            self.students = set(db.session.execute(select(Student.roll_no)).scalars())
+            self.courses = set(db.session.execute(select(Course.course_id)).scalars())
+            self.pairs = set()
+            return
+
+        self.emails, self.usernames, self.contacts = set(), set(), set()
+        for email, username, contact in db.session.execute(select(User.email, User.username, User.contact)):
+            self.emails.add(email)
+            self.usernames.add(username)
+            self.contacts.add(contact)
+
+        self.departments = {}
+        for dep_id, dep_name in reference_data.department_choices():
+            self.departments[str(dep_id)] = dep_id
+            self.departments[dep_name] = dep_id
+
+    def _import_chunk(self, chunk):
+        accepted = []
+        for line, row in chunk:
+            try:
+                if not isinstance(row, dict):
+                    raise RowError('Malformed row.')
+                accepted.append((line, self._validate(row)))
+            except RowError as e:
+                self.report.reject(line, str(e))
+
+        if not accepted:
+            return
+
+        try:
+            user_ids = self._write([values for _, values in accepted])
+            db.session.commit()
+            self.report.created += len(accepted)
+            search_index.refresh(user_ids=user_ids)
+        except IntegrityError:
+            # Another writer got in first; isolate the offending rows.
+            db.session.rollback()
+            for line, values in accepted:
+                try:
+                    user_ids = self._write([values])
+                    db.session.commit()
+                    self.report.created += 1
+                    search_index.refresh(user_ids=user_ids)
+                except IntegrityError as e:
+                    db.session.rollback()
+                    self.report.reject(line, f'Rejected by the database: {e.orig}')
+
+    def _validate(self, row):
+        row = {key.strip(): ('' if value is None else str(value).strip())
+               for key, value in row.items() if key}
+
+        if self.kind == 'enrollments':
+            return self._validate_enrollment(row)
+
+        for field in USER_FIELDS:
+            if not row.get(field):
+                raise RowError(f'Missing {field}.')
+
+        role = {'students': 'Student', 'teachers': 'Teacher'}.get(self.kind, row.get('role'))
+        if role not in ROLES:
+            raise RowError('Invalid role!')
+        if '@' not in row['email']:
+            raise RowError('Invalid email!')
+        if not 10 <= len(row['contact']) <= 15:
+            raise RowError('Contact must be between 10 and 15 characters.')
+        if len(row['address']) > 200:
+            raise RowError('Address must be at most 200 characters.')
+
+        if row['email'] in self.emails:
+            raise RowError('Email is already in use!')
+        if row['username'] in self.usernames:
+            raise RowError('Username is already in use!')
+        if row['contact'] in self.contacts:
+            raise RowError('Contact number is already in use!')
+
+        values = {
+            'user': {
+                'email': row['email'],
+                'username': row['username'],
+                '_password': row['password'],
+                'first_name': row['first_name'],
+                'last_name': row['last_name'],
+                'contact': row['contact'],
+                'address': row['address'],
+                'role': role,
+                'is_admin': role == 'Admin',
+                'status': self.verified or role == 'Admin'
+            },
+            'role': role
+        }
+
+        if role == 'Student':
+            department = row.get('department') or row.get('department_id') or None
+            if department is not None and str(department) not in self.departments:
+                raise RowError('Invalid Department ID!')
+            values['department_id'] = self.departments.get(str(department))
+        elif role == 'Teacher':
+            speciality = row.get('speciality') or None
+            if speciality is not None and speciality not in SPECIALITIES:
+                raise RowError('Invalid speciality!')
+            values['speciality'] = speciality
+
+        # Reserve the unique values so duplicates later in the file are caught too.
+        self.emails.add(row['email'])
+        self.usernames.add(row['username'])
+        self.contacts.add(row['contact'])
+        return values
+
+    def _validate_enrollment(self, row):
+        try:
+            student_id = int(row.get('student_id'))
+            course_id = int(row.get('course_id'))
+        except (TypeError, ValueError):
+            raise RowError('student_id and course_id must be integers.')
+
+        if student_id not in self.students:
+            raise RowError('Invalid student ID!')
+        if course_id not in self.courses:
+            raise RowError('Invalid course ID!')
+        if (student_id, course_id) in self.pairs:
+            raise RowError('Duplicate enrollment in file.')
+
+        self.pairs.add((student_id, course_id))
+        return {'student_id': student_id, 'course_id': course_id}
+
+    def _write(self, rows):
+        if self.kind == 'enrollments':
+            ids = allocate_ids(Enrollment.enrollment_id_seq, Enrollment.enrollment_id, len(rows))
+            db.session.execute(
+                insert(Enrollment.__table__),
+                [dict(values, enrollment_id=ident) for values, ident in zip(rows, ids)]
+            )
+            # Imported enrollments take seats directly; the capacity check
+            # constraint rejects a chunk that would overbook a course.
+            add_seats(Counter(values['course_id'] for values in rows))
+            return []
+
+        user_ids = allocate_ids(User.id_seq, User.id, len(rows))
+        db.session.execute(
+            insert(User.__table__),
+            [dict(values['user'], id=ident) for values, ident in zip(rows, user_ids)]
+        )
+
+        # Bulk INSERTs bypass the dashboard counter listeners.
+        counts = Counter()
+        for values in rows:
+            counts.update(stats.user_deltas(values['role'], values['user']['status']))
+            if values['role'] == 'Student':
+                counts[(stats.STUDENTS, values['department_id'] or 0)] += 1
+        stats.adjust(db.session, counts)
+
+        students = [
+            {'user_id': ident, 'department_id': values['department_id']}
+            for values, ident in zip(rows, user_ids) if values['role'] == 'Student'
+        ]
+        teachers = [
+            {'user_id': ident, 'speciality': values['speciality']}
+            for values, ident in zip(rows, user_ids) if values['role'] == 'Teacher'
+        ]
+
+        if students:
+            roll_nos = allocate_ids(Student.roll_no_seq, Student.roll_no, len(students))
+            db.session.execute(
+                insert(Student.__table__),
+                [dict(values, roll_no=ident) for values, ident in zip(students, roll_nos)]
+            )
+        if teachers:
+            teacher_ids = allocate_ids(Teacher.teacher_id_seq, Teacher.teacher_id, len(teachers))
+            db.session.execute(
+                insert(Teacher.__table__),
+                [dict(values, teacher_id=ident) for values, ident in zip(teachers, teacher_ids)]
+            )
+        return user_ids
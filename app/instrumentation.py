@@ -0,0 +1,165 @@
+# app/instrumentation.py
+
+import heapq
+import threading
+import time
+from collections import Counter, deque
+
+from flask import g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+class RequestStats(object):
+    '''
+    SQL activity recorded while serving a single request.
+    '''
+
+    def __init__(self, keep_slowest):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.shapes = Counter()
+        self.slowest = []
+        self.keep_slowest = keep_slowest
+
+    def record(self, statement, parameters, duration):
+        self.queries += 1
+        self.db_time += duration
+        self.shapes[statement] += 1
+
+        # Min-heap of the slowest statements; parameters are only kept for these.
+        entry = (duration, self.queries, statement, parameters)
+        if len(self.slowest) < self.keep_slowest:
+            heapq.heappush(self.slowest, entry)
+        elif duration > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, entry)
+
+    def repeated(self, threshold):
+        '''
+        Statement shapes executed more than threshold times: likely N+1
+        query patterns.
+        '''
+
+        return [(shape, count) for shape, count in self.shapes.most_common() if count > threshold]
+
+class Instrumentation(object):
+    '''
+    Per-request SQL query counting and slow query reporting.
+
+    Statements are timed through engine events and attributed to the
+    current request. Each response gets X-DB-Queries and X-DB-Time
+    headers, slow statements and repeated statement shapes are logged,
+    and summaries of recent requests are kept for the /admin/_perf page.
+    '''
+
+    def __init__(self):
+        self.enabled = False
+        self.recent = deque(maxlen=200)
+        self.endpoints = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.enabled = app.config.get('SQL_INSTRUMENTATION', True)
+        self.headers = app.config.get('SQL_INSTRUMENTATION_HEADERS', True)
+        self.slow_ms = app.config.get('SQL_SLOW_QUERY_MS', 100)
+        self.threshold = app.config.get('SQL_N_PLUS_ONE_THRESHOLD', 10)
+        self.keep_slowest = app.config.get('SQL_SLOWEST_STATEMENTS', 5)
+        self.recent = deque(maxlen=app.config.get('SQL_RECENT_REQUESTS', 200))
+        self.logger = app.logger
+
+        if not self.enabled:
+            return
+
+        app.before_request(self._start)
+        app.after_request(self._finish)
+
+        if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+    def _start(self):
+        g.sql_stats = RequestStats(self.keep_slowest)
+
+    def _finish(self, response):
+        stats = g.pop('sql_stats', None)
+        if stats is None:
+            return response
+
+        elapsed = (time.perf_counter() - stats.started) * 1000.0
+        db_ms = stats.db_time * 1000.0
+        repeated = stats.repeated(self.threshold)
+        slowest = [
+            (round(duration * 1000.0, 2), statement, _truncate(parameters))
+            for duration, _, statement, parameters in sorted(stats.slowest, reverse=True)
+        ]
+
+        if self.headers:
+            response.headers['X-DB-Queries'] = str(stats.queries)
+            response.headers['X-DB-Time'] = f'{db_ms:.2f}ms'
+
+        for duration, statement, parameters in slowest:
+            if duration >= self.slow_ms:
+                self.logger.warning('Slow query (%.2fms) on %s %s: %s %s',
+                                    duration, request.method, request.path, statement, parameters)
+        for shape, count in repeated:
+            self.logger.warning('Possible N+1 on %s %s: statement ran %d times: %s',
+                                request.method, request.path, count, shape)
+
+        summary = {
+            'endpoint': request.endpoint,
+            'method': request.method,
+            'path': request.full_path.rstrip('?'),
+            'status': response.status_code,
+            'queries': stats.queries,
+            'db_ms': round(db_ms, 2),
+            'total_ms': round(elapsed, 2),
+            'slowest': slowest,
+            'repeated': repeated
+        }
+        self.recent.appendleft(summary)
+
+        with self._lock:
+            totals = self.endpoints.setdefault(request.endpoint, {'requests': 0, 'queries': 0, 'db_ms': 0.0, 'total_ms': 0.0})
+            totals['requests'] += 1
+            totals['queries'] += stats.queries
+            totals['db_ms'] += db_ms
+            totals['total_ms'] += elapsed
+
+        return response
+
+    def endpoint_summary(self):
+        '''
+        Return per-endpoint averages, slowest average first.
+        '''
+
+        with self._lock:
+            rows = [
+                {
+                    'endpoint': endpoint,
+                    'requests': t['requests'],
+                    'avg_queries': round(t['queries'] / t['requests'], 2),
+                    'avg_db_ms': round(t['db_ms'] / t['requests'], 2),
+                    'avg_total_ms': round(t['total_ms'] / t['requests'], 2)
+                }
+                for endpoint, t in self.endpoints.items()
+            ]
+        return sorted(rows, key=lambda row: row['avg_total_ms'], reverse=True)
+
+def _truncate(parameters, limit=200):
+    text = repr(parameters)
+    return text if len(text) <= limit else text[:limit] + '...'
+
+def _current_stats():
+    return g.get('sql_stats') if has_app_context() else None
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None and _current_stats() is not None:
+        context.query_start = time.perf_counter()
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, 'query_start', None)
+    stats = _current_stats()
+    if start is not None and stats is not None:
+        stats.record(statement, parameters, time.perf_counter() - start)
+
+instrumentation = Instrumentation()
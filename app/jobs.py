@@ -0,0 +1,453 @@
+# app/jobs.py
+
+import datetime
+import json
+import os
+import socket
+import threading
+import time
+import traceback
+
+from flask import current_app
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import defer
+
+from . import db
+from .models import Job
+from .pagination import PER_PAGE, paginate
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+
+# Times a worker looks for another queued job after losing a claim race.
+CLAIM_ATTEMPTS = 3
+
+class JobError(Exception):
+    '''
+    Raised when a job of an unknown kind is queued or run.
+    '''
+
+class Cancelled(Exception):
+    '''
+    Raised inside a running task by JobContext.progress once the job
+    has been cancelled.
+    '''
+
+class Task(object):
+    '''
+    A registered kind of job: the function that runs it and how many
+    times a failed run is retried.
+    '''
+
+    def __init__(self, name, run, retries):
+        self.name = name
+        self.run = run
+        self.retries = retries
+
+TASKS = {}
+
+def task(name, retries=0):
+    '''
+    Register a function as a kind of job. It is called with a JobContext
+    and the job's params as keyword arguments, and may return anything
+    JSON can encode as the job's result.
+    '''
+
+    def register(run):
+        TASKS[name] = Task(name, run, retries)
+        return run
+    return register
+
+def _now():
+    return datetime.datetime.now()
+
+class JobContext(object):
+    '''
+    Handed to a running task: its params and uploaded payload, and
+    progress() to report how far it has got.
+    '''
+
+    def __init__(self, job_id, params, payload, interval=1):
+        self.job_id = job_id
+        self.params = params
+        self.payload = payload
+        self.interval = interval
+        self._reported_at = None
+
+    def progress(self, done, total=None, message=None, force=False):
+        '''
+        Record progress at most once per interval, unless forced. The
+        row is written on its own connection so pages see it while the
+        task's transaction is open; on SQLite, report between commits.
+        Raises Cancelled once the job has been cancelled.
+        '''
+
+        now = time.monotonic()
+        if not force and self._reported_at is not None and now - self._reported_at < self.interval:
+            return
+        self._reported_at = now
+
+        table = Job.__table__
+        values = {'done': done, 'heartbeat_at': _now()}
+        if total is not None:
+            values['total'] = total
+        if message is not None:
+            values['message'] = message[:200]
+        with db.engine.begin() as connection:
+            connection.execute(update(table).where(table.c.job_id == self.job_id).values(**values))
+            cancel = connection.execute(
+                select(table.c.cancel_requested).where(table.c.job_id == self.job_id)
+            ).scalar()
+        if cancel:
+            raise Cancelled()
+
+def enqueue(kind, description, params=None, payload=None, user_id=None):
+    '''
+    Queue a job of a registered kind and wake this process's workers.
+    Returns the job id.
+    '''
+
+    if kind not in TASKS:
+        raise JobError(f'Unknown job kind: {kind}')
+
+    now = _now()
+    job = Job(
+        kind=kind,
+        description=description[:200],
+        params=json.dumps(params or {}),
+        payload=payload,
+        user_id=user_id,
+        status=QUEUED,
+        max_attempts=TASKS[kind].retries + 1,
+        created_at=now,
+        run_at=now
+    )
+    db.session.add(job)
+    db.session.commit()
+    job_workers.wake()
+    return job.job_id
+
+def claim(worker):
+    '''
+    Take the oldest due job off the queue for worker, or return None.
+    The claim is a conditional UPDATE from queued to running, so when
+    two workers pick the same row only one of them gets it, on any
+    database and without holding locks.
+    '''
+
+    table = Job.__table__
+    for _ in range(CLAIM_ATTEMPTS):
+        now = _now()
+        job_id = db.session.execute(
+            select(table.c.job_id)
+            .where(table.c.status == QUEUED, table.c.run_at <= now)
+            .order_by(table.c.run_at, table.c.job_id)
+            .limit(1)
+        ).scalar()
+        if job_id is None:
+            db.session.rollback()
+            return None
+
+        claimed = db.session.execute(
+            update(table)
+            .where(table.c.job_id == job_id, table.c.status == QUEUED)
+            .values(status=RUNNING, worker=worker[:100], attempts=table.c.attempts + 1,
+                    started_at=now, heartbeat_at=now)
+        ).rowcount
+        db.session.commit()
+        if claimed:
+            return job_id
+    return None
+
+def _finish(job_id, worker, **values):
+    table = Job.__table__
+    db.session.execute(
+        update(table)
+        .where(table.c.job_id == job_id, table.c.status == RUNNING, table.c.worker == worker[:100])
+        .values(finished_at=_now(), **values)
+    )
+    db.session.commit()
+
+def run(job_id, worker, progress_interval=1, retry_delay=30):
+    '''
+    Run a claimed job and record how it ended. A failed attempt is
+    queued again after retry_delay seconds, doubling each time, while
+    the task has retries left.
+    '''
+
+    job = db.session.execute(
+        select(Job.kind, Job.params, Job.payload, Job.attempts, Job.max_attempts).where(Job.job_id == job_id)
+    ).first()
+    db.session.rollback()
+
+    context = JobContext(job_id, json.loads(job.params), job.payload, progress_interval)
+    try:
+        if job.kind not in TASKS:
+            raise JobError(f'Unknown job kind: {job.kind}')
+        result = TASKS[job.kind].run(context, **context.params)
+    except Cancelled:
+        db.session.rollback()
+        _finish(job_id, worker, status=CANCELLED, message='Cancelled.')
+    except Exception:
+        db.session.rollback()
+        current_app.logger.exception('Job %s (%s) failed.', job_id, job.kind)
+        error = traceback.format_exc()
+        if job.attempts < job.max_attempts:
+            delay = retry_delay * 2 ** (job.attempts - 1)
+            table = Job.__table__
+            db.session.execute(
+                update(table)
+                .where(table.c.job_id == job_id, table.c.status == RUNNING, table.c.worker == worker[:100])
+                .values(status=QUEUED, worker=None, error=error, message=f'Retrying in {delay} seconds.',
+                        run_at=_now() + datetime.timedelta(seconds=delay))
+            )
+            db.session.commit()
+        else:
+            _finish(job_id, worker, status=FAILED, error=error, message='Failed.')
+    else:
+        table = Job.__table__
+        _finish(job_id, worker, status=SUCCEEDED, result=json.dumps(result), error=None,
+                done=func.coalesce(table.c.total, table.c.done), message='Done.')
+
+def cancel(job_id):
+    '''
+    Cancel a job: a queued one at once, a running one the next time its
+    task reports progress. Returns False if the job has already finished
+    or does not exist.
+    '''
+
+    table = Job.__table__
+    cancelled = db.session.execute(
+        update(table)
+        .where(table.c.job_id == job_id, table.c.status == QUEUED)
+        .values(status=CANCELLED, finished_at=_now(), message='Cancelled.')
+    ).rowcount
+    if not cancelled:
+        cancelled = db.session.execute(
+            update(table).where(table.c.job_id == job_id, table.c.status == RUNNING).values(cancel_requested=True)
+        ).rowcount
+    db.session.commit()
+    return cancelled == 1
+
+def heartbeat(job_ids):
+    '''
+    Mark running jobs as still alive, with one UPDATE.
+    '''
+
+    if not job_ids:
+        return
+    table = Job.__table__
+    db.session.execute(
+        update(table)
+        .where(table.c.job_id.in_(sorted(job_ids)), table.c.status == RUNNING)
+        .values(heartbeat_at=_now())
+    )
+    db.session.commit()
+
+def recover(stale_after):
+    '''
+    Settle running jobs whose worker has not reported for stale_after
+    seconds, as after a crash or restart: cancel those an admin asked to
+    cancel, requeue those with attempts left and fail the rest. Returns
+    the number of jobs settled.
+    '''
+
+    table = Job.__table__
+    now = _now()
+    stale = (table.c.status == RUNNING, table.c.heartbeat_at < now - datetime.timedelta(seconds=stale_after))
+    settled = db.session.execute(
+        update(table)
+        .where(*stale, table.c.cancel_requested.is_(True))
+        .values(status=CANCELLED, finished_at=now, message='Cancelled.')
+    ).rowcount
+    settled += db.session.execute(
+        update(table)
+        .where(*stale, table.c.attempts < table.c.max_attempts)
+        .values(status=QUEUED, worker=None, run_at=now, message='Requeued after the worker stopped.')
+    ).rowcount
+    settled += db.session.execute(
+        update(table)
+        .where(*stale)
+        .values(status=FAILED, finished_at=now, error='The worker stopped while running the job.', message='Failed.')
+    ).rowcount
+    db.session.commit()
+    return settled
+
+def describe(job):
+    '''
+    Return a job's status as a dict for pages and polling.
+    '''
+
+    return {
+        'job_id': job.job_id,
+        'kind': job.kind,
+        'description': job.description,
+        'status': job.status,
+        'done': job.done,
+        'total': job.total,
+        'percent': round(100.0 * job.done / job.total, 1) if job.total else None,
+        'message': job.message,
+        'result': json.loads(job.result) if job.result else None,
+        'error': job.error.strip().splitlines()[-1] if job.error else None,
+        'attempts': job.attempts,
+        'max_attempts': job.max_attempts,
+        'cancel_requested': job.cancel_requested,
+        'finished': job.status in FINISHED,
+        'created_at': job.created_at.isoformat(timespec='seconds'),
+        'started_at': job.started_at.isoformat(timespec='seconds') if job.started_at else None,
+        'finished_at': job.finished_at.isoformat(timespec='seconds') if job.finished_at else None
+    }
+
+def get(job_id):
+    '''
+    Return a job's status dict, or None.
+    '''
+
+    job = db.session.execute(select(Job).options(defer(Job.payload)).where(Job.job_id == job_id)).scalar()
+    return describe(job) if job is not None else None
+
+def recent(cursor=None, per_page=PER_PAGE):
+    '''
+    Return a page of jobs, newest first, and their status dicts.
+    '''
+
+    page = paginate(select(Job).options(defer(Job.payload)), Job.job_id, Job.job_id, cursor, per_page, descending=True)
+    return page, [describe(job) for job in page.items]
+
+class WorkerPool(object):
+    '''
+    Threads that run queued jobs inside the app's own processes.
+
+    The pool starts with a process's first request, after any fork by
+    the server, so every server process runs JOB_WORKERS threads;
+    "flask run-jobs" runs a dedicated worker process instead. Idle
+    workers poll the job table every JOB_POLL_INTERVAL seconds and are
+    woken at once by jobs queued in the same process. A supervisor
+    thread keeps running jobs' heartbeats fresh and requeues jobs whose
+    worker died.
+    '''
+
+    def __init__(self):
+        self.size = 0
+        self.poll_interval = 1
+        self.heartbeat_interval = 30
+        self.stale_after = 300
+        self.progress_interval = 1
+        self.retry_delay = 30
+        self.app = None
+        self.running = {}
+        self.threads = []
+        self._pid = None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+
+    def init_app(self, app):
+        self.size = app.config.get('JOB_WORKERS', 2)
+        self.poll_interval = app.config.get('JOB_POLL_INTERVAL', 1)
+        self.heartbeat_interval = app.config.get('JOB_HEARTBEAT_INTERVAL', 30)
+        self.stale_after = app.config.get('JOB_STALE_AFTER', 300)
+        self.progress_interval = app.config.get('JOB_PROGRESS_INTERVAL', 1)
+        self.retry_delay = app.config.get('JOB_RETRY_DELAY', 30)
+        self.app = app
+
+        if self.size:
+            app.before_request(self._start_with_first_request)
+
+    def _start_with_first_request(self):
+        if self._pid != os.getpid():
+            self.start(self.app)
+
+    @property
+    def started(self):
+        return self._pid == os.getpid() and any(thread.is_alive() for thread in self.threads)
+
+    def start(self, app, size=None):
+        '''
+        Start the worker and supervisor threads in this process, once.
+        '''
+
+        with self._lock:
+            if self.started:
+                return
+            self.app = app
+            self._pid = os.getpid()
+            self._stopping.clear()
+            self.running = {}
+            prefix = f'{socket.gethostname()}:{self._pid}'
+            self.threads = [
+                threading.Thread(target=self._work, args=(f'{prefix}:{index}',), name=f'job-worker-{index}', daemon=True)
+                for index in range(size or self.size)
+            ]
+            self.threads.append(threading.Thread(target=self._supervise, name='job-supervisor', daemon=True))
+            for thread in self.threads:
+                thread.start()
+
+    def stop(self, timeout=None):
+        '''
+        Stop taking jobs and wait for running ones to finish.
+        '''
+
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self.threads:
+            thread.join(timeout)
+
+    def wake(self):
+        self._wakeup.set()
+
+    def _work(self, name):
+        while not self._stopping.is_set():
+            with self.app.app_context():
+                try:
+                    job_id = claim(name)
+                except Exception:
+                    current_app.logger.exception('Could not claim a job.')
+                    db.session.rollback()
+                    job_id = None
+
+                if job_id is not None:
+                    self.running[name] = job_id
+                    try:
+                        run(job_id, name, self.progress_interval, self.retry_delay)
+                    except Exception:
+                        current_app.logger.exception('Could not record the outcome of job %s.', job_id)
+                    finally:
+                        self.running.pop(name, None)
+                    continue
+
+            if self._wakeup.wait(self.poll_interval):
+                self._wakeup.clear()
+
+    def _supervise(self):
+        while not self._stopping.wait(self.heartbeat_interval):
+            with self.app.app_context():
+                try:
+                    heartbeat(set(self.running.values()))
+                    settled = recover(self.stale_after)
+                    if settled:
+                        current_app.logger.warning('Settled %s jobs left running by stopped workers.', settled)
+                except Exception:
+                    current_app.logger.exception('Job supervisor check failed.')
+                    db.session.rollback()
+
+    def run_pending(self, worker=None):
+        '''
+        Run due jobs one after another in the calling thread until the
+        queue is empty. Returns the number run.
+        '''
+
+        worker = worker or f'{socket.gethostname()}:{os.getpid()}:main'
+        count = 0
+        while True:
+            job_id = claim(worker)
+            if job_id is None:
+                return count
+            run(job_id, worker, self.progress_interval, self.retry_delay)
+            count += 1
+
+job_workers = WorkerPool()
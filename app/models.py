@@ -1,6 +1,8 @@
+from flask import current_app
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 from app import db, login_manager
+from app.identity import identity_cache
 
 class User(UserMixin, db.Model):
     '''
@@ -12,14 +14,17 @@ class User(UserMixin, db.Model):
     
     email = db.Column(db.String(50), unique=True, nullable=False, index=True)
     username = db.Column(db.String(50), unique=True, nullable=False, index=True)
-    _password = db.Column(db.String(128), nullable=False)
+    _password = db.column_property(db.Column(db.String(128), nullable=False), active_history=True)
     first_name = db.Column(db.String(50), nullable=False)
     last_name = db.Column(db.String(50), nullable=False)
     contact = db.Column(db.String(50), unique=True, nullable=False, index=True)
     address = db.Column(db.String(200), nullable=False)
-    role = db.Column(db.String(100), nullable=False)
-    is_admin = db.Column(db.Boolean, default=False)
-    status = db.Column(db.Boolean, default=False)
+    # active_history loads the old role, admin flag, status and password
+    # even when the instance is expired, so the dashboard counters and
+    # session revocation (app/sessions.py) see what really changed.
+    role = db.column_property(db.Column(db.String(100), nullable=False), active_history=True)
+    is_admin = db.column_property(db.Column(db.Boolean, default=False), active_history=True)
+    status = db.column_property(db.Column(db.Boolean, default=False), active_history=True)
 
     @property
     def password(self):
@@ -40,7 +45,6 @@ class User(UserMixin, db.Model):
         '''
         Check if hashed password matches actual password.
         '''
-        print(self._password, password)
         # return check_password_hash(self._password, password)
         return self._password == password
 
@@ -50,6 +54,9 @@ class User(UserMixin, db.Model):
     # Check constraints
     __table_args__ = (
         db.CheckConstraint("role IN ('Student', 'Teacher', 'Admin')", name='check_role_valid'),
+        db.Index('ix_users_status_id', 'status', 'id'),
+        db.Index('ix_users_status_role_id', 'status', 'role', 'id'),
+        db.Index('ix_users_last_name_id', 'last_name', 'id'),
     )
 
     # Relationships
@@ -57,10 +64,28 @@ class User(UserMixin, db.Model):
     teachers = db.relationship("Teacher", back_populates="users", single_parent=True, uselist=False, cascade="all, delete-orphan")
 
 
+# Drop cached identities when a user row changes. Passwords stay out of
+# the cache and load on demand.
+identity_cache.watch(User, exclude=('_password',))
+
 # Set up user_loader
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return identity_cache.load(User, int(user_id))
+
+# Let integrations authenticate with "Authorization: Bearer <key>", where
+# API_KEYS maps each key to the id of the user it acts as. Keys are only
+# accepted by the API, and only for verified users, as at login.
+@login_manager.request_loader
+def load_user_from_request(request):
+    if request.blueprint != 'api':
+        return None
+    scheme, _, key = request.headers.get('Authorization', '').partition(' ')
+    if scheme.lower() != 'bearer' or not key:
+        return None
+    user_id = current_app.config.get('API_KEYS', {}).get(key.strip())
+    user = None if user_id is None else identity_cache.load(User, user_id)
+    return user if user is not None and user.status else None
 
 
 class Student(db.Model):
@@ -71,13 +96,22 @@ class Student(db.Model):
     roll_no_seq = db.Sequence('roll_no_seq', start=1, increment=1)
     roll_no = db.Column(db.Integer, roll_no_seq, server_default=roll_no_seq.next_value(), primary_key=True)
 
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    department_id = db.Column(db.Integer, db.ForeignKey('departments.dep_id'))
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    # active_history loads the old department even when the instance is
+    # expired, so the summary listeners always see what changed.
+    department_id = db.column_property(db.Column(db.Integer, db.ForeignKey('departments.dep_id')), active_history=True)
+
+    # Indexes
+    __table_args__ = (
+        db.Index('ix_students_department_id_roll_no', 'department_id', 'roll_no'),
+    )
     
     # Relationships
     users = db.relationship("User", back_populates="students", single_parent=True, cascade="all, delete-orphan")
-    enrollments = db.relationship("Enrollment", back_populates="students", lazy=True, cascade="all, delete-orphan")
-    fees = db.relationship("Fee", back_populates="students", lazy=True, cascade="all, delete-orphan")
+    # Child rows are removed by ON DELETE CASCADE rather than loaded and deleted one by one.
+    enrollments = db.relationship("Enrollment", back_populates="students", lazy=True, cascade="all, delete-orphan", passive_deletes=True)
+    waitlists = db.relationship("Waitlist", back_populates="students", lazy=True, cascade="all, delete-orphan", passive_deletes=True)
+    fees = db.relationship("Fee", back_populates="students", lazy=True, cascade="all, delete-orphan", passive_deletes=True)
     departments = db.relationship("Department", back_populates="students", lazy=True)
 
     def __repr__(self):
@@ -92,17 +126,18 @@ class Teacher(db.Model):
     teacher_id_seq = db.Sequence('teacher_id_seq', start=1, increment=1)
     teacher_id = db.Column(db.Integer, teacher_id_seq, server_default=teacher_id_seq.next_value(), primary_key=True)
     
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
     speciality = db.Column(db.String(50))
 
     # Check constraints
     __table_args__ = (
         db.CheckConstraint("speciality IN ('CS', 'NS', 'AI', 'EE', 'MG', 'MT')", name='check_speciality_valid'),
+        db.Index('ix_teachers_speciality_teacher_id', 'speciality', 'teacher_id'),
     )
 
     # Relationships
     users = db.relationship("User", back_populates="teachers", single_parent=True, uselist=False, cascade="all, delete-orphan")
-    courses = db.relationship("Course", back_populates="teachers", lazy=True)
+    courses = db.relationship("Course", back_populates="teachers", lazy=True, passive_deletes=True)
 
     def __repr__(self):
         return f'<Teacher: {self.first_name}>'
@@ -118,17 +153,26 @@ class Course(db.Model):
 
     course_name = db.Column(db.String(100), unique=True, nullable=False)
     credits = db.Column(db.Integer, nullable=False)
-    teacher_id = db.Column(db.Integer, db.ForeignKey('teachers.teacher_id'))
+    teacher_id = db.Column(db.Integer, db.ForeignKey('teachers.teacher_id', ondelete='SET NULL'))
+    # Seat limit (NULL for unlimited) and the number of seats currently taken.
+    capacity = db.Column(db.Integer)
+    seats_taken = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
     # Check constraints
     __table_args__ = (
         db.CheckConstraint("credits BETWEEN 1 AND 3", name='check_credits_range'),
+        db.CheckConstraint("capacity IS NULL OR capacity >= 0", name='check_capacity_valid'),
+        db.CheckConstraint("seats_taken >= 0 AND (capacity IS NULL OR seats_taken <= capacity)", name='check_seats_within_capacity'),
+        db.Index('ix_courses_teacher_id_course_id', 'teacher_id', 'course_id'),
+        db.Index('ix_courses_credits_course_id', 'credits', 'course_id'),
+        db.Index('ix_courses_seats_taken_course_id', 'seats_taken', 'course_id'),
     )
 
     # Relationships
     teachers = db.relationship("Teacher", back_populates="courses", lazy=True)
-    enrollments = db.relationship("Enrollment", back_populates="courses", lazy=True, cascade="all, delete-orphan")
-    fees = db.relationship("Fee", back_populates="courses", lazy=True, cascade="all, delete-orphan")
+    enrollments = db.relationship("Enrollment", back_populates="courses", lazy=True, cascade="all, delete-orphan", passive_deletes=True)
+    waitlists = db.relationship("Waitlist", back_populates="courses", lazy=True, cascade="all, delete-orphan", passive_deletes=True)
+    fees = db.relationship("Fee", back_populates="courses", lazy=True, cascade="all, delete-orphan", passive_deletes=True)
 
     def __repr__(self):
         return f'<Course: {self.course_name}>'
@@ -142,8 +186,14 @@ class Enrollment(db.Model):
     enrollment_id_seq = db.Sequence('enrollment_id_seq', start=1, increment=1)
     enrollment_id = db.Column(db.Integer, enrollment_id_seq, server_default=enrollment_id_seq.next_value(), primary_key=True)
 
-    student_id = db.Column(db.Integer, db.ForeignKey('students.roll_no'))
-    course_id = db.Column(db.Integer, db.ForeignKey('courses.course_id'))
+    student_id = db.Column(db.Integer, db.ForeignKey('students.roll_no', ondelete='CASCADE'))
+    course_id = db.Column(db.Integer, db.ForeignKey('courses.course_id', ondelete='CASCADE'))
+
+    # Unique constraints; the unique index also serves lookups by student_id.
+    __table_args__ = (
+        db.UniqueConstraint('student_id', 'course_id', name='uq_enrollments_student_course'),
+        db.Index('ix_enrollments_course_id_student_id', 'course_id', 'student_id'),
+    )
 
     # Relationships
     students = db.relationship("Student", back_populates="enrollments", lazy=True)
@@ -153,6 +203,31 @@ class Enrollment(db.Model):
         return f'<Enrollment: Student {self.student_id}, Course {self.course_id}>'
 
 
+class Waitlist(db.Model):
+    '''
+    Create a Waitlist table. Entries are served first come, first served
+    in waitlist_id order.
+    '''
+    __tablename__ = 'waitlists'
+    waitlist_id_seq = db.Sequence('waitlist_id_seq', start=1, increment=1)
+    waitlist_id = db.Column(db.Integer, waitlist_id_seq, server_default=waitlist_id_seq.next_value(), primary_key=True)
+
+    student_id = db.Column(db.Integer, db.ForeignKey('students.roll_no', ondelete='CASCADE'), nullable=False)
+    course_id = db.Column(db.Integer, db.ForeignKey('courses.course_id', ondelete='CASCADE'), nullable=False)
+
+    __table_args__ = (
+        db.UniqueConstraint('student_id', 'course_id', name='uq_waitlists_student_course'),
+        db.Index('ix_waitlists_course_id_waitlist_id', 'course_id', 'waitlist_id'),
+    )
+
+    # Relationships
+    students = db.relationship("Student", back_populates="waitlists", lazy=True)
+    courses = db.relationship("Course", back_populates="waitlists", lazy=True)
+
+    def __repr__(self):
+        return f'<Waitlist: Student {self.student_id}, Course {self.course_id}>'
+
+
 class Fee(db.Model):
     '''
     Create a Fee table.
@@ -161,14 +236,28 @@ class Fee(db.Model):
     fee_id_seq = db.Sequence('fee_id_seq', start=1, increment=1)
     fee_id = db.Column(db.Integer, fee_id_seq, server_default=fee_id_seq.next_value(), primary_key=True)
 
-    student_id = db.Column(db.Integer, db.ForeignKey('students.roll_no'))
-    course_id = db.Column(db.Integer, db.ForeignKey('courses.course_id'))
-    amount = db.Column(db.Float, nullable=False)
-    fee_status = db.Column(db.String(10), nullable=False)
+    # Ledger columns keep active_history so the fee summary listeners see
+    # the old value even when the instance is expired.
+    student_id = db.column_property(
+        db.Column(db.Integer, db.ForeignKey('students.roll_no', ondelete='CASCADE')), active_history=True
+    )
+    course_id = db.column_property(
+        db.Column(db.Integer, db.ForeignKey('courses.course_id', ondelete='CASCADE')), active_history=True
+    )
+    amount = db.column_property(db.Column(db.Float, nullable=False), active_history=True)
+    fee_status = db.column_property(db.Column(db.String(10), nullable=False), active_history=True)
+    term = db.column_property(db.Column(db.String(20)), active_history=True)
+    due_date = db.Column(db.Date)
 
     # Check constraints
     __table_args__ = (
         db.CheckConstraint("fee_status IN ('Paid', 'Pending')", name='check_fee_status_valid'),
+        db.Index('ix_fees_student_id_course_id', 'student_id', 'course_id'),
+        db.Index('ix_fees_student_id_fee_status', 'student_id', 'fee_status'),
+        db.Index('ix_fees_course_id', 'course_id'),
+        db.Index('ix_fees_term_fee_id', 'term', 'fee_id'),
+        # Covers the aging report, so it reads pending fees from the index.
+        db.Index('ix_fees_status_term_due_amount', 'fee_status', 'term', 'due_date', 'amount'),
     )
 
     # Relationships
@@ -179,6 +268,77 @@ class Fee(db.Model):
         return f'<Fee: Student {self.student_id}, Course {self.course_id}>'
 
 
+class ArchivedFee(db.Model):
+    '''
+    Create an ArchivedFee table.
+    Fees of retired terms, moved out of the live ledger by
+    fees.retire_term. Rows keep their original ids and are not tied to
+    students or courses, which may since have been deleted.
+    '''
+    __tablename__ = 'fees_archive'
+
+    fee_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    student_id = db.Column(db.Integer)
+    course_id = db.Column(db.Integer)
+    amount = db.Column(db.Float, nullable=False)
+    fee_status = db.Column(db.String(10), nullable=False)
+    term = db.Column(db.String(20))
+    due_date = db.Column(db.Date)
+    archived_at = db.Column(db.DateTime, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_fees_archive_term', 'term'),
+        db.Index('ix_fees_archive_student_id', 'student_id'),
+    )
+
+    def __repr__(self):
+        return f'<ArchivedFee: Student {self.student_id}, Course {self.course_id}>'
+
+
+class FeeSummary(db.Model):
+    '''
+    Create a FeeSummary table.
+    Running paid/pending totals per student, course, department and
+    overall, per term. Kept up to date by the listeners in app/fees.py.
+    '''
+    __tablename__ = 'fee_summaries'
+
+    scope = db.Column(db.String(10), primary_key=True)
+    scope_id = db.Column(db.Integer, primary_key=True)
+    term = db.Column(db.String(20), primary_key=True)
+    paid_amount = db.Column(db.Float, nullable=False, default=0)
+    paid_count = db.Column(db.Integer, nullable=False, default=0)
+    pending_amount = db.Column(db.Float, nullable=False, default=0)
+    pending_count = db.Column(db.Integer, nullable=False, default=0)
+
+    # Check constraints
+    __table_args__ = (
+        db.CheckConstraint("scope IN ('student', 'course', 'department', 'total')", name='check_scope_valid'),
+        db.Index('ix_fee_summaries_scope_pending_amount', 'scope', 'pending_amount'),
+    )
+
+    def __repr__(self):
+        return f'<FeeSummary: {self.scope} {self.scope_id} {self.term}>'
+
+
+class StatCounter(db.Model):
+    '''
+    Create a StatCounter table.
+    Row counts shown on the admin dashboard. Each counter is split over
+    a few slots so concurrent writers rarely update the same row; its
+    value is the sum of its slots. Kept up to date by app/stats.py.
+    '''
+    __tablename__ = 'stat_counters'
+
+    name = db.Column(db.String(30), primary_key=True)
+    scope_id = db.Column(db.Integer, primary_key=True)
+    slot = db.Column(db.Integer, primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<StatCounter: {self.name} {self.scope_id} {self.slot}>'
+
+
 class Department(db.Model):
     '''
     Create a Department table.
@@ -200,32 +360,231 @@ class Department(db.Model):
     def __repr__(self):
         return f'<Department: {self.dep_name}>'
 
-# class Grade(db.Model):
-#     __tablename__ = 'grade'
-#     grade_id = db.Column(db.Integer, primary_key=True)
-#     enrollment_id = db.Column(db.Integer, db.ForeignKey('enrollment.enrollment_id'))
-#     marks = db.Column(db.Integer)
-#     grade = db.Column(db.String(2))
-    
-#     __table_args__ = (
-#         db.CheckConstraint("marks BETWEEN 1 AND 100", 
-#                            name='check_marks_range'),
-#         db.CheckConstraint("grade IN ('F', 'D-', 'D', 'D+', 'C-', 'C', 'C+', 'B-', 'B', 'B+', 'A-', 'A', 'A+')",
-#                            NAME='check_grade_valid')
-#     )
-#     # Relationships
-#     enrollment = db.relationship("Enrollment", back_populates="grade", lazy=True)
-
-# class Attendance(db.Model):
-#     __tablename__ = 'attendance'
-#     attendance_id = db.Column(db.Integer, primary_key=True)
-#     enrollment_id = db.Column(db.Integer, db.ForeignKey('enrollment.enrollment_id'))
-#     date = db.Column(db.Date, nullable=False)
-#     status = db.Column(db.String(2), nullable=False)
-#     __table_args__ = (
-#         db.CheckConstraint("status IN ('P', 'A', 'L')", 
-#                            name='check_status_valid'),
-#     )
-    
-#     # Relationships
-#     enrollment = db.relationship("Enrollment", back_populates="attendance", lazy=True)
+
+class Grade(db.Model):
+    '''
+    Create a Grade table.
+    A student's result in a course. credits and points copy the course's
+    credits and the letter's grade points at grading time, so later
+    changes to the course do not rewrite transcripts.
+    '''
+    __tablename__ = 'grades'
+
+    student_id = db.Column(db.Integer, db.ForeignKey('students.roll_no', ondelete='CASCADE'), primary_key=True)
+    course_id = db.Column(db.Integer, db.ForeignKey('courses.course_id', ondelete='CASCADE'), primary_key=True)
+    term = db.Column(db.String(20), nullable=False)
+    marks = db.Column(db.Integer, nullable=False)
+    grade = db.Column(db.String(2), nullable=False)
+    points = db.Column(db.Float, nullable=False)
+    credits = db.Column(db.Integer, nullable=False)
+
+    __table_args__ = (
+        db.CheckConstraint("marks BETWEEN 0 AND 100", name='check_marks_range'),
+        db.CheckConstraint("grade IN ('F', 'D-', 'D', 'D+', 'C-', 'C', 'C+', 'B-', 'B', 'B+', 'A-', 'A', 'A+')",
+                           name='check_grade_valid'),
+        db.Index('ix_grades_course_id', 'course_id'),
+    )
+
+    def __repr__(self):
+        return f'<Grade: Student {self.student_id}, Course {self.course_id}>'
+
+
+class GpaSummary(db.Model):
+    '''
+    Create a GpaSummary table.
+    Credits and quality points (credits x grade points) per student per
+    term, plus a cumulative row under term '*' whose gpa is the CGPA.
+    Kept up to date by app/grades.py.
+    '''
+    __tablename__ = 'gpa_summaries'
+
+    student_id = db.Column(db.Integer, db.ForeignKey('students.roll_no', ondelete='CASCADE'), primary_key=True)
+    term = db.Column(db.String(20), primary_key=True)
+    credits = db.Column(db.Integer, nullable=False, default=0)
+    quality_points = db.Column(db.Float, nullable=False, default=0)
+    gpa = db.Column(db.Float)
+
+    __table_args__ = (
+        db.Index('ix_gpa_summaries_term_gpa_student_id', 'term', 'gpa', 'student_id'),
+    )
+
+    def __repr__(self):
+        return f'<GpaSummary: Student {self.student_id}, {self.term}>'
+
+
+class Room(db.Model):
+    '''
+    Create a Room table.
+    '''
+    __tablename__ = 'rooms'
+    room_id_seq = db.Sequence('room_id_seq', start=1, increment=1)
+    room_id = db.Column(db.Integer, room_id_seq, server_default=room_id_seq.next_value(), primary_key=True)
+
+    name = db.Column(db.String(50), unique=True, nullable=False)
+    capacity = db.Column(db.Integer, nullable=False)
+
+    __table_args__ = (
+        db.CheckConstraint("capacity > 0", name='check_room_capacity_valid'),
+    )
+
+    def __repr__(self):
+        return f'<Room: {self.name}>'
+
+
+class TimeSlot(db.Model):
+    '''
+    Create a TimeSlot table.
+    A weekly teaching period: day 0 is Monday and times are minutes after
+    midnight. Slots may overlap; app/timetable.py works out which do.
+    '''
+    __tablename__ = 'time_slots'
+    slot_id_seq = db.Sequence('slot_id_seq', start=1, increment=1)
+    slot_id = db.Column(db.Integer, slot_id_seq, server_default=slot_id_seq.next_value(), primary_key=True)
+
+    day = db.Column(db.Integer, nullable=False)
+    starts_at = db.Column(db.Integer, nullable=False)
+    ends_at = db.Column(db.Integer, nullable=False)
+
+    __table_args__ = (
+        db.CheckConstraint("day BETWEEN 0 AND 6", name='check_slot_day_valid'),
+        db.CheckConstraint("starts_at >= 0 AND ends_at > starts_at AND ends_at <= 1440", name='check_slot_times_valid'),
+        db.UniqueConstraint('day', 'starts_at', 'ends_at', name='uq_time_slots_day_times'),
+    )
+
+    def __repr__(self):
+        return f'<TimeSlot: {self.day} {self.starts_at}-{self.ends_at}>'
+
+
+class Section(db.Model):
+    '''
+    Create a Section table.
+    One weekly meeting of a course; a course has one section per credit
+    and every enrolled student attends all of them. slot_id and room_id
+    are filled in by the timetable solver.
+    '''
+    __tablename__ = 'sections'
+    section_id_seq = db.Sequence('section_id_seq', start=1, increment=1)
+    section_id = db.Column(db.Integer, section_id_seq, server_default=section_id_seq.next_value(), primary_key=True)
+
+    course_id = db.Column(db.Integer, db.ForeignKey('courses.course_id', ondelete='CASCADE'), nullable=False)
+    slot_id = db.Column(db.Integer, db.ForeignKey('time_slots.slot_id', ondelete='SET NULL'))
+    room_id = db.Column(db.Integer, db.ForeignKey('rooms.room_id', ondelete='SET NULL'))
+
+    __table_args__ = (
+        db.UniqueConstraint('slot_id', 'room_id', name='uq_sections_slot_room'),
+        db.Index('ix_sections_course_id', 'course_id'),
+    )
+
+    def __repr__(self):
+        return f'<Section: Course {self.course_id}, Slot {self.slot_id}>'
+
+
+class AttendanceSession(db.Model):
+    '''
+    Create an AttendanceSession table.
+    One row per class meeting. session_no numbers a course's meetings
+    within a term from 0 and is the position of the meeting in each
+    student's attendance bitmap.
+    '''
+    __tablename__ = 'attendance_sessions'
+    session_id_seq = db.Sequence('attendance_session_id_seq', start=1, increment=1)
+    session_id = db.Column(db.Integer, session_id_seq, server_default=session_id_seq.next_value(), primary_key=True)
+
+    course_id = db.Column(db.Integer, db.ForeignKey('courses.course_id', ondelete='CASCADE'), nullable=False)
+    term = db.Column(db.String(20), nullable=False)
+    held_on = db.Column(db.Date, nullable=False)
+    session_no = db.Column(db.Integer, nullable=False)
+
+    __table_args__ = (
+        db.UniqueConstraint('course_id', 'term', 'held_on', name='uq_attendance_sessions_course_term_date'),
+        db.UniqueConstraint('course_id', 'term', 'session_no', name='uq_attendance_sessions_course_term_no'),
+    )
+
+    def __repr__(self):
+        return f'<AttendanceSession: Course {self.course_id}, {self.held_on}>'
+
+
+class Attendance(db.Model):
+    '''
+    Create an Attendance table.
+    One row per enrollment per term rather than per day: marks packs two
+    bits per session (see app/attendance.py) and the present, late and
+    absent counts are kept alongside, so percentages never count rows.
+    '''
+    __tablename__ = 'attendance'
+
+    enrollment_id = db.Column(db.Integer, db.ForeignKey('enrollments.enrollment_id', ondelete='CASCADE'), primary_key=True)
+    term = db.Column(db.String(20), primary_key=True)
+    marks = db.Column(db.LargeBinary, nullable=False)
+    present = db.Column(db.Integer, nullable=False, default=0)
+    late = db.Column(db.Integer, nullable=False, default=0)
+    absent = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<Attendance: Enrollment {self.enrollment_id}, {self.term}>'
+
+
+class Job(db.Model):
+    '''
+    Create a Job table.
+    Slow admin work queued for the background workers in app/jobs.py.
+    The table is the queue: workers claim queued rows whose run_at has
+    come, report progress on them and record the result or error.
+    '''
+    __tablename__ = 'jobs'
+    job_id_seq = db.Sequence('job_id_seq', start=1, increment=1)
+    job_id = db.Column(db.Integer, job_id_seq, server_default=job_id_seq.next_value(), primary_key=True)
+
+    kind = db.Column(db.String(50), nullable=False)
+    params = db.Column(db.Text, nullable=False, default='{}')
+    payload = db.Column(db.LargeBinary)
+    status = db.Column(db.String(10), nullable=False, default='queued')
+    description = db.Column(db.String(200), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='SET NULL'))
+
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=1)
+    cancel_requested = db.Column(db.Boolean, nullable=False, default=False)
+    done = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Integer)
+    message = db.Column(db.String(200))
+    result = db.Column(db.Text)
+    error = db.Column(db.Text)
+    worker = db.Column(db.String(100))
+
+    created_at = db.Column(db.DateTime, nullable=False)
+    run_at = db.Column(db.DateTime, nullable=False)
+    started_at = db.Column(db.DateTime)
+    heartbeat_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.CheckConstraint(
+            "status IN ('queued', 'running', 'succeeded', 'failed', 'cancelled')", name='check_job_status_valid'
+        ),
+        db.Index('ix_jobs_status_run_at', 'status', 'run_at', 'job_id'),
+    )
+
+    def __repr__(self):
+        return f'<Job: {self.job_id} {self.kind} {self.status}>'
+
+class UserSession(db.Model):
+    '''
+    Create a UserSession table.
+    Server-side browser sessions kept by app/sessions.py. The cookie only
+    holds a random session id; rows are keyed by its SHA-256 so a copy
+    of the table cannot be replayed as cookies.
+    '''
+    __tablename__ = 'sessions'
+    session_key = db.Column(db.String(64), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'))
+    data = db.Column(db.Text, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_sessions_user_id', 'user_id'),
+        db.Index('ix_sessions_expires_at', 'expires_at'),
+    )
+
+    def __repr__(self):
+        return f'<UserSession: {self.user_id} {self.expires_at}>'
@@ -0,0 +1,117 @@
+# app/pagination.py
+
+import base64
+import json
+
+from sqlalchemy import and_, or_
+
+from . import db
+
+PER_PAGE = 50
+
+# JSON types a cursor's sort value and key may decode to.
+SCALARS = (str, int, float, type(None))
+
+class InvalidCursor(ValueError):
+    '''
+    Raised when a pagination cursor cannot be decoded.
+    '''
+
+def encode_cursor(value, key, direction):
+    '''
+    Encode the boundary (sort value, primary key) of a page into an
+    opaque, URL-safe cursor.
+    '''
+
+    raw = json.dumps([value, key, direction], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    '''
+    Decode a cursor created by encode_cursor. Cursors come from the
+    client, so anything but scalar boundaries and a known direction is
+    rejected before it reaches a query.
+    '''
+
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        value, key, direction = json.loads(base64.urlsafe_b64decode(padded))
+    except (ValueError, TypeError):
+        raise InvalidCursor(cursor)
+
+    if not isinstance(value, SCALARS) or not isinstance(key, SCALARS) or direction not in ('next', 'prev'):
+        raise InvalidCursor(cursor)
+    return value, key, direction
+
+class Page(object):
+    '''
+    A single page of a keyset-paginated listing.
+    '''
+
+    def __init__(self, items, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+def _after(sort_column, key_column, value, key, descending):
+    '''
+    Build the "strictly after (value, key)" predicate for the given order.
+    Expanded instead of a row-value comparison so it works on every backend.
+    When sorting by the key itself a plain range keeps the index usable.
+    '''
+
+    if sort_column is key_column:
+        return key_column < key if descending else key_column > key
+    if descending:
+        return or_(sort_column < value, and_(sort_column == value, key_column < key))
+    return or_(sort_column > value, and_(sort_column == value, key_column > key))
+
+def paginate(stmt, sort_column, key_column, cursor=None, per_page=PER_PAGE, descending=False):
+    '''
+    Apply keyset pagination to a select statement ordered by
+    (sort_column, key_column). The cost of a page does not depend on how
+    deep into the listing it is.
+    '''
+
+    width = len(stmt.column_descriptions)
+    backwards = False
+
+    if cursor:
+        value, key, direction = decode_cursor(cursor)
+        backwards = direction == 'prev'
+        stmt = stmt.where(_after(sort_column, key_column, value, key, descending != backwards))
+
+    order = [key_column] if sort_column is key_column else [sort_column, key_column]
+    if descending != backwards:
+        stmt = stmt.order_by(*[column.desc() for column in order])
+    else:
+        stmt = stmt.order_by(*[column.asc() for column in order])
+
+    stmt = stmt.add_columns(sort_column, key_column).limit(per_page + 1)
+    rows = db.session.execute(stmt).all()
+
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+
+    items = [row[0] if width == 1 else tuple(row[:width]) for row in rows]
+    if not rows:
+        return Page(items)
+
+    first, last = rows[0], rows[-1]
+    next_cursor = prev_cursor = None
+    if has_more or backwards:
+        next_cursor = encode_cursor(last[-2], last[-1], 'next')
+    if cursor and (has_more or not backwards):
+        prev_cursor = encode_cursor(first[-2], first[-1], 'prev')
+
+    return Page(items, next_cursor=next_cursor, prev_cursor=prev_cursor)
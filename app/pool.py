@@ -0,0 +1,151 @@
+# app/pool.py
+
+import threading
+import time
+
+from sqlalchemy import event, exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import NullPool, QueuePool
+
+class MeteredQueuePool(QueuePool):
+    '''
+    QueuePool that records how long each checkout waited for a
+    connection, including time spent opening a new one or pre-pinging
+    an idle one, how many checkouts timed out and how many connections
+    were opened.
+    '''
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._metrics_lock = threading.Lock()
+        self.waits = 0
+        self.wait_time = 0.0
+        self.max_wait = 0.0
+        self.timeouts = 0
+        self.connects = 0
+        self.invalidations = 0
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            with self._metrics_lock:
+                self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            with self._metrics_lock:
+                self.waits += 1
+                self.wait_time += waited
+                self.max_wait = max(self.max_wait, waited)
+
+    def _create_connection(self):
+        with self._metrics_lock:
+            self.connects += 1
+        return super()._create_connection()
+
+def _in_memory_sqlite(uri):
+    url = make_url(uri)
+    return url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')
+
+def engine_options(config):
+    '''
+    Build SQLALCHEMY_ENGINE_OPTIONS from the DB_POOL_* settings.
+    Options already set in SQLALCHEMY_ENGINE_OPTIONS take precedence.
+    '''
+
+    options = {}
+    uri = config.get('SQLALCHEMY_DATABASE_URI') or 'sqlite://'
+
+    if config.get('DB_DISABLE_POOL'):
+        # Leave pooling to an external pooler such as PgBouncer: every
+        # checkout opens a connection and every checkin closes it.
+        options['poolclass'] = NullPool
+    elif not _in_memory_sqlite(uri):
+        options.update(
+            poolclass=MeteredQueuePool,
+            pool_size=config.get('DB_POOL_SIZE', 5),
+            max_overflow=config.get('DB_MAX_OVERFLOW', 10),
+            pool_timeout=config.get('DB_POOL_TIMEOUT', 30),
+            pool_recycle=config.get('DB_POOL_RECYCLE', -1),
+            pool_use_lifo=config.get('DB_POOL_USE_LIFO', False)
+        )
+    options['pool_pre_ping'] = config.get('DB_POOL_PRE_PING', False)
+
+    options.update(config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    return options
+
+def _statement_timeout_setter(timeout_ms):
+    '''
+    Return a connect listener applying a per-statement time limit on
+    backends that support one. SQLite has no statement timeout.
+    '''
+
+    def set_timeout(dbapi_connection, connection_record):
+        module = type(dbapi_connection).__module__
+        if module.startswith(('cx_Oracle', 'oracledb')):
+            dbapi_connection.call_timeout = timeout_ms
+            return
+
+        statement = None
+        if module.startswith(('psycopg', 'pg8000', 'asyncpg')):
+            statement = f'SET statement_timeout = {int(timeout_ms)}'
+        elif module.startswith(('MySQLdb', 'pymysql', 'mysql')):
+            statement = f'SET SESSION max_execution_time = {int(timeout_ms)}'
+
+        if statement is not None:
+            cursor = dbapi_connection.cursor()
+            cursor.execute(statement)
+            cursor.close()
+            # Do not leave the SET inside an open transaction.
+            dbapi_connection.commit()
+
+    return set_timeout
+
+def configure_engine(engine, config):
+    '''
+    Attach the statement timeout and connection counters to an engine.
+    '''
+
+    timeout_ms = config.get('DB_STATEMENT_TIMEOUT_MS')
+    if timeout_ms:
+        event.listen(engine, 'connect', _statement_timeout_setter(timeout_ms))
+
+    @event.listens_for(engine, 'invalidate')
+    def count_invalidation(dbapi_connection, connection_record, exception):
+        # engine.pool is looked up on each call; dispose() replaces it.
+        pool = engine.pool
+        if isinstance(pool, MeteredQueuePool):
+            with pool._metrics_lock:
+                pool.invalidations += 1
+
+def pool_status(engines):
+    '''
+    Return live metrics for each named engine's pool.
+    '''
+
+    rows = []
+    for name, engine in engines.items():
+        pool = engine.pool
+        row = {'name': name or 'default', 'pool': type(pool).__name__}
+        if isinstance(pool, QueuePool):
+            row.update(
+                size=pool.size(),
+                checked_in=pool.checkedin(),
+                checked_out=pool.checkedout(),
+                overflow=max(pool.overflow(), 0),
+                max_overflow=pool._max_overflow
+            )
+        if isinstance(pool, MeteredQueuePool):
+            with pool._metrics_lock:
+                row.update(
+                    checkouts=pool.waits,
+                    avg_wait_ms=round(pool.wait_time / pool.waits * 1000.0, 3) if pool.waits else 0.0,
+                    max_wait_ms=round(pool.max_wait * 1000.0, 3),
+                    timeouts=pool.timeouts,
+                    connects=pool.connects,
+                    invalidations=pool.invalidations
+                )
+        rows.append(row)
+    return rows
@@ -0,0 +1,112 @@
+# app/queries.py
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import contains_eager, joinedload
+
+from . import db
+from .models import Course, Enrollment, Fee, Student, Teacher, User
+from .pagination import PER_PAGE, paginate
+
+# Sortable columns for each listing. Each listing is ordered by the chosen
+# column with its primary key as the tie-breaker. Name sorts break ties on
+# users.id instead, so the (last_name, id) index serves the ordering.
+STUDENT_SORTS = {'roll_no': Student.roll_no, 'name': User.last_name}
+TEACHER_SORTS = {'teacher_id': Teacher.teacher_id, 'name': User.last_name}
+COURSE_SORTS = {'course_id': Course.course_id, 'name': Course.course_name, 'credits': Course.credits}
+USER_SORTS = {'id': User.id, 'email': User.email, 'username': User.username}
+
+def _counts(column, keys):
+    '''
+    Count the rows referencing each of keys through the given foreign key
+    column with one grouped query limited to those keys.
+    '''
+
+    if not keys:
+        return {}
+
+    stmt = select(column, func.count()).where(column.in_(keys)).group_by(column)
+    return dict(db.session.execute(stmt).all())
+
+def list_students(department_id=None, sort='roll_no', descending=False, cursor=None, per_page=PER_PAGE):
+    '''
+    Fetch a page of students with their user and department eagerly
+    loaded, along with their enrollment and fee counts.
+    Items are (student, enrollment_count, fee_count) rows.
+    '''
+
+    stmt = (
+        select(Student)
+        .join(Student.users)
+        .options(contains_eager(Student.users), joinedload(Student.departments))
+    )
+    if department_id is not None:
+        stmt = stmt.where(Student.department_id == department_id)
+
+    sort_column = STUDENT_SORTS.get(sort, Student.roll_no)
+    key_column = User.id if sort_column is User.last_name else Student.roll_no
+    page = paginate(stmt, sort_column, key_column, cursor, per_page, descending)
+
+    roll_nos = [student.roll_no for student in page.items]
+    enrollments = _counts(Enrollment.student_id, roll_nos)
+    fees = _counts(Fee.student_id, roll_nos)
+    page.items = [
+        (student, enrollments.get(student.roll_no, 0), fees.get(student.roll_no, 0))
+        for student in page.items
+    ]
+    return page
+
+def list_teachers(speciality=None, sort='teacher_id', descending=False, cursor=None, per_page=PER_PAGE):
+    '''
+    Fetch a page of teachers with their user eagerly loaded, along with
+    the number of courses assigned to each.
+    Items are (teacher, course_count) rows.
+    '''
+
+    stmt = (
+        select(Teacher)
+        .join(Teacher.users)
+        .options(contains_eager(Teacher.users))
+    )
+    if speciality is not None:
+        stmt = stmt.where(Teacher.speciality == speciality)
+
+    sort_column = TEACHER_SORTS.get(sort, Teacher.teacher_id)
+    key_column = User.id if sort_column is User.last_name else Teacher.teacher_id
+    page = paginate(stmt, sort_column, key_column, cursor, per_page, descending)
+
+    courses = _counts(Course.teacher_id, [teacher.teacher_id for teacher in page.items])
+    page.items = [(teacher, courses.get(teacher.teacher_id, 0)) for teacher in page.items]
+    return page
+
+def list_courses(teacher_id=None, credits=None, sort='course_id', descending=False, cursor=None, per_page=PER_PAGE):
+    '''
+    Fetch a page of courses with their instructor and the instructor's
+    user eagerly loaded.
+    '''
+
+    stmt = select(Course).options(joinedload(Course.teachers).joinedload(Teacher.users))
+    if teacher_id is not None:
+        stmt = stmt.where(Course.teacher_id == teacher_id)
+    if credits is not None:
+        stmt = stmt.where(Course.credits == credits)
+
+    sort_column = COURSE_SORTS.get(sort, Course.course_id)
+    return paginate(stmt, sort_column, Course.course_id, cursor, per_page, descending)
+
+def list_users(status=False, role=None, email_domain=None, sort='id', descending=False, cursor=None, per_page=PER_PAGE):
+    '''
+    Fetch a page of users filtered by verification status, role and
+    email domain. Passing status=None lists users regardless of
+    verification.
+    '''
+
+    stmt = select(User)
+    if status is not None:
+        stmt = stmt.where(User.status == status)
+    if role is not None:
+        stmt = stmt.where(User.role == role)
+    if email_domain:
+        stmt = stmt.where(User.email.like('%@' + email_domain.lstrip('@')))
+
+    sort_column = USER_SORTS.get(sort, User.id)
+    return paginate(stmt, sort_column, User.id, cursor, per_page, descending)
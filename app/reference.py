@@ -0,0 +1,201 @@
+# app/reference.py
+
+import threading
+import time
+from collections import namedtuple
+
+from sqlalchemy import event, exc, inspect, select
+from sqlalchemy.orm import Session
+
+from . import db
+from .cache import connect_store
+from .models import Course, Department, Teacher, User
+
+# Specialities allowed by the teachers check constraint.
+SPECIALITIES = ('CS', 'NS', 'AI', 'EE', 'MG', 'MT')
+
+STALE_KEY = 'reference_data.stale'
+
+DepartmentRow = namedtuple('DepartmentRow', 'dep_id dep_name')
+
+class Snapshot(object):
+    '''
+    One consistent load of the reference tables, never modified after
+    it is built.
+    '''
+
+    def __init__(self, version, departments, teachers, courses):
+        self.version = version
+        self.loaded_at = time.monotonic()
+        self.departments = departments
+        self.department_names = {row.dep_id: row.dep_name for row in departments}
+        self.teachers = teachers
+        self.courses = courses
+
+class ReferenceData(object):
+    '''
+    In-memory copy of small, rarely changing tables: departments,
+    teacher names and course names, for form validation, select
+    choices and labels.
+
+    The copy is tagged with a version number. Committed changes to
+    those tables through the ORM bump the version, and code writing
+    them with bulk statements calls invalidate(). With
+    REFERENCE_DATA_URL set the version lives in a shared store, so
+    every worker reloads after an edit in any of them; otherwise other
+    workers reload once their copy is REFERENCE_DATA_TTL seconds old.
+    '''
+
+    def __init__(self):
+        self.shared = None
+        self.ttl = 300
+        self.check_interval = 1
+        self.key = 'reference:version'
+        self.version = 0
+        self.loads = 0
+        self._snapshot = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.shared = connect_store(app.config.get('REFERENCE_DATA_URL'))
+        self.ttl = app.config.get('REFERENCE_DATA_TTL', 300)
+        self.check_interval = app.config.get('REFERENCE_DATA_CHECK_INTERVAL', 1)
+        self._snapshot = None
+
+        if app.config.get('REFERENCE_DATA_PRELOAD', True):
+            with app.app_context():
+                try:
+                    self.snapshot()
+                except exc.DBAPIError:
+                    # The schema may not exist yet (e.g. before create_all);
+                    # load on first use instead.
+                    app.logger.info('Reference data not preloaded; loading on first use.')
+
+    def _current_version(self):
+        '''
+        Return the latest version, asking the shared store at most once
+        per check interval.
+        '''
+
+        if self.shared is None:
+            return self.version
+
+        now = time.monotonic()
+        if now - self._checked_at >= self.check_interval:
+            self._checked_at = now
+            self.version = int(self.shared.get(self.key) or 0)
+        return self.version
+
+    def _load(self, version):
+        with db.engine.connect() as connection:
+            departments = [
+                DepartmentRow(*row) for row in
+                connection.execute(select(Department.dep_id, Department.dep_name).order_by(Department.dep_name))
+            ]
+            teachers = dict(connection.execute(
+                select(Teacher.teacher_id, User.first_name + ' ' + User.last_name)
+                .join(User, Teacher.user_id == User.id)
+                .order_by(Teacher.teacher_id)
+            ).all())
+            courses = dict(connection.execute(select(Course.course_id, Course.course_name)).all())
+        self.loads += 1
+        return Snapshot(version, departments, teachers, courses)
+
+    def snapshot(self):
+        '''
+        Return the current snapshot, reloading it when its version is
+        out of date or it has outlived the TTL.
+        '''
+
+        version = self._current_version()
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.version == version \
+                and time.monotonic() - snapshot.loaded_at < self.ttl:
+            return snapshot
+
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is None or snapshot.version != version \
+                    or time.monotonic() - snapshot.loaded_at >= self.ttl:
+                # Tag the load with the version read before it, so a change
+                # committed while loading triggers another load.
+                snapshot = self._snapshot = self._load(version)
+        return snapshot
+
+    def invalidate(self):
+        '''
+        Start a new version; every worker reloads on its next access.
+        '''
+
+        if self.shared is not None:
+            self.version = int(self.shared.incr(self.key))
+            self._checked_at = time.monotonic()
+        else:
+            self.version += 1
+
+    def department_choices(self):
+        return [(row.dep_id, row.dep_name) for row in self.snapshot().departments]
+
+    def departments(self):
+        return self.snapshot().departments
+
+    def department_names(self):
+        return self.snapshot().department_names
+
+    def has_department(self, dep_id):
+        return dep_id in self.snapshot().department_names
+
+    def teacher_choices(self):
+        return [(teacher_id, f'{name} ({teacher_id})') for teacher_id, name in self.snapshot().teachers.items()]
+
+    def has_teacher(self, teacher_id):
+        return teacher_id in self.snapshot().teachers
+
+    def course_names(self):
+        return self.snapshot().courses
+
+    def stats(self):
+        snapshot = self._snapshot
+        return {
+            'version': self.version,
+            'loads': self.loads,
+            'departments': len(snapshot.departments) if snapshot else 0,
+            'teachers': len(snapshot.teachers) if snapshot else 0,
+            'courses': len(snapshot.courses) if snapshot else 0
+        }
+
+reference_data = ReferenceData()
+
+def _mark_stale(mapper, connection, target):
+    inspect(target).session.info[STALE_KEY] = True
+
+def _watch(model, attributes=None, inserts=True):
+    '''
+    Mark the committing session stale when a row of model is inserted or
+    deleted, or updated in one of attributes (any column when None).
+    '''
+
+    def updated(mapper, connection, target):
+        state = inspect(target)
+        if attributes is None or any(state.attrs[name].history.has_changes() for name in attributes):
+            _mark_stale(mapper, connection, target)
+
+    if inserts:
+        event.listen(model, 'after_insert', _mark_stale)
+        event.listen(model, 'after_delete', _mark_stale)
+    event.listen(model, 'after_update', updated)
+
+_watch(Department)
+_watch(Teacher, attributes=())
+_watch(Course, attributes=('course_name',))
+_watch(User, attributes=('first_name', 'last_name'), inserts=False)
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_committed(session):
+    if session.info.pop(STALE_KEY, False):
+        reference_data.invalidate()
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_stale(session):
+    session.info.pop(STALE_KEY, None)
@@ -0,0 +1,254 @@
+# app/replica.py
+
+import functools
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from flask import current_app, g, has_app_context, has_request_context, request, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, exc
+
+# Bind key of the read replica engine in SQLALCHEMY_BINDS.
+REPLICA_BIND = 'replica'
+
+# Browser session key holding the time until which reads stay on the primary.
+STICKY_KEY = '_db_primary_until'
+
+def _routed():
+    return has_app_context() and g.get('read_replica', False)
+
+def _is_read(clause):
+    '''
+    Plain SELECTs may go to the replica; locking reads, text() and
+    anything else go to the primary.
+    '''
+
+    return getattr(clause, 'is_select', False) and getattr(clause, '_for_update_arg', None) is None
+
+class RoutingSession(Session):
+    '''
+    Session that sends SELECTs to the read replica while the current
+    request is routed there (see replica_reads). Flushes and DML go to
+    the primary, and once the session has written, its later reads in
+    the same request do too.
+    '''
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and _is_read(clause):
+            if _routed() and not self.info.get('wrote'):
+                return self._db.engines[REPLICA_BIND]
+        elif bind is None:
+            self.info['wrote'] = True
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _committed(session):
+    # Remember the write so the browser session reads its own writes.
+    if session.info.pop('wrote', False) and has_request_context():
+        g.db_wrote = True
+
+@event.listens_for(RoutingSession, 'after_soft_rollback')
+def _rolled_back(session, previous_transaction):
+    if previous_transaction.parent is None:
+        session.info.pop('wrote', None)
+
+def replica_binds(config):
+    '''
+    Return SQLALCHEMY_BINDS with the replica from DB_REPLICA_URL added,
+    using the same pool settings as the primary.
+    '''
+
+    from .pool import engine_options
+
+    binds = dict(config.get('SQLALCHEMY_BINDS') or {})
+    url = config.get('DB_REPLICA_URL')
+    if url:
+        options = engine_options(dict(config, SQLALCHEMY_DATABASE_URI=url))
+        binds[REPLICA_BIND] = dict(options, url=url)
+    return binds
+
+def copy_sqlite(primary, replica):
+    '''
+    Copy one SQLite database file over another with the online backup
+    API, standing in for replication when trying the routing locally.
+    '''
+
+    source = sqlite3.connect(primary)
+    target = sqlite3.connect(replica)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+
+def _sqlite_lag(connection):
+    # A SQLite "replica" is a copy refreshed by flask sync-replica; it is
+    # at most as stale as the time since the copy was written.
+    database = connection.engine.url.database
+    if database in (None, '', ':memory:'):
+        return 0.0
+    return max(time.time() - os.path.getmtime(database), 0.0)
+
+def _postgresql_lag(connection):
+    # NULL on a standby that has not replayed anything yet.
+    lag = connection.exec_driver_sql(
+        'SELECT CASE WHEN pg_is_in_recovery() '
+        'THEN EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) ELSE 0 END'
+    ).scalar()
+    return None if lag is None else float(lag)
+
+def _mysql_lag(connection):
+    row = connection.exec_driver_sql('SHOW REPLICA STATUS').mappings().first()
+    if row is None:
+        return 0.0
+    # NULL while the replication threads are stopped.
+    lag = row.get('Seconds_Behind_Source', row.get('Seconds_Behind_Master'))
+    return None if lag is None else float(lag)
+
+def _oracle_lag(connection):
+    value = connection.exec_driver_sql("SELECT value FROM v$dataguard_stats WHERE name = 'apply lag'").scalar()
+    if value is None:
+        return 0.0
+    match = re.match(r'\+(\d+) (\d+):(\d+):(\d+)', value)
+    if match is None:
+        return None
+    days, hours, minutes, seconds = (int(part) for part in match.groups())
+    return float(((days * 24 + hours) * 60 + minutes) * 60 + seconds)
+
+LAG_CHECKS = {
+    'sqlite': _sqlite_lag,
+    'postgresql': _postgresql_lag,
+    'mysql': _mysql_lag,
+    'mariadb': _mysql_lag,
+    'oracle': _oracle_lag,
+}
+
+class ReplicaRouter(object):
+    '''
+    Decides, per request, whether reads may be served by the read
+    replica.
+
+    A request is routed to the replica when its view is marked with
+    replica_reads, it is a GET, the replica's measured lag is within
+    DB_REPLICA_MAX_LAG seconds and the browser session has not written
+    recently. A request that commits a write pins its browser session to
+    the primary for DB_REPLICA_MAX_LAG plus DB_REPLICA_LAG_CHECK_INTERVAL
+    seconds, after which any replica in use has caught up with the write.
+    '''
+
+    def __init__(self):
+        self.enabled = False
+        self.max_lag = 5
+        self.interval = 1
+        self.lag = None
+        self.checked_at = None
+        self.replica_requests = 0
+        self.primary_requests = 0
+        self._lock = threading.Lock()
+        self._metrics_lock = threading.Lock()
+
+    def init_app(self, app):
+        self.enabled = REPLICA_BIND in app.config.get('SQLALCHEMY_BINDS', {})
+        self.max_lag = app.config.get('DB_REPLICA_MAX_LAG', 5)
+        self.interval = app.config.get('DB_REPLICA_LAG_CHECK_INTERVAL', 1)
+        self.lag = None
+        self.checked_at = None
+        self.logger = app.logger
+
+        app.after_request(self._remember_writes)
+
+    def _remember_writes(self, response):
+        if g.pop('db_wrote', False) and self.enabled:
+            session[STICKY_KEY] = time.time() + self.max_lag + self.interval
+        return response
+
+    def sticky(self):
+        '''
+        Whether the browser session wrote recently enough that the
+        replica may not show the write yet.
+        '''
+
+        until = session.get(STICKY_KEY)
+        if until is None:
+            return False
+        if until > time.time():
+            return True
+        session.pop(STICKY_KEY)
+        return False
+
+    def measure_lag(self):
+        '''
+        Ask the replica how far behind it is, in seconds. Returns None
+        when it cannot tell or is unreachable.
+        '''
+
+        engine = current_app.extensions['sqlalchemy'].engines[REPLICA_BIND]
+        check = LAG_CHECKS.get(engine.dialect.name)
+        if check is None:
+            return 0.0
+        try:
+            with engine.connect() as connection:
+                return check(connection)
+        except (exc.DBAPIError, OSError) as e:
+            self.logger.warning('Read replica lag check failed: %s', e)
+            return None
+
+    def current_lag(self):
+        '''
+        Return the replica lag, measuring it at most once per interval.
+        Only one request measures; the others use the last value.
+        '''
+
+        now = time.monotonic()
+        if self.checked_at is None or now - self.checked_at >= self.interval:
+            if self._lock.acquire(blocking=False):
+                try:
+                    self.lag = self.measure_lag()
+                    self.checked_at = time.monotonic()
+                finally:
+                    self._lock.release()
+        return self.lag
+
+    def use_replica(self):
+        '''
+        Decide whether the current request may read from the replica.
+        '''
+
+        if not self.enabled or request.method != 'GET':
+            return False
+
+        lag = None if self.sticky() else self.current_lag()
+        routed = lag is not None and lag <= self.max_lag
+        with self._metrics_lock:
+            if routed:
+                self.replica_requests += 1
+            else:
+                self.primary_requests += 1
+        return routed
+
+    def stats(self):
+        with self._metrics_lock:
+            return {
+                'enabled': self.enabled,
+                'lag': None if self.lag is None else round(self.lag, 3),
+                'max_lag': self.max_lag,
+                'replica_requests': self.replica_requests,
+                'primary_requests': self.primary_requests
+            }
+
+replica_router = ReplicaRouter()
+
+def replica_reads(view):
+    '''
+    Let a read-only GET view be served from the read replica.
+    '''
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        g.read_replica = replica_router.use_replica()
+        return view(*args, **kwargs)
+
+    return wrapper
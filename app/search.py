@@ -0,0 +1,430 @@
+# app/search.py
+
+import bisect
+import heapq
+import re
+import threading
+import time
+
+from flask import current_app
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session, aliased
+
+from . import db
+from .models import Course, Student, Teacher, User
+
+PEOPLE = 'people'
+COURSES = 'courses'
+KINDS = (PEOPLE, COURSES)
+
+STALE_KEY = 'search_index.stale'
+
+# Query terms shorter than this are only matched exactly or by prefix.
+FUZZY_MIN_LENGTH = 4
+
+_WORD = re.compile(r'[0-9a-z]+')
+
+def tokenize(text):
+    '''
+    Split text into lowercase alphanumeric tokens, so "ali.khan" yields
+    ali and khan.
+    '''
+
+    return _WORD.findall(str(text).lower()) if text is not None else []
+
+def _mailbox(email):
+    # The domain is shared by almost everyone, so only the part before
+    # the "@" is searchable.
+    return email.partition('@')[0] if email else email
+
+def _trigrams(token):
+    # Only words get fuzzy matching; numbers and ids must match exactly
+    # or by prefix. Padded at the start only, so shared trigrams favour
+    # shared prefixes.
+    if not token.isalpha():
+        return ()
+    padded = '$$' + token
+    return {padded[i:i + 3] for i in range(len(token))}
+
+def _distance(a, b, limit):
+    '''
+    Levenshtein distance between a and b, or limit + 1 once it is known
+    to exceed limit.
+    '''
+
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, x in enumerate(a, 1):
+        current = [i]
+        for j, y in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (x != y)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+class Document(object):
+    '''
+    A searchable record: its label, the fields shown in results and the
+    tokens it is found by.
+    '''
+
+    __slots__ = ('id', 'label', 'fields', 'tokens')
+
+    def __init__(self, id, label, fields, tokens):
+        self.id = id
+        self.label = label
+        self.fields = fields
+        self.tokens = frozenset(tokens)
+
+class InvertedIndex(object):
+    '''
+    Token -> document postings with a sorted vocabulary for prefix
+    lookups and a trigram index over the vocabulary for fuzzy lookups.
+    Not thread-safe; SearchIndex guards it.
+    '''
+
+    def __init__(self):
+        self.docs = {}
+        self.postings = {}
+        self.vocabulary = []
+        self.grams = {}
+
+    def load(self, docs):
+        '''
+        Fill an empty index, sorting the vocabulary once rather than
+        inserting token by token.
+        '''
+
+        for doc in docs:
+            self.docs[doc.id] = doc
+            for token in doc.tokens:
+                ids = self.postings.get(token)
+                if ids is None:
+                    ids = self.postings[token] = set()
+                ids.add(doc.id)
+
+        self.vocabulary = sorted(self.postings)
+        for token in self.vocabulary:
+            for gram in _trigrams(token):
+                self.grams.setdefault(gram, set()).add(token)
+
+    def add(self, doc):
+        self.remove(doc.id)
+        self.docs[doc.id] = doc
+        for token in doc.tokens:
+            ids = self.postings.get(token)
+            if ids is None:
+                ids = self.postings[token] = set()
+                bisect.insort(self.vocabulary, token)
+                for gram in _trigrams(token):
+                    self.grams.setdefault(gram, set()).add(token)
+            ids.add(doc.id)
+
+    def remove(self, doc_id):
+        doc = self.docs.pop(doc_id, None)
+        if doc is None:
+            return
+        for token in doc.tokens:
+            ids = self.postings[token]
+            ids.discard(doc_id)
+            if not ids:
+                del self.postings[token]
+                del self.vocabulary[bisect.bisect_left(self.vocabulary, token)]
+                for gram in _trigrams(token):
+                    tokens = self.grams[gram]
+                    tokens.discard(token)
+                    if not tokens:
+                        del self.grams[gram]
+
+    def _prefixed(self, term):
+        start = bisect.bisect_left(self.vocabulary, term)
+        end = bisect.bisect_left(self.vocabulary, term + '\uffff', start)
+        return self.vocabulary[start:end]
+
+    def _fuzzy(self, term):
+        '''
+        Tokens whose start is within one edit of term (two for long
+        terms), found through shared trigrams.
+        '''
+
+        limit = 1 if len(term) < 8 else 2
+        grams = _trigrams(term)
+        if not grams:
+            return set()
+        shared = {}
+        for gram in grams:
+            for token in self.grams.get(gram, ()):
+                shared[token] = shared.get(token, 0) + 1
+
+        # An edit changes at most three trigrams.
+        needed = max(1, len(grams) - 3 * limit)
+        found = set()
+        for token, count in shared.items():
+            if count < needed:
+                continue
+            if min(_distance(term, token[:len(term) + delta], limit) for delta in (-1, 0, 1)) <= limit:
+                found.add(token)
+        return found
+
+    def search(self, query, limit):
+        '''
+        Return up to limit documents matching every term of query, those
+        matching more terms exactly first. Terms that are not a prefix
+        of any token are matched fuzzily instead.
+        '''
+
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+
+        matched = []
+        for term in terms:
+            tokens = self._prefixed(term)
+            fuzzy = not tokens and len(term) >= FUZZY_MIN_LENGTH
+            if fuzzy:
+                tokens = self._fuzzy(term)
+            if not tokens:
+                return []
+            ids = set().union(*[self.postings[token] for token in tokens])
+            matched.append((ids, self.postings.get(term, frozenset()), fuzzy))
+
+        # Intersect the smallest sets first.
+        candidates = set(min(matched, key=lambda m: len(m[0]))[0])
+        for ids, _, _ in sorted(matched, key=lambda m: len(m[0])):
+            candidates &= ids
+            if not candidates:
+                return []
+
+        # Split the candidates by how many terms they match exactly, with
+        # set operations; tiers[n] matched n terms exactly.
+        tiers = [candidates]
+        for _, exact, fuzzy in matched:
+            if fuzzy:
+                continue
+            split = [set()]
+            for tier in tiers:
+                split[-1] |= tier - exact
+                split.append(tier & exact)
+            tiers = split
+
+        # Best tier first, by label within a tier.
+        found = []
+        for tier in reversed(tiers):
+            found += heapq.nsmallest(limit - len(found), tier, key=lambda doc_id: self.docs[doc_id].label)
+            if len(found) == limit:
+                break
+        return [self.docs[doc_id] for doc_id in found]
+
+def _people(connection, user_ids=None):
+    stmt = (
+        select(User.id, User.first_name, User.last_name, User.email, User.username,
+               User.contact, User.role, User.status, Student.roll_no, Teacher.teacher_id)
+        .outerjoin(Student, Student.user_id == User.id)
+        .outerjoin(Teacher, Teacher.user_id == User.id)
+    )
+    if user_ids is not None:
+        stmt = stmt.where(User.id.in_(user_ids))
+
+    for row in connection.execute(stmt):
+        tokens = tokenize(row.first_name) + tokenize(row.last_name) + tokenize(_mailbox(row.email)) \
+            + tokenize(row.username) + tokenize(row.contact)
+        if row.roll_no is not None:
+            tokens.append(str(row.roll_no))
+        fields = {
+            'email': row.email, 'username': row.username, 'role': row.role, 'status': row.status,
+            'roll_no': row.roll_no, 'teacher_id': row.teacher_id
+        }
+        yield Document(row.id, f'{row.first_name} {row.last_name}', fields, tokens)
+
+def _courses(connection, course_ids=None, teacher_user_ids=None):
+    instructor = aliased(User)
+    stmt = (
+        select(Course.course_id, Course.course_name, Teacher.user_id,
+               instructor.first_name, instructor.last_name)
+        .outerjoin(Teacher, Course.teacher_id == Teacher.teacher_id)
+        .outerjoin(instructor, Teacher.user_id == instructor.id)
+    )
+    if course_ids is not None:
+        stmt = stmt.where(Course.course_id.in_(course_ids))
+    if teacher_user_ids is not None:
+        stmt = stmt.where(Teacher.user_id.in_(teacher_user_ids))
+
+    for row in connection.execute(stmt):
+        tokens = tokenize(row.course_name) + tokenize(row.first_name) + tokenize(row.last_name)
+        tokens.append(str(row.course_id))
+        name = f'{row.first_name} {row.last_name}' if row.user_id is not None else None
+        fields = {'instructor': name, 'instructor_user_id': row.user_id}
+        yield Document(row.course_id, row.course_name, fields, tokens)
+
+class SearchIndex(object):
+    '''
+    In-process search over people (name, email, username, contact, roll
+    number) and courses (name, instructor).
+
+    The index is built from the database on first use. Commits that
+    change users, students, teachers or courses through the ORM update
+    the affected documents, and bulk writers call refresh() with the ids
+    they touched. Changes made by other processes are picked up by a
+    background rebuild once the index is SEARCH_INDEX_TTL seconds old.
+    '''
+
+    def __init__(self):
+        self.ttl = 600
+        self.limit = 10
+        self.indexes = None
+        self.built_at = None
+        self.build_ms = None
+        self._lock = threading.RLock()
+        self._rebuilding = None
+
+    def init_app(self, app):
+        self.ttl = app.config.get('SEARCH_INDEX_TTL', 600)
+        self.limit = app.config.get('SEARCH_RESULTS_LIMIT', 10)
+        self.indexes = None
+        self.built_at = None
+
+    @property
+    def built(self):
+        return self.indexes is not None
+
+    def _build(self):
+        start = time.perf_counter()
+        indexes = {PEOPLE: InvertedIndex(), COURSES: InvertedIndex()}
+        with db.engine.connect() as connection:
+            indexes[PEOPLE].load(_people(connection))
+            indexes[COURSES].load(_courses(connection))
+        return indexes, (time.perf_counter() - start) * 1000.0
+
+    def build(self):
+        '''
+        Load every person and course from the database.
+        '''
+
+        indexes, build_ms = self._build()
+        with self._lock:
+            self.indexes, self.build_ms = indexes, build_ms
+            self.built_at = time.monotonic()
+
+    def _rebuild_in_background(self):
+        '''
+        Rebuild off the request path; searches use the old index until
+        the new one is swapped in, and documents refreshed meanwhile are
+        refreshed again afterwards.
+        '''
+
+        app = current_app._get_current_object()
+        with self._lock:
+            if self._rebuilding is not None:
+                return
+            self._rebuilding = {'users': set(), 'courses': set()}
+
+        def run():
+            try:
+                with app.app_context():
+                    indexes, build_ms = self._build()
+                    with self._lock:
+                        self.indexes, self.build_ms = indexes, build_ms
+                        self.built_at = time.monotonic()
+                        missed, self._rebuilding = self._rebuilding, None
+                    self.refresh(user_ids=missed['users'], course_ids=missed['courses'])
+            except Exception:
+                app.logger.exception('Search index rebuild failed.')
+                self._rebuilding = None
+
+        threading.Thread(target=run, name='search-index-rebuild', daemon=True).start()
+
+    def search(self, kind, query, limit=None):
+        '''
+        Return matching documents of kind (PEOPLE or COURSES), best first.
+        '''
+
+        if not self.built:
+            with self._lock:
+                if not self.built:
+                    self.build()
+        elif self._rebuilding is None and time.monotonic() - self.built_at >= self.ttl:
+            self._rebuild_in_background()
+
+        with self._lock:
+            return self.indexes[kind].search(query, limit or self.limit)
+
+    def refresh(self, user_ids=(), course_ids=()):
+        '''
+        Reload the given people and courses from the database, dropping
+        those that no longer exist. Courses taught by the given users
+        are reloaded too, for instructor name changes.
+        '''
+
+        user_ids, course_ids = set(user_ids), set(course_ids)
+        if not self.built or not (user_ids or course_ids):
+            return
+
+        with self._lock:
+            if self._rebuilding is not None:
+                self._rebuilding['users'] |= user_ids
+                self._rebuilding['courses'] |= course_ids
+            people, courses = self.indexes[PEOPLE], self.indexes[COURSES]
+            taught = {doc.id for doc in courses.docs.values() if doc.fields['instructor_user_id'] in user_ids}
+
+        with db.engine.connect() as connection:
+            found_people = list(_people(connection, user_ids)) if user_ids else []
+            found_courses = list(_courses(connection, course_ids | taught)) if course_ids or taught else []
+            if user_ids:
+                found_courses += _courses(connection, teacher_user_ids=user_ids)
+
+        with self._lock:
+            for user_id in user_ids:
+                people.remove(user_id)
+            for doc in found_people:
+                people.add(doc)
+            for course_id in course_ids | taught:
+                courses.remove(course_id)
+            for doc in found_courses:
+                courses.add(doc)
+
+    def stats(self):
+        with self._lock:
+            if not self.built:
+                return {'built': False}
+            return {
+                'built': True,
+                'people': len(self.indexes[PEOPLE].docs),
+                'courses': len(self.indexes[COURSES].docs),
+                'tokens': len(self.indexes[PEOPLE].vocabulary) + len(self.indexes[COURSES].vocabulary),
+                'build_ms': round(self.build_ms, 1),
+                'age_s': round(time.monotonic() - self.built_at, 1)
+            }
+
+search_index = SearchIndex()
+
+def _stale(target, kind, ident):
+    session = inspect(target).session
+    if session is not None and ident is not None:
+        session.info.setdefault(STALE_KEY, {'users': set(), 'courses': set()})[kind].add(ident)
+
+def _user_changed(mapper, connection, target):
+    _stale(target, 'users', target.id)
+
+def _member_changed(mapper, connection, target):
+    # Students and teachers are found through their user.
+    _stale(target, 'users', target.user_id)
+
+def _course_changed(mapper, connection, target):
+    _stale(target, 'courses', target.course_id)
+
+for model, listener in ((User, _user_changed), (Student, _member_changed),
+                        (Teacher, _member_changed), (Course, _course_changed)):
+    for name in ('after_insert', 'after_update', 'after_delete'):
+        event.listen(model, name, listener)
+
+@event.listens_for(Session, 'after_commit')
+def _refresh_committed(session):
+    stale = session.info.pop(STALE_KEY, None)
+    if stale is not None:
+        search_index.refresh(user_ids=stale['users'], course_ids=stale['courses'])
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_stale(session):
+    session.info.pop(STALE_KEY, None)
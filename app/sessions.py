@@ -0,0 +1,382 @@
+# app/sessions.py
+
+import datetime
+import hashlib
+import json
+import secrets
+import threading
+import time
+
+from flask import session as request_session
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from flask_login import user_logged_in, user_logged_out
+from sqlalchemy import delete, event, inspect, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, object_session
+from werkzeug.datastructures import CallbackDict
+
+from . import db
+from .cache import connect_store
+from .models import User, UserSession
+
+REVOKE_KEY = 'sessions.revoke'
+
+# Changes to these User columns log the user out everywhere. They keep
+# active_history (app/models.py), so assigning the current value to an
+# expired user is not a change.
+REVOKING_COLUMNS = ('role', 'is_admin', 'status', '_password')
+
+# Expired sessions deleted per transaction by a sweep.
+SWEEP_BATCH_SIZE = 1000
+
+def _now():
+    return datetime.datetime.now()
+
+def _key(sid):
+    return hashlib.sha256(sid.encode('ascii')).hexdigest()
+
+class ServerSession(CallbackDict, SessionMixin):
+    '''
+    Session data loaded from a backend. sid is None until the session
+    is first saved; new is set until its record exists.
+    '''
+
+    def __init__(self, initial=None, sid=None, expires_at=None, state=None):
+        def on_update(self):
+            self.modified = True
+            self.accessed = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = sid is None
+        self.expires_at = expires_at
+        self.state = state
+        self.modified = False
+        self.accessed = False
+        self.replaced = []
+        self.stale_cookie = False
+
+    def __getitem__(self, key):
+        self.accessed = True
+        return super().__getitem__(key)
+
+    def get(self, key, default=None):
+        self.accessed = True
+        return super().get(key, default)
+
+    def setdefault(self, key, default=None):
+        self.accessed = True
+        return super().setdefault(key, default)
+
+    def regenerate(self):
+        '''
+        Move the data to a new session id and drop the old record, so an
+        id planted before login is useless after it.
+        '''
+
+        if self.sid is not None and not self.new:
+            self.replaced.append(self.sid)
+        self.sid = None
+        self.new = True
+        self.state = None
+        self.modified = True
+
+class DatabaseSessions(object):
+    '''
+    Sessions stored in the sessions table, one row per session.
+    Revoking deletes a user's rows; expired rows are removed by sweep().
+    '''
+
+    def __init__(self):
+        self.table = UserSession.__table__
+
+    def load(self, key):
+        table = self.table
+        with db.engine.connect() as connection:
+            row = connection.execute(
+                select(table.c.data, table.c.expires_at).where(table.c.session_key == key)
+            ).first()
+        if row is None or row.expires_at <= _now():
+            return None
+        return row.data, row.expires_at, True
+
+    def save(self, key, data, user_id, expires_at, state):
+        '''
+        Write a session. Existing sessions are only updated, so one
+        revoked while the request ran stays gone; returns False then.
+        '''
+
+        values = {'data': data, 'user_id': user_id, 'expires_at': expires_at}
+        try:
+            with db.engine.begin() as connection:
+                if state is None:
+                    connection.execute(insert(self.table).values(session_key=key, **values))
+                    return True
+                stmt = update(self.table).where(self.table.c.session_key == key).values(**values)
+                return connection.execute(stmt).rowcount == 1
+        except IntegrityError:
+            # The user was deleted while the request ran.
+            return False
+
+    def delete(self, *keys):
+        with db.engine.begin() as connection:
+            connection.execute(delete(self.table).where(self.table.c.session_key.in_(keys)))
+
+    def revoke(self, user_ids):
+        with db.engine.begin() as connection:
+            return connection.execute(delete(self.table).where(self.table.c.user_id.in_(user_ids))).rowcount
+
+    def sweep(self, batch_size=SWEEP_BATCH_SIZE):
+        '''
+        Delete expired sessions in batches of batch_size rows. Returns
+        how many were deleted.
+        '''
+
+        table, now, deleted = self.table, _now(), 0
+        while True:
+            with db.engine.begin() as connection:
+                keys = list(connection.execute(
+                    select(table.c.session_key).where(table.c.expires_at <= now).limit(batch_size)
+                ).scalars())
+                if keys:
+                    connection.execute(delete(table).where(table.c.session_key.in_(keys)))
+            deleted += len(keys)
+            if len(keys) < batch_size:
+                return deleted
+
+class StoreSessions(object):
+    '''
+    Sessions kept in a key-value store ("memory://" or Redis), which
+    expires them itself. The store cannot find a user's sessions, so each
+    user has a generation counter: revoking bumps it, and sessions saved
+    under an older generation are ignored.
+    '''
+
+    def __init__(self, store):
+        self.store = store
+        self.prefix = 'session:'
+        self.generations = 'session-generation:'
+
+    def _generation(self, user_id):
+        if user_id is None:
+            return 0
+        return int(self.store.get(self.generations + str(user_id)) or 0)
+
+    def load(self, key):
+        raw = self.store.get(self.prefix + key)
+        if raw is None:
+            return None
+        record = json.loads(raw)
+        user_id, generation = record['user_id'], record['generation']
+        if user_id is not None and generation != self._generation(user_id):
+            self.store.delete(self.prefix + key)
+            return None
+        return record['data'], datetime.datetime.fromtimestamp(record['expires']), (user_id, generation)
+
+    def save(self, key, data, user_id, expires_at, state):
+        # Keep the generation the session was loaded under, so a revoke
+        # during the request is not undone by saving it again.
+        if state is not None and state[0] == user_id:
+            generation = state[1]
+        else:
+            generation = self._generation(user_id)
+        record = {'data': data, 'user_id': user_id, 'generation': generation, 'expires': expires_at.timestamp()}
+        ttl = max(1, int((expires_at - _now()).total_seconds()))
+        self.store.set(self.prefix + key, json.dumps(record), ex=ttl)
+        return True
+
+    def delete(self, *keys):
+        self.store.delete(*[self.prefix + key for key in keys])
+
+    def revoke(self, user_ids):
+        for user_id in user_ids:
+            self.store.incr(self.generations + str(user_id))
+        return len(user_ids)
+
+    def sweep(self, batch_size=SWEEP_BATCH_SIZE):
+        return 0
+
+class ServerSessionInterface(SessionInterface):
+    '''
+    Keeps session data in a backend and only a random session id in the
+    cookie. A record is written when the session changes, or when less
+    than half of its lifetime is left, rather than on every response.
+    '''
+
+    serializer = TaggedJSONSerializer()
+
+    def __init__(self, backend, on_save=None):
+        self.backend = backend
+        self.on_save = on_save
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            record = self.backend.load(_key(sid))
+            if record is not None:
+                data, expires_at, state = record
+                return ServerSession(self.serializer.loads(data), sid, expires_at, state)
+        # Unknown ids are not reused, so a client cannot choose its own.
+        session = ServerSession()
+        session.stale_cookie = bool(sid)
+        return session
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        secure = self.get_cookie_secure(app)
+        samesite = self.get_cookie_samesite(app)
+        httponly = self.get_cookie_httponly(app)
+
+        if session.accessed:
+            response.vary.add('Cookie')
+
+        stale = [_key(sid) for sid in session.replaced]
+        if not session and not session.new:
+            stale.append(_key(session.sid))
+        if stale:
+            self.backend.delete(*stale)
+
+        def drop_cookie():
+            response.delete_cookie(name, domain=domain, path=path, secure=secure, samesite=samesite, httponly=httponly)
+            response.vary.add('Cookie')
+
+        if not session:
+            if session.modified or session.stale_cookie:
+                drop_cookie()
+            return
+
+        now = _now()
+        lifetime = app.permanent_session_lifetime
+        refresh = session.expires_at is None or session.expires_at - now < lifetime / 2
+        if not (session.new or session.modified or refresh):
+            return
+
+        if session.sid is None:
+            session.sid = secrets.token_urlsafe(32)
+        expires_at = now + lifetime
+        user_id = dict.get(session, '_user_id')
+        saved = self.backend.save(
+            _key(session.sid), self.serializer.dumps(dict(session)),
+            None if user_id is None else int(user_id), expires_at, session.state
+        )
+        if not saved:
+            drop_cookie()
+            return
+        if self.on_save is not None:
+            self.on_save()
+
+        if session.new or session.permanent:
+            response.set_cookie(
+                name, session.sid, expires=self.get_expiration_time(app, session), httponly=httponly,
+                domain=domain, path=path, secure=secure, samesite=samesite
+            )
+            response.vary.add('Cookie')
+
+class SessionStore(object):
+    '''
+    Pluggable server-side sessions. SESSION_STORE picks the backend:
+    "database" for the sessions table, "memory://" or a redis:// URL for
+    a key-value store, or None for Flask's signed-cookie sessions.
+    '''
+
+    def __init__(self):
+        self.backend = None
+        self.app = None
+        self.sweep_interval = None
+        self.last_sweep = 0.0
+        self._sweep_lock = threading.Lock()
+
+    def init_app(self, app):
+        url = app.config.get('SESSION_STORE')
+        self.app = app
+        self.sweep_interval = app.config.get('SESSION_SWEEP_INTERVAL', 3600)
+        self.last_sweep = time.monotonic()
+        if not url:
+            self.backend = None
+            return
+        self.backend = DatabaseSessions() if url == 'database' else StoreSessions(connect_store(url))
+        app.session_interface = ServerSessionInterface(self.backend, on_save=self._sweep_if_due)
+
+    @property
+    def enabled(self):
+        return self.backend is not None
+
+    def revoke(self, *user_ids):
+        '''
+        End every session of the given users. Signed-cookie sessions
+        cannot be revoked, so this does nothing without a store.
+        '''
+
+        if self.backend is None or not user_ids:
+            return 0
+        return self.backend.revoke(list(user_ids))
+
+    def sweep(self, batch_size=SWEEP_BATCH_SIZE):
+        '''
+        Delete expired sessions. Returns how many were deleted.
+        '''
+
+        if self.backend is None:
+            return 0
+        return self.backend.sweep(batch_size)
+
+    def watch(self, model):
+        '''
+        Revoke a user's sessions once a transaction that deletes them or
+        changes their role, admin flag, verification or password commits.
+        '''
+
+        event.listen(model, 'after_update', self._mark_changed)
+        event.listen(model, 'after_delete', self._mark_deleted)
+
+    def _mark_changed(self, mapper, connection, target):
+        state = inspect(target)
+        if any(state.attrs[name].history.deleted for name in REVOKING_COLUMNS):
+            self._mark_deleted(mapper, connection, target)
+
+    def _mark_deleted(self, mapper, connection, target):
+        ident = mapper.primary_key_from_instance(target)[0]
+        object_session(target).info.setdefault(REVOKE_KEY, set()).add(ident)
+
+    def _sweep_if_due(self):
+        # Sweep from a request at most once per interval, off the
+        # request's thread.
+        if not self.sweep_interval or time.monotonic() - self.last_sweep < self.sweep_interval:
+            return
+        if not self._sweep_lock.acquire(blocking=False):
+            return
+        self.last_sweep = time.monotonic()
+        threading.Thread(target=self._sweep_in_background, name='session-sweeper', daemon=True).start()
+
+    def _sweep_in_background(self):
+        try:
+            with self.app.app_context():
+                self.sweep()
+        finally:
+            self._sweep_lock.release()
+
+session_store = SessionStore()
+session_store.watch(User)
+
+@event.listens_for(Session, 'after_commit')
+def _revoke_committed(session):
+    user_ids = session.info.pop(REVOKE_KEY, ())
+    if user_ids:
+        session_store.revoke(*user_ids)
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_revoked(session):
+    session.info.pop(REVOKE_KEY, None)
+
+@user_logged_in.connect
+def _regenerate_on_login(app, user, **extra):
+    if isinstance(request_session, ServerSession):
+        request_session.regenerate()
+
+@user_logged_out.connect
+def _regenerate_on_logout(app, user, **extra):
+    if isinstance(request_session, ServerSession):
+        request_session.regenerate()
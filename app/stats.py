@@ -0,0 +1,232 @@
+# app/stats.py
+
+from collections import Counter
+
+from sqlalchemy import and_, event, func, insert, inspect, select, update
+from sqlalchemy.exc import IntegrityError
+
+from . import db, fees
+from .models import Course, Department, Enrollment, StatCounter, Student, User
+from .reference import reference_data
+
+# Slots each counter is split over.
+SLOTS = 8
+
+USERS = 'users'
+UNVERIFIED = 'users:unverified'
+STUDENTS = 'students'
+ENROLLMENTS = 'enrollments'
+ROLES = ('Student', 'Teacher', 'Admin')
+
+# Courses listed as the most enrolled on the dashboard.
+TOP_COURSES = 5
+
+def _bump(connection, name, scope_id, delta, key=0):
+    '''
+    Add delta to one slot of a counter, creating the slot if needed.
+    Writers pass the id of the row they changed as key, so concurrent
+    writers are spread over the slots. The slot is inserted in a
+    savepoint, so a writer that loses the race to create it adds to the
+    winner's row instead of failing.
+    '''
+
+    table = StatCounter.__table__
+    slot = key % SLOTS
+    where = and_(table.c.name == name, table.c.scope_id == scope_id, table.c.slot == slot)
+    add = update(table).where(where).values(count=table.c.count + delta)
+    if connection.execute(add).rowcount:
+        return
+    try:
+        with connection.begin_nested():
+            connection.execute(insert(table).values(name=name, scope_id=scope_id, slot=slot, count=delta))
+    except IntegrityError:
+        # Another writer created the slot first; add to it instead.
+        connection.execute(add)
+
+def adjust(connection, deltas, key=0):
+    '''
+    Apply {(name, scope_id): delta} to the counters.
+    '''
+
+    for (name, scope_id), delta in deltas.items():
+        if delta:
+            _bump(connection, name, scope_id, delta, key)
+
+def _unverified(status):
+    # Matches verification.pending_filter: NULL is neither verified nor pending.
+    return status is not None and not status
+
+def user_deltas(role, status, count=1):
+    '''
+    Return the counter deltas for count users with a role and status.
+    '''
+
+    deltas = Counter({(USERS, 0): count, (f'{USERS}:{role}', 0): count})
+    if _unverified(status):
+        deltas[(UNVERIFIED, 0)] += count
+    return deltas
+
+def _grouped(columns, conditions):
+    stmt = select(*columns, func.count()).where(*conditions).group_by(*columns)
+    return db.session.execute(stmt).all()
+
+def remove_users(*conditions):
+    '''
+    Take users matching conditions out of the counters. Call before
+    deleting them with bulk statements, which bypass the listeners.
+    '''
+
+    deltas = Counter()
+    for role, status, count in _grouped((User.role, User.status), conditions):
+        deltas.update(user_deltas(role, status, -count))
+    adjust(db.session, deltas)
+
+def remove_students(*conditions):
+    '''
+    Take students matching conditions out of the per-department counts.
+    '''
+
+    department = func.coalesce(Student.department_id, 0)
+    adjust(db.session, {(STUDENTS, dep_id): -count for dep_id, count in _grouped((department,), conditions)})
+
+def remove_enrollments(*conditions):
+    '''
+    Take enrollments matching conditions out of the total, before they
+    are deleted in bulk or through ON DELETE CASCADE.
+    '''
+
+    count = db.session.execute(select(func.count()).select_from(Enrollment).where(*conditions)).scalar()
+    adjust(db.session, {(ENROLLMENTS, 0): -count})
+
+def _counted():
+    '''
+    Return {(name, scope_id): value}, summing the slots.
+    '''
+
+    stmt = (
+        select(StatCounter.name, StatCounter.scope_id, func.sum(StatCounter.count))
+        .group_by(StatCounter.name, StatCounter.scope_id)
+    )
+    return {(name, scope_id): value for name, scope_id, value in db.session.execute(stmt)}
+
+def reconcile():
+    '''
+    Recount everything from the base tables and correct the counters
+    that drifted, e.g. after bulk writes that skipped the hooks. Also
+    creates every slot of the fixed counters, so writers never race to
+    insert them. Corrections are added as deltas, so writes committed
+    while it runs are kept. Returns {(name, scope_id): correction}.
+    '''
+
+    actual = Counter()
+    for role, status, count in _grouped((User.role, User.status), ()):
+        actual.update(user_deltas(role, status, count))
+    department = func.coalesce(Student.department_id, 0)
+    for dep_id, count in _grouped((department,), ()):
+        actual[(STUDENTS, dep_id)] += count
+    actual[(ENROLLMENTS, 0)] += db.session.execute(select(func.count()).select_from(Enrollment)).scalar()
+
+    counted = _counted()
+    drift = {}
+    for key in set(actual) | set(counted):
+        delta = actual[key] - (counted.get(key) or 0)
+        if delta:
+            drift[key] = delta
+
+    table = StatCounter.__table__
+    keys = [(USERS, 0), (UNVERIFIED, 0), (ENROLLMENTS, 0), (STUDENTS, 0)]
+    keys += [(f'{USERS}:{role}', 0) for role in ROLES]
+    keys += [(STUDENTS, dep_id) for dep_id in db.session.execute(select(Department.dep_id)).scalars()]
+    existing = set(db.session.execute(select(table.c.name, table.c.scope_id, table.c.slot)).all())
+    missing = [
+        {'name': name, 'scope_id': scope_id, 'slot': slot, 'count': 0}
+        for name, scope_id in keys for slot in range(SLOTS) if (name, scope_id, slot) not in existing
+    ]
+    if missing:
+        db.session.execute(insert(table), missing)
+
+    adjust(db.session, drift)
+    db.session.commit()
+    return drift
+
+def dashboard():
+    '''
+    Return the admin dashboard figures. Every query reads a summary or
+    an index range whose size does not depend on the number of users,
+    enrollments or fees.
+    '''
+
+    counted = _counted()
+
+    def value(name, scope_id=0):
+        return counted.get((name, scope_id)) or 0
+
+    departments = [(row.dep_name, value(STUDENTS, row.dep_id)) for row in reference_data.departments()]
+    if value(STUDENTS, 0):
+        departments.append(('Not Assigned', value(STUDENTS, 0)))
+
+    top_courses = db.session.execute(
+        select(Course.course_id, Course.course_name, Course.seats_taken, Course.capacity)
+        .order_by(Course.seats_taken.desc(), Course.course_id.desc())
+        .limit(TOP_COURSES)
+    ).all()
+
+    return {
+        'users': value(USERS),
+        'roles': [(role, value(f'{USERS}:{role}')) for role in ROLES],
+        'unverified': value(UNVERIFIED),
+        'departments': departments,
+        'enrollments': value(ENROLLMENTS),
+        'top_courses': top_courses,
+        'fees': fees.totals()
+    }
+
+# ORM writes keep the counters in step through these listeners. Bulk
+# writers call adjust() or the remove_* functions instead, and the
+# enrollment engine counts seats as they are taken and released.
+
+@event.listens_for(User, 'after_insert')
+def _user_inserted(mapper, connection, target):
+    adjust(connection, user_deltas(target.role, target.status), key=target.id)
+
+@event.listens_for(User, 'after_delete')
+def _user_deleted(mapper, connection, target):
+    adjust(connection, user_deltas(target.role, target.status, -1), key=target.id)
+
+@event.listens_for(User, 'after_update')
+def _user_updated(mapper, connection, target):
+    state = inspect(target)
+    role, status = state.attrs.role.history, state.attrs.status.history
+    if not role.deleted and not status.deleted:
+        return
+
+    deltas = user_deltas(target.role, target.status)
+    deltas.subtract(user_deltas(
+        role.deleted[0] if role.deleted else target.role,
+        status.deleted[0] if status.deleted else target.status
+    ))
+    adjust(connection, deltas, key=target.id)
+
+@event.listens_for(Student, 'after_insert')
+def _student_inserted(mapper, connection, target):
+    adjust(connection, {(STUDENTS, target.department_id or 0): 1}, key=target.roll_no)
+
+@event.listens_for(Student, 'after_delete')
+def _student_deleted(mapper, connection, target):
+    adjust(connection, {(STUDENTS, target.department_id or 0): -1}, key=target.roll_no)
+
+@event.listens_for(Student, 'after_update')
+def _student_updated(mapper, connection, target):
+    history = inspect(target).attrs.department_id.history
+    if history.deleted:
+        deltas = Counter({(STUDENTS, target.department_id or 0): 1})
+        deltas[(STUDENTS, history.deleted[0] or 0)] -= 1
+        adjust(connection, deltas, key=target.roll_no)
+
+@event.listens_for(Enrollment, 'after_insert')
+def _enrollment_inserted(mapper, connection, target):
+    adjust(connection, {(ENROLLMENTS, 0): 1}, key=target.course_id or 0)
+
+@event.listens_for(Enrollment, 'after_delete')
+def _enrollment_deleted(mapper, connection, target):
+    adjust(connection, {(ENROLLMENTS, 0): -1}, key=target.course_id or 0)
@@ -0,0 +1,101 @@
+# app/tasks.py
+
+import io
+
+from sqlalchemy import func, select
+
+from . import attendance, db, deletion, fees, grades, stats, timetable
+from .fees import NO_TERM
+from .importer import Importer
+from .jobs import task
+from .models import Attendance, Fee
+from .sessions import session_store
+
+# Jobs an admin can start from the jobs page, with their labels.
+MAINTENANCE = {
+    'rebuild_fee_summary': 'Rebuild fee summary',
+    'rebuild_attendance': 'Recount attendance',
+    'rebuild_gpa': 'Rebuild GPA summary',
+    'reconcile_stats': 'Reconcile dashboard counters',
+    'build_timetable': 'Build timetable',
+    'sweep_sessions': 'Delete expired sessions'
+}
+
+# Rejected import rows kept in a job's result.
+MAX_REPORTED_ERRORS = 500
+
+@task('delete_course', retries=2)
+def delete_course(job, course_id):
+    job.progress(0, 1, 'Deleting the course and its enrollments.', force=True)
+    return {'deleted': deletion.delete_course(course_id)}
+
+@task('delete_student', retries=2)
+def delete_student(job, roll_no):
+    job.progress(0, 1, 'Deleting the student and their records.', force=True)
+    return {'deleted': deletion.delete_student(roll_no)}
+
+@task('import_data')
+def import_data(job, kind, verified=True):
+    '''
+    Import the uploaded file in the job's payload. Chunks imported
+    before a cancel stay imported.
+    '''
+
+    text = job.payload.decode('utf-8-sig')
+    # Line numbers track progress through CSV and JSON Lines files; a JSON
+    # array is numbered by element, so its size is not known up front.
+    total = None if text.lstrip().startswith('[') else text.count('\n') + (not text.endswith('\n'))
+    job.progress(0, total, 'Importing.', force=True)
+
+    def progress(line):
+        job.progress(line, total, f'Imported {importer.report.created}, rejected {len(importer.report.errors)}.')
+
+    importer = Importer(kind, verified=verified)
+    report = importer.run(io.StringIO(text, newline=''), progress=progress)
+    return {
+        'created': report.created,
+        'rejected': len(report.errors),
+        'errors': report.errors[:MAX_REPORTED_ERRORS]
+    }
+
+@task('retire_term')
+def retire_term(job, term, archive=True):
+    in_term = Fee.term.is_(None) if term == NO_TERM else Fee.term == term
+    total = db.session.execute(select(func.count()).select_from(Fee).where(in_term)).scalar()
+    db.session.rollback()
+    job.progress(0, total, f'Retiring the fees of {term}.', force=True)
+    return {'retired': fees.retire_term(term, archive=archive, progress=job.progress)}
+
+@task('rebuild_fee_summary', retries=1)
+def rebuild_fee_summary(job):
+    fees.rebuild()
+
+@task('rebuild_attendance', retries=1)
+def rebuild_attendance(job):
+    total = db.session.execute(select(func.count()).select_from(Attendance)).scalar()
+    db.session.rollback()
+    job.progress(0, total, 'Recounting attendance.', force=True)
+    return {'corrected': attendance.rebuild(progress=job.progress)}
+
+@task('rebuild_gpa', retries=1)
+def rebuild_gpa(job):
+    grades.rebuild()
+
+@task('reconcile_stats', retries=1)
+def reconcile_stats(job):
+    return {'corrected': len(stats.reconcile())}
+
+@task('build_timetable')
+def build_timetable(job, seconds=None):
+    job.progress(0, None, 'Solving.', force=True)
+    result = timetable.build(seconds)
+    return {
+        'placed': len(result.assignments),
+        'clashing': len(result.clashing),
+        'unplaced': len(result.unplaced),
+        'seconds': round(result.seconds, 1)
+    }
+
+@task('sweep_sessions', retries=1)
+def sweep_sessions(job):
+    return {'deleted': session_store.sweep()}
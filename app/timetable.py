@@ -0,0 +1,673 @@
+# app/timetable.py
+
+import itertools
+import random
+import time
+from collections import Counter, defaultdict
+
+from flask import current_app
+from sqlalchemy import bindparam, delete, func, insert, select, update
+
+from . import db
+from .models import Course, Enrollment, Room, Section, Teacher, TimeSlot, User
+
+DAYS = ('Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday')
+
+# A section is moved out of the way only when at most this many others
+# block the slot it wants.
+MAX_EJECTED = 3
+
+def minutes(text):
+    '''
+    Convert "HH:MM" to minutes after midnight.
+    '''
+
+    hours, mins = text.split(':')
+    return int(hours) * 60 + int(mins)
+
+def clock(value):
+    return f'{value // 60:02d}:{value % 60:02d}'
+
+def overlaps(slots):
+    '''
+    Return, for each of a list of (slot_id, day, starts_at, ends_at)
+    slots, a bitmask of the slots it overlaps, itself included. A sweep
+    over each day's intervals in start order finds every overlapping
+    pair without comparing all of them.
+    '''
+
+    masks = [1 << index for index in range(len(slots))]
+    order = sorted(range(len(slots)), key=lambda index: (slots[index][1], slots[index][2]))
+    for position, index in enumerate(order):
+        _, day, _, ends_at = slots[index]
+        for other in order[position + 1:]:
+            if slots[other][1] != day or slots[other][2] >= ends_at:
+                break
+            masks[index] |= 1 << other
+            masks[other] |= 1 << index
+    return masks
+
+def _bits(mask):
+    return [index for index in range(mask.bit_length()) if mask >> index & 1]
+
+class Problem(object):
+    '''
+    A timetabling problem as plain data, independent of the database:
+
+    - slots: (slot_id, day, starts_at, ends_at) tuples
+    - rooms: (room_id, capacity) tuples
+    - sections: (section_id, course_id) tuples
+    - teachers and sizes: course_id -> teacher id and enrolled students
+    - students: lists of course ids, one per student
+    '''
+
+    def __init__(self, slots, rooms, sections, teachers, sizes, students):
+        self.slots = list(slots)
+        self.rooms = sorted(rooms, key=lambda room: room[1])
+        self.sections = list(sections)
+        self.teachers = teachers
+        self.sizes = sizes
+        self.students = students
+
+    def neighbours(self):
+        '''
+        Return the course conflict graph: course_id -> courses sharing
+        at least one student with it. Built from each student's own
+        course pairs, so it costs per enrollment, not per pair of
+        enrollments.
+        '''
+
+        graph = defaultdict(set)
+        for courses in self.students:
+            for first, second in itertools.combinations(set(courses), 2):
+                graph[first].add(second)
+                graph[second].add(first)
+        return graph
+
+class Timetable(object):
+    '''
+    The result of solving a Problem: (slot_id, room_id) per placed
+    section, the sections still clashing and those that could not be
+    placed at all.
+    '''
+
+    def __init__(self, assignments, clashing, unplaced, seconds):
+        self.assignments = assignments
+        self.clashing = clashing
+        self.unplaced = unplaced
+        self.seconds = seconds
+
+    @property
+    def conflict_free(self):
+        return not self.clashing and not self.unplaced
+
+class Solver(object):
+    '''
+    Greedy construction followed by local search. Courses are placed
+    most constrained first (most conflicting courses, then most students)
+    into the least used slot that clashes with nothing already placed and
+    still has a room big enough. Sections left clashing are then
+    repaired by moving them, or by moving up to MAX_EJECTED sections that
+    block a better slot, until none clash or time runs out. When a round
+    repairs nothing, the stuck sections are kicked to their least
+    clashing other slot, and the best assignment seen is kept.
+
+    State is kept as per-slot counters and room bitmasks, so testing a
+    slot is a few list lookups and placing a section touches only its
+    course's neighbours.
+    '''
+
+    def __init__(self, problem, seed=0):
+        self.problem = problem
+        self.rng = random.Random(seed)
+
+        slots = problem.slots
+        self.slot_count = len(slots)
+        self.slot_ids = [slot[0] for slot in slots]
+        self.slot_days = [slot[1] for slot in slots]
+        self.overlap = [_bits(mask) for mask in overlaps(slots)]
+
+        self.room_ids = [room[0] for room in problem.rooms]
+        capacities = [room[1] for room in problem.rooms]
+        self.all_rooms = (1 << len(capacities)) - 1
+
+        courses = sorted({course_id for _, course_id in problem.sections})
+        course_index = {course_id: index for index, course_id in enumerate(courses)}
+        graph = problem.neighbours()
+        self.neighbours = [
+            [course_index[other] for other in graph.get(course_id, ()) if other in course_index]
+            for course_id in courses
+        ]
+        self.courses = courses
+
+        teachers = {}
+        self.teacher_of = [
+            teachers.setdefault(problem.teachers[course_id], len(teachers))
+            if problem.teachers.get(course_id) is not None else None
+            for course_id in courses
+        ]
+
+        self.section_ids = [section_id for section_id, _ in problem.sections]
+        self.course_of = [course_index[course_id] for _, course_id in problem.sections]
+
+        # Rooms are sorted by capacity, so the rooms that fit a course are
+        # every room from the first big enough one upwards.
+        self.fits = []
+        for course_id in courses:
+            size = problem.sizes.get(course_id, 0)
+            first = next((index for index, capacity in enumerate(capacities) if capacity >= size), len(capacities))
+            self.fits.append(self.all_rooms & ~((1 << first) - 1))
+
+        self.slot_of = [None] * len(self.section_ids)
+        self.room_of = [None] * len(self.section_ids)
+        self.blocked = [[0] * self.slot_count for _ in courses]
+        self.own = [[0] * self.slot_count for _ in courses]
+        self.busy = [[0] * self.slot_count for _ in teachers]
+        self.room_used = [0] * self.slot_count
+        self.at_slot = [set() for _ in range(self.slot_count)]
+
+    def _place(self, section, slot, room):
+        course = self.course_of[section]
+        teacher = self.teacher_of[course]
+        self.slot_of[section], self.room_of[section] = slot, room
+        for other in self.overlap[slot]:
+            self.own[course][other] += 1
+            if teacher is not None:
+                self.busy[teacher][other] += 1
+            for neighbour in self.neighbours[course]:
+                self.blocked[neighbour][other] += 1
+        self.room_used[slot] |= 1 << room
+        self.at_slot[slot].add(section)
+
+    def _remove(self, section):
+        slot, room = self.slot_of[section], self.room_of[section]
+        course = self.course_of[section]
+        teacher = self.teacher_of[course]
+        for other in self.overlap[slot]:
+            self.own[course][other] -= 1
+            if teacher is not None:
+                self.busy[teacher][other] -= 1
+            for neighbour in self.neighbours[course]:
+                self.blocked[neighbour][other] -= 1
+        self.room_used[slot] &= ~(1 << room)
+        self.at_slot[slot].discard(section)
+        self.slot_of[section] = self.room_of[section] = None
+        return slot, room
+
+    def _clashes(self, section, slot):
+        '''
+        Count what a section would clash with in a slot: sections of
+        courses sharing students, of its own course and of its teacher.
+        The section itself must not be placed.
+        '''
+
+        course = self.course_of[section]
+        teacher = self.teacher_of[course]
+        count = self.blocked[course][slot] + self.own[course][slot]
+        if teacher is not None:
+            count += self.busy[teacher][slot]
+        return count
+
+    def _room(self, section, slot):
+        '''
+        Return the smallest free room that fits the section in a slot,
+        or None.
+        '''
+
+        used = 0
+        for other in self.overlap[slot]:
+            used |= self.room_used[other]
+        free = self.fits[self.course_of[section]] & ~used
+        return (free & -free).bit_length() - 1 if free else None
+
+    def _course_days(self, section):
+        course = self.course_of[section]
+        return {self.slot_days[self.slot_of[other]] for other in self.sections_of[course]
+                if other != section and self.slot_of[other] is not None}
+
+    def _free_slot(self, section, avoid=()):
+        '''
+        Return a clash-free (slot, room) for a section, preferring days
+        its course does not meet yet and then the least used slot.
+        '''
+
+        days = self._course_days(section)
+        best = None
+        for slot in range(self.slot_count):
+            if slot in avoid or self._clashes(section, slot):
+                continue
+            room = self._room(section, slot)
+            if room is None:
+                continue
+            key = (self.slot_days[slot] in days, len(self.at_slot[slot]), self.rng.random())
+            if best is None or key < best[0]:
+                best = (key, slot, room)
+        return best and best[1:]
+
+    def _least_clashing(self, section):
+        '''
+        Return the (slot, room) with the fewest clashes among slots that
+        have a room that fits, or None if no slot has one.
+        '''
+
+        best = None
+        for slot in range(self.slot_count):
+            room = self._room(section, slot)
+            if room is None:
+                continue
+            key = (self._clashes(section, slot), self.rng.random())
+            if best is None or key < best[0]:
+                best = (key, slot, room)
+        return best and best[1:]
+
+    def _blockers(self, section, slot):
+        course = self.course_of[section]
+        teacher = self.teacher_of[course]
+        neighbours = set(self.neighbours[course])
+        found = []
+        for other in self.overlap[slot]:
+            for placed in self.at_slot[other]:
+                placed_course = self.course_of[placed]
+                if placed_course == course or placed_course in neighbours \
+                        or (teacher is not None and self.teacher_of[placed_course] == teacher):
+                    found.append(placed)
+        return found
+
+    def _repair(self, section):
+        '''
+        Try to give a clashing or unplaced section a clash-free slot,
+        directly or by moving the few sections blocking one. Returns
+        True on success; otherwise the section is left where it was.
+        '''
+
+        original = self._remove(section) if self.slot_of[section] is not None else None
+
+        found = self._free_slot(section)
+        if found:
+            self._place(section, *found)
+            return True
+
+        slots = sorted(range(self.slot_count), key=lambda slot: (self._clashes(section, slot), self.rng.random()))
+        for slot in slots:
+            blockers = self._blockers(section, slot)
+            if not blockers or len(blockers) > MAX_EJECTED:
+                continue
+
+            moved = [(blocker, self._remove(blocker)) for blocker in blockers]
+            room = self._room(section, slot)
+            if room is not None:
+                self._place(section, slot, room)
+                placed = []
+                for blocker, _ in moved:
+                    target = self._free_slot(blocker)
+                    if target is None:
+                        break
+                    self._place(blocker, *target)
+                    placed.append(blocker)
+                else:
+                    return True
+
+                # Undo: take the section and the re-placed blockers out again.
+                for blocker in placed:
+                    self._remove(blocker)
+                self._remove(section)
+
+            for blocker, (old_slot, old_room) in moved:
+                self._place(blocker, old_slot, old_room)
+
+        if original is not None:
+            self._place(section, *original)
+        return False
+
+    def _kick(self, bad):
+        '''
+        Escape a local minimum: move each stuck section to the least
+        clashing other slot, pushing its clashes onto sections that may
+        have room to move.
+        '''
+
+        for section in bad:
+            original = self._remove(section) if self.slot_of[section] is not None else None
+            found = None
+            for slot in range(self.slot_count):
+                if original is not None and slot == original[0]:
+                    continue
+                room = self._room(section, slot)
+                if room is None:
+                    continue
+                key = (self._clashes(section, slot), self.rng.random())
+                if found is None or key < found[0]:
+                    found = (key, slot, room)
+            if found:
+                self._place(section, *found[1:])
+            elif original is not None:
+                self._place(section, *original)
+
+    def _restore(self, slots, rooms):
+        for section in range(len(self.section_ids)):
+            if self.slot_of[section] is not None:
+                self._remove(section)
+        for section, (slot, room) in enumerate(zip(slots, rooms)):
+            if slot is not None:
+                self._place(section, slot, room)
+
+    def solve(self, seconds=10.0):
+        start = time.perf_counter()
+        deadline = start + seconds
+
+        self.sections_of = [[] for _ in self.courses]
+        for section, course in enumerate(self.course_of):
+            self.sections_of[course].append(section)
+
+        # Greedy construction, most constrained courses first.
+        order = sorted(
+            range(len(self.courses)),
+            key=lambda course: (-len(self.neighbours[course]), -self.problem.sizes.get(self.courses[course], 0))
+        )
+        for course in order:
+            for section in self.sections_of[course]:
+                found = self._free_slot(section) or self._least_clashing(section)
+                if found:
+                    self._place(section, *found)
+
+        # Local search over the sections that still clash or have no slot,
+        # keeping the best assignment seen.
+        best = None
+        while time.perf_counter() < deadline:
+            bad = [section for section in range(len(self.section_ids)) if self._is_bad(section)]
+            if best is None or len(bad) < best[0]:
+                best = (len(bad), list(self.slot_of), list(self.room_of))
+            if not bad:
+                break
+            self.rng.shuffle(bad)
+            repaired = 0
+            for section in bad:
+                if time.perf_counter() >= deadline:
+                    break
+                if self._is_bad(section) and self._repair(section):
+                    repaired += 1
+            if not repaired:
+                self._kick(bad)
+
+        if best is not None and best[0] < sum(map(self._is_bad, range(len(self.section_ids)))):
+            self._restore(best[1], best[2])
+
+        assignments, clashing, unplaced = {}, [], []
+        for section, section_id in enumerate(self.section_ids):
+            slot = self.slot_of[section]
+            if slot is None:
+                unplaced.append(section_id)
+                continue
+            assignments[section_id] = (self.slot_ids[slot], self.room_ids[self.room_of[section]])
+            if self._is_bad(section):
+                clashing.append(section_id)
+        return Timetable(assignments, clashing, unplaced, time.perf_counter() - start)
+
+    def _is_bad(self, section):
+        slot = self.slot_of[section]
+        if slot is None:
+            return True
+        # The section's own placement is counted once in its own course's counter.
+        course = self.course_of[section]
+        teacher = self.teacher_of[course]
+        count = self.blocked[course][slot] + self.own[course][slot] - 1
+        if teacher is not None:
+            count += self.busy[teacher][slot] - 1
+        return count > 0
+
+def solve(problem, seconds=10.0, seed=0):
+    '''
+    Solve a Problem. Returns a Timetable.
+    '''
+
+    return Solver(problem, seed).solve(seconds)
+
+class Clashes(object):
+    '''
+    Conflicts found in a timetable: teacher and room double bookings as
+    (teacher or room id, section id, section id) tuples, and the number
+    of students with each pair of clashing courses.
+    '''
+
+    def __init__(self):
+        self.teachers = []
+        self.rooms = []
+        self.courses = Counter()
+        self.students = 0
+
+    @property
+    def total(self):
+        return len(self.teachers) + len(self.rooms) + sum(self.courses.values())
+
+def find_clashes(slots, placed, teachers, students):
+    '''
+    Check a timetable: placed is (section_id, course_id, slot_id,
+    room_id) tuples, teachers maps course ids to teacher ids and students
+    lists each student's course ids. Every check is linear: bookings are
+    compared only with those in overlapping slots, and each course's
+    slots are folded into a bitmask so a student's clash is one AND per
+    course.
+    '''
+
+    masks = overlaps(slots)
+    index = {slot[0]: position for position, slot in enumerate(slots)}
+    overlap = [_bits(mask) for mask in masks]
+    clashes = Clashes()
+
+    def double_bookings(key, found):
+        seen = defaultdict(list)
+        for section_id, course_id, slot_id, room_id in placed:
+            owner = key(course_id, room_id)
+            if owner is None or slot_id is None:
+                continue
+            slot = index[slot_id]
+            for other in overlap[slot]:
+                for earlier in seen[owner, other]:
+                    found.append((owner, earlier, section_id))
+            seen[owner, slot].append(section_id)
+
+    double_bookings(lambda course_id, room_id: teachers.get(course_id), clashes.teachers)
+    double_bookings(lambda course_id, room_id: room_id, clashes.rooms)
+
+    occupied, covered = defaultdict(int), defaultdict(int)
+    for section_id, course_id, slot_id, room_id in placed:
+        if slot_id is None:
+            continue
+        slot = index[slot_id]
+        if covered[course_id] & 1 << slot:
+            # The course's own sections overlap.
+            clashes.courses[course_id, course_id] += 1
+        occupied[course_id] |= 1 << slot
+        covered[course_id] |= masks[slot]
+
+    for courses in students:
+        seen, union = [], 0
+        clashed = False
+        for course_id in courses:
+            if occupied[course_id] & union:
+                for earlier in seen:
+                    if occupied[course_id] & covered[earlier]:
+                        clashes.courses[min(earlier, course_id), max(earlier, course_id)] += 1
+                clashed = True
+            seen.append(course_id)
+            union |= covered[course_id]
+        clashes.students += clashed
+    return clashes
+
+# Database side.
+
+def ensure_slots():
+    '''
+    Add the slots in TIMETABLE_DAYS x TIMETABLE_PERIODS that do not exist
+    yet. Returns the number added.
+    '''
+
+    config = current_app.config
+    wanted = {
+        (day, minutes(start), minutes(end))
+        for day in config['TIMETABLE_DAYS'] for start, end in config['TIMETABLE_PERIODS']
+    }
+    existing = set(db.session.execute(select(TimeSlot.day, TimeSlot.starts_at, TimeSlot.ends_at)).tuples().all())
+    missing = sorted(wanted - existing)
+    if missing:
+        db.session.execute(insert(TimeSlot.__table__), [
+            {'day': day, 'starts_at': starts_at, 'ends_at': ends_at} for day, starts_at, ends_at in missing
+        ])
+    return len(missing)
+
+def ensure_sections():
+    '''
+    Give every course one section per credit, adding or removing
+    sections with one grouped read and two bulk statements. Returns the
+    number of sections added and removed.
+    '''
+
+    counts = dict(db.session.execute(
+        select(Course.course_id, func.count(Section.section_id))
+        .outerjoin(Section, Section.course_id == Course.course_id)
+        .group_by(Course.course_id)
+    ).tuples().all())
+    credits = dict(db.session.execute(select(Course.course_id, Course.credits)).tuples().all())
+
+    missing = [
+        {'course_id': course_id}
+        for course_id, wanted in credits.items() for _ in range(wanted - counts.get(course_id, 0))
+    ]
+    if missing:
+        db.session.execute(insert(Section.__table__), missing)
+
+    extra = {course_id: counts[course_id] - wanted for course_id, wanted in credits.items() if counts.get(course_id, 0) > wanted}
+    removed = []
+    for course_id, count in extra.items():
+        stmt = select(Section.section_id).where(Section.course_id == course_id).order_by(Section.section_id.desc()).limit(count)
+        removed += db.session.execute(stmt).scalars()
+    if removed:
+        table = Section.__table__
+        db.session.execute(delete(table).where(table.c.section_id == bindparam('b_section_id')),
+                           [{'b_section_id': section_id} for section_id in removed])
+    return len(missing), len(removed)
+
+def _slots():
+    return db.session.execute(
+        select(TimeSlot.slot_id, TimeSlot.day, TimeSlot.starts_at, TimeSlot.ends_at).order_by(TimeSlot.slot_id)
+    ).tuples().all()
+
+def _students():
+    '''
+    Return every student's course ids, read in one pass over the
+    enrollments in student order.
+    '''
+
+    stmt = select(Enrollment.student_id, Enrollment.course_id).order_by(Enrollment.student_id)
+    return [
+        [course_id for _, course_id in rows]
+        for _, rows in itertools.groupby(db.session.execute(stmt).tuples(), key=lambda row: row[0])
+    ]
+
+def load_problem():
+    '''
+    Read the timetabling problem for the current courses, rooms, slots
+    and enrollments.
+    '''
+
+    courses = db.session.execute(select(Course.course_id, Course.teacher_id, Course.seats_taken)).tuples().all()
+    return Problem(
+        slots=_slots(),
+        rooms=db.session.execute(select(Room.room_id, Room.capacity)).tuples().all(),
+        sections=db.session.execute(select(Section.section_id, Section.course_id).order_by(Section.section_id)).tuples().all(),
+        teachers={course_id: teacher_id for course_id, teacher_id, _ in courses},
+        sizes={course_id: seats_taken for course_id, _, seats_taken in courses},
+        students=_students()
+    )
+
+def build(seconds=None, seed=0):
+    '''
+    Schedule every section: sync slots and sections, solve, and write
+    the result with one executemany UPDATE. Sections the solver could
+    not place are left without a slot. Returns the Timetable.
+    '''
+
+    seconds = seconds or current_app.config['TIMETABLE_SOLVER_SECONDS']
+    ensure_slots()
+    ensure_sections()
+    result = solve(load_problem(), seconds, seed)
+
+    table = Section.__table__
+    # Clear first so the (slot, room) unique constraint holds while rows move.
+    db.session.execute(update(table).values(slot_id=None, room_id=None))
+    if result.assignments:
+        db.session.execute(
+            update(table).where(table.c.section_id == bindparam('b_section_id'))
+            .values(slot_id=bindparam('b_slot_id'), room_id=bindparam('b_room_id')),
+            [
+                {'b_section_id': section_id, 'b_slot_id': slot_id, 'b_room_id': room_id}
+                for section_id, (slot_id, room_id) in result.assignments.items()
+            ]
+        )
+    db.session.commit()
+    return result
+
+def clashes():
+    '''
+    Check the stored timetable for teacher, room and student clashes.
+    '''
+
+    teachers = dict(db.session.execute(select(Course.course_id, Course.teacher_id)).tuples().all())
+    placed = db.session.execute(
+        select(Section.section_id, Section.course_id, Section.slot_id, Section.room_id).where(Section.slot_id.isnot(None))
+    ).tuples().all()
+    return find_clashes(_slots(), placed, teachers, _students())
+
+def _schedule(stmt):
+    '''
+    Return schedule rows for the sections selected by stmt, in weekly
+    order.
+    '''
+
+    stmt = (
+        stmt.add_columns(TimeSlot.day, TimeSlot.starts_at, TimeSlot.ends_at, Course.course_name, Room.name.label('room'))
+        .join(Course, Section.course_id == Course.course_id)
+        .join(TimeSlot, Section.slot_id == TimeSlot.slot_id)
+        .outerjoin(Room, Section.room_id == Room.room_id)
+        .order_by(TimeSlot.day, TimeSlot.starts_at, Course.course_name)
+    )
+    return [
+        {
+            'day': DAYS[row.day],
+            'starts_at': clock(row.starts_at),
+            'ends_at': clock(row.ends_at),
+            'course_name': row.course_name,
+            'room': row.room
+        }
+        for row in db.session.execute(stmt)
+    ]
+
+def student_schedule(student_id):
+    return _schedule(
+        select(Section.section_id)
+        .join(Enrollment, Enrollment.course_id == Section.course_id)
+        .where(Enrollment.student_id == student_id)
+    )
+
+def teacher_schedule(teacher_id):
+    return _schedule(select(Section.section_id).where(Course.teacher_id == teacher_id))
+
+def sections(course_id=None):
+    '''
+    Return every section with its course, teacher, room and slot, in
+    weekly order with unscheduled sections last.
+    '''
+
+    stmt = (
+        select(Section.section_id, Course.course_id, Course.course_name, User.first_name, User.last_name,
+               Room.name.label('room'), TimeSlot.day, TimeSlot.starts_at, TimeSlot.ends_at)
+        .join(Course, Section.course_id == Course.course_id)
+        .outerjoin(Teacher, Course.teacher_id == Teacher.teacher_id)
+        .outerjoin(User, Teacher.user_id == User.id)
+        .outerjoin(Room, Section.room_id == Room.room_id)
+        .outerjoin(TimeSlot, Section.slot_id == TimeSlot.slot_id)
+        .order_by(TimeSlot.day.asc().nulls_last(), TimeSlot.starts_at, Course.course_name, Section.section_id)
+    )
+    if course_id is not None:
+        stmt = stmt.where(Section.course_id == course_id)
+    return db.session.execute(stmt).all()
@@ -0,0 +1,59 @@
+# app/verification.py
+
+from sqlalchemy import func, select, update
+
+from . import db, stats
+from .identity import identity_cache
+from .models import User
+from .search import search_index
+from .sessions import session_store
+
+def pending_filter(user_ids=None, role=None, email_domain=None):
+    '''
+    Build the WHERE clause selecting unverified users, optionally limited
+    to explicit ids, a role and an email domain.
+    '''
+
+    clauses = [User.status == False]
+    if user_ids is not None:
+        clauses.append(User.id.in_(user_ids))
+    if role:
+        clauses.append(User.role == role)
+    if email_domain:
+        clauses.append(User.email.like('%@' + email_domain.lstrip('@')))
+    return clauses
+
+def count_pending(role=None, email_domain=None):
+    '''
+    Count unverified users matching the filters.
+    '''
+
+    stmt = select(func.count()).select_from(User).where(*pending_filter(role=role, email_domain=email_domain))
+    return db.session.execute(stmt).scalar()
+
+def verify_users(user_ids=None, role=None, email_domain=None):
+    '''
+    Verify every pending user matching the filters with one set-based
+    UPDATE, drop their cached identities and sessions, refresh them in
+    the search index and lower the pending count.
+    Returns how many users were verified.
+    '''
+
+    clauses = pending_filter(user_ids, role, email_domain)
+    stmt = update(User).where(*clauses).values(status=True).execution_options(synchronize_session=False)
+
+    if db.session.get_bind().dialect.update_returning:
+        verified = list(db.session.execute(stmt.returning(User.id)).scalars())
+    else:
+        verified = list(db.session.execute(select(User.id).where(*clauses)).scalars())
+        db.session.execute(stmt)
+
+    stats.adjust(db.session, {(stats.UNVERIFIED, 0): -len(verified)})
+    db.session.commit()
+
+    # Bulk UPDATEs bypass the ORM events that normally invalidate the cache,
+    # revoke sessions and keep the search index current.
+    identity_cache.invalidate(*verified)
+    session_store.revoke(*verified)
+    search_index.refresh(user_ids=verified)
+    return len(verified)
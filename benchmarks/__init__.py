@@ -0,0 +1,10 @@
+# benchmarks/__init__.py
+
+'''
+Synthetic data generator and end-to-end benchmark suite.
+
+Run with: python -m benchmarks --help
+Enrollment load test: python -m benchmarks.contention --help
+Timetable solver: python -m benchmarks.timetable --help
+Session backends: python -m benchmarks.sessions --help
+'''
@@ -0,0 +1,74 @@
+# benchmarks/__main__.py
+
+import sys
+import time
+
+import click
+
+from app import create_app, db
+from .datagen import Sizes, create_schema, generate, temp_database_url
+from .runner import build_scenarios, compare, format_report, load, measure, save
+
+@click.command()
+@click.option('--database-url', default=temp_database_url('ums-benchmark.db'), show_default=True,
+              help='Database to build and benchmark. It is dropped and recreated unless --reuse is given.')
+@click.option('--students', default=1000, show_default=True)
+@click.option('--teachers', default=50, show_default=True)
+@click.option('--courses', default=100, show_default=True)
+@click.option('--enrollments', default=5000, show_default=True)
+@click.option('--fees', type=int, help='Defaults to one fee per enrollment.')
+@click.option('--seed', default=0, show_default=True)
+@click.option('--requests', default=30, show_default=True, help='Timed requests per endpoint.')
+@click.option('--reuse', is_flag=True, help='Benchmark an existing generated database as is.')
+@click.option('--output', type=click.Path(dir_okay=False), help='Write results to this JSON file.')
+@click.option('--baseline', type=click.Path(exists=True, dir_okay=False), help='Fail if results regress from this file.')
+@click.option('--session-store', default='cookie', show_default=True,
+              help='SESSION_STORE to run with: "database", "memory://", a redis:// URL, or "cookie" for signed cookies.')
+@click.option('--tolerance', default=0.25, show_default=True, help='Allowed relative growth in p95 latency and memory.')
+def main(database_url, students, teachers, courses, enrollments, fees, seed, requests, reuse, output, baseline,
+         session_store, tolerance):
+    '''
+    Build a synthetic database and measure every page of the app.
+    '''
+
+    app = create_app('production', config_overrides={
+        'SQLALCHEMY_DATABASE_URI': database_url,
+        'SQLALCHEMY_ECHO': False,
+        'SECRET_KEY': 'benchmark',
+        'WTF_CSRF_ENABLED': False,
+        'TESTING': True,
+        # Queued jobs are run and timed by measure(), not by worker threads.
+        'JOB_WORKERS': 0,
+        'SESSION_STORE': None if session_store == 'cookie' else session_store
+    })
+    sizes = Sizes(students, teachers, courses, enrollments, fees)
+
+    with app.app_context():
+        if not reuse:
+            start = time.perf_counter()
+            create_schema()
+            generate(sizes, seed)
+            click.echo(f'Generated database in {time.perf_counter() - start:.1f}s')
+
+        scenarios = build_scenarios(requests, seed)
+        db.session.remove()
+
+    results = measure(app, scenarios, requests)
+
+    click.echo(format_report(results))
+
+    meta = {'sizes': vars(sizes), 'seed': seed, 'requests': requests, 'session_store': session_store}
+    if output:
+        save(output, results, meta)
+
+    if baseline:
+        regressions = compare(results, load(baseline), tolerance)
+        if regressions:
+            click.echo('\nREGRESSIONS AGAINST BASELINE:', err=True)
+            for regression in regressions:
+                click.echo(f'  {regression}', err=True)
+            sys.exit(1)
+        click.echo('\nNo regressions against baseline.')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+# benchmarks/contention.py
+
+import sys
+import threading
+import time
+
+import click
+from sqlalchemy import func, select, update
+from sqlalchemy.exc import OperationalError
+
+from app import create_app, db, enrollment
+from app.models import Course, Enrollment, Student, Waitlist
+from .datagen import Sizes, create_schema, generate, temp_database_url
+from .runner import percentile
+
+def _run(app, jobs, action, attempts=5):
+    '''
+    Start one thread per (student_id, course_id) job, release them all
+    at once and call action on each. Returns the per-call latencies in
+    milliseconds, the statuses returned and how many calls had to be
+    retried because the database was locked.
+    '''
+
+    barrier = threading.Barrier(len(jobs))
+    latencies, statuses, retries, errors = [], [], [0], []
+    lock = threading.Lock()
+
+    def worker(student_id, course_id):
+        with app.app_context():
+            barrier.wait()
+            start = time.perf_counter()
+            for attempt in range(attempts):
+                try:
+                    status = action(student_id, course_id)
+                    break
+                except OperationalError as e:
+                    # SQLite allows one writer at a time; busy timeouts are retried.
+                    db.session.rollback()
+                    with lock:
+                        retries[0] += 1
+                    if attempt == attempts - 1:
+                        with lock:
+                            errors.append(str(e.orig))
+                        return
+                finally:
+                    db.session.remove()
+            elapsed = (time.perf_counter() - start) * 1000.0
+            with lock:
+                latencies.append(elapsed)
+                statuses.append(status)
+
+    threads = [threading.Thread(target=worker, args=job) for job in jobs]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    if errors:
+        raise click.ClickException(f'{len(errors)} calls failed: {errors[0]}')
+    return latencies, statuses, retries[0]
+
+def check(course_id, capacity):
+    '''
+    Verify the course's seat invariants. Returns a list of violations.
+    '''
+
+    seats_taken = db.session.execute(select(Course.seats_taken).where(Course.course_id == course_id)).scalar()
+    enrolled = db.session.execute(select(func.count()).where(Enrollment.course_id == course_id)).scalar()
+    distinct = db.session.execute(
+        select(func.count(Enrollment.student_id.distinct())).where(Enrollment.course_id == course_id)
+    ).scalar()
+    waiting = db.session.execute(select(func.count()).where(Waitlist.course_id == course_id)).scalar()
+    both = db.session.execute(
+        select(func.count()).select_from(Enrollment)
+        .join(Waitlist, (Waitlist.student_id == Enrollment.student_id) & (Waitlist.course_id == Enrollment.course_id))
+        .where(Enrollment.course_id == course_id)
+    ).scalar()
+
+    violations = []
+    if enrolled > capacity:
+        violations.append(f'overbooked: {enrolled} enrolled for {capacity} seats')
+    if seats_taken != enrolled:
+        violations.append(f'seat counter drifted: {seats_taken} seats taken, {enrolled} enrolled')
+    if distinct != enrolled:
+        violations.append(f'duplicate enrollments: {enrolled - distinct}')
+    if both:
+        violations.append(f'{both} students are both enrolled and waitlisted')
+    if waiting and enrolled < capacity:
+        violations.append(f'{capacity - enrolled} seats free while {waiting} students wait')
+    return violations, enrolled, waiting
+
+def report(name, latencies, statuses, retries, elapsed):
+    counts = {status: statuses.count(status) for status in sorted(set(statuses))}
+    click.echo(
+        f'{name:<8}{len(latencies):>7} calls {len(latencies) / elapsed:>9.1f}/s'
+        f'  p50 {percentile(latencies, 50):>8.2f}ms  p95 {percentile(latencies, 95):>8.2f}ms'
+        f'  retries {retries:<4} {counts}'
+    )
+
+@click.command()
+@click.option('--database-url', default=temp_database_url('ums-contention.db'), show_default=True,
+              help='Database to build and load test. It is dropped and recreated.')
+@click.option('--enrollers', default=300, show_default=True, help='Concurrent students enrolling in one course.')
+@click.option('--capacity', default=100, show_default=True, help='Seats in the contended course.')
+@click.option('--repeats', default=2, show_default=True, help='Times each student sends the enroll request.')
+@click.option('--drops', default=50, show_default=True, help='Enrolled students who then drop concurrently.')
+def main(database_url, enrollers, capacity, repeats, drops):
+    '''
+    Load test the enrollment engine: many students race for the seats
+    of one course, some of them repeat their requests, then some drop
+    and waitlisted students are promoted. Exits 1 if the course is ever
+    overbooked or its seat count drifts.
+    '''
+
+    options = {'pool_size': enrollers * repeats, 'max_overflow': 0}
+    if database_url.startswith('sqlite'):
+        options['connect_args'] = {'timeout': 60}
+
+    app = create_app('production', config_overrides={
+        'SQLALCHEMY_DATABASE_URI': database_url,
+        'SQLALCHEMY_ENGINE_OPTIONS': options,
+        'SQL_INSTRUMENTATION': False,
+        'TESTING': True
+    })
+
+    with app.app_context():
+        create_schema()
+        generate(Sizes(students=enrollers, teachers=1, courses=1, enrollments=0, unverified=0))
+        course_id = db.session.execute(select(Course.course_id)).scalar()
+        db.session.execute(update(Course).where(Course.course_id == course_id).values(capacity=capacity))
+        db.session.commit()
+        students = list(db.session.execute(select(Student.roll_no).order_by(Student.roll_no)).scalars())
+        db.session.remove()
+
+    violations = []
+
+    jobs = [(student_id, course_id) for student_id in students for _ in range(repeats)]
+    start = time.perf_counter()
+    latencies, statuses, retries = _run(app, jobs, enrollment.enroll)
+    report('enroll', latencies, statuses, retries, time.perf_counter() - start)
+
+    with app.app_context():
+        found, enrolled, waiting = check(course_id, capacity)
+        violations += found
+        if enrolled + waiting != len(students):
+            violations.append(f'{len(students) - enrolled - waiting} students were lost')
+        leaving = list(db.session.execute(
+            select(Enrollment.student_id).where(Enrollment.course_id == course_id)
+            .order_by(Enrollment.student_id).limit(drops)
+        ).scalars())
+        db.session.remove()
+
+    jobs = [(student_id, course_id) for student_id in leaving]
+    if jobs:
+        start = time.perf_counter()
+        latencies, statuses, retries = _run(app, jobs, enrollment.drop)
+        report('drop', latencies, statuses, retries, time.perf_counter() - start)
+
+    with app.app_context():
+        found, enrolled, waiting = check(course_id, capacity)
+        violations += found
+        click.echo(f'\n{enrolled} enrolled, {waiting} waitlisted for {capacity} seats')
+
+    if violations:
+        click.echo('\nINVARIANT VIOLATIONS:', err=True)
+        for violation in violations:
+            click.echo(f'  {violation}', err=True)
+        sys.exit(1)
+    click.echo('No overbooking, duplicate enrollments or seat drift.')
+
+if __name__ == '__main__':
+    main()
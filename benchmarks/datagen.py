@@ -0,0 +1,197 @@
+# benchmarks/datagen.py
+
+import datetime
+import itertools
+import os
+import random
+import tempfile
+
+from sqlalchemy import MetaData, insert, select
+from sqlalchemy.sql.functions import next_value
+
+from app import db, enrollment, fees, stats
+from app.importer import allocate_ids
+from app.models import Course, Department, Enrollment, Fee, Student, Teacher, User
+from app.reference import SPECIALITIES
+
+DEPARTMENTS = ('CS', 'SE', 'AI', 'CYS', 'EE')
+FIRST_NAMES = ('Ali', 'Sara', 'Omar', 'Ayesha', 'Bilal', 'Fatima', 'Hamza', 'Zainab', 'Usman', 'Maryam')
+LAST_NAMES = ('Khan', 'Ahmed', 'Malik', 'Hussain', 'Sheikh', 'Iqbal', 'Raza', 'Butt', 'Qureshi', 'Chaudhry')
+FEE_AMOUNTS = (15000.0, 22500.0, 30000.0)
+TERMS = ('Fall 2024', 'Spring 2025', 'Fall 2025')
+FIRST_DUE_DATE = datetime.date(2024, 9, 1)
+CONTACT_PREFIXES = {'Student': '1', 'Teacher': '2', 'Admin': '3'}
+PASSWORD = 'password'
+CHUNK_SIZE = 10000
+
+class Sizes(object):
+    '''
+    Row counts for a generated database.
+    '''
+
+    def __init__(self, students=1000, teachers=50, courses=100, enrollments=5000, fees=None, unverified=0.1):
+        self.students = students
+        self.teachers = teachers
+        self.courses = courses
+        self.enrollments = min(enrollments, students * courses)
+        self.fees = self.enrollments if fees is None else min(fees, self.enrollments)
+        self.unverified = unverified
+
+def temp_database_url(name):
+    '''
+    A SQLite URL for a scratch database in the system temp directory. A
+    relative sqlite:/// path would land in the Flask instance folder.
+    '''
+
+    return 'sqlite:///' + os.path.join(tempfile.gettempdir(), name)
+
+def create_schema():
+    '''
+    Drop and recreate every table. Backends without sequences (SQLite)
+    cannot compile the sequence server defaults, so the tables are
+    created from a copy of the schema without them, and the integer
+    primary keys fall back to autoincrement. The app's own metadata is
+    left untouched.
+    '''
+
+    metadata = db.metadata
+    if not db.engine.dialect.supports_sequences:
+        metadata = MetaData()
+        for table in db.metadata.sorted_tables:
+            table = table.to_metadata(metadata)
+            for column in table.columns:
+                if column.server_default is not None and isinstance(column.server_default.arg, next_value):
+                    column.server_default = None
+
+    metadata.drop_all(db.engine)
+    metadata.create_all(db.engine)
+
+def _chunks(rows, size=CHUNK_SIZE):
+    rows = iter(rows)
+    while True:
+        chunk = list(itertools.islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+def _insert(model, key, sequence, chunk):
+    '''
+    Insert one chunk of rows with executemany, assigning primary keys
+    reserved from the sequence. Returns the keys in row order.
+    '''
+
+    column = getattr(model, key)
+    ids = allocate_ids(sequence, column, len(chunk))
+    db.session.execute(insert(model.__table__), [dict(row, **{key: ident}) for row, ident in zip(chunk, ids)])
+    return ids
+
+def _user(rng, role, n, verified=True):
+    return {
+        'email': f'{role.lower()}{n}@uni.edu',
+        'username': f'{role.lower()}{n}',
+        '_password': PASSWORD,
+        'first_name': rng.choice(FIRST_NAMES),
+        'last_name': rng.choice(LAST_NAMES),
+        'contact': f'{CONTACT_PREFIXES[role]}{n:010d}',
+        'address': f'House {n}, Street {n % 97}, Lahore',
+        'role': role,
+        'is_admin': role == 'Admin',
+        'status': verified
+    }
+
+def generate(sizes, seed=0):
+    '''
+    Populate an empty schema with deterministic synthetic data. The same
+    sizes and seed always produce the same rows.
+    '''
+
+    rng = random.Random(seed)
+
+    db.session.execute(insert(Department.__table__), [
+        {'dep_id': dep_id, 'dep_name': name} for dep_id, name in enumerate(DEPARTMENTS, start=1)
+    ])
+
+    admin_id = _insert(User, 'id', User.id_seq, [_user(rng, 'Admin', 0)])[0]
+
+    teacher_ids = []
+    for chunk in _chunks(range(sizes.teachers)):
+        user_ids = _insert(User, 'id', User.id_seq, [_user(rng, 'Teacher', n) for n in chunk])
+        teacher_ids += _insert(Teacher, 'teacher_id', Teacher.teacher_id_seq, [
+            {'user_id': user_id, 'speciality': rng.choice(SPECIALITIES)} for user_id in user_ids
+        ])
+        db.session.commit()
+
+    course_ids = []
+    for chunk in _chunks(range(sizes.courses)):
+        course_ids += _insert(Course, 'course_id', Course.course_id_seq, [
+            {
+                'course_name': f'Course {n:05d}',
+                'credits': rng.randint(1, 3),
+                'teacher_id': rng.choice(teacher_ids) if teacher_ids else None
+            }
+            for n in chunk
+        ])
+        db.session.commit()
+
+    roll_nos = []
+    for chunk in _chunks(range(sizes.students)):
+        user_ids = _insert(User, 'id', User.id_seq, [
+            _user(rng, 'Student', n, verified=rng.random() >= sizes.unverified) for n in chunk
+        ])
+        roll_nos += _insert(Student, 'roll_no', Student.roll_no_seq, [
+            {'user_id': user_id, 'department_id': rng.randint(1, len(DEPARTMENTS))} for user_id in user_ids
+        ])
+        db.session.commit()
+
+    pair_seed = rng.random()
+    for chunk in _chunks(_pairs(random.Random(pair_seed), roll_nos, course_ids, sizes.enrollments)):
+        _insert(Enrollment, 'enrollment_id', Enrollment.enrollment_id_seq, [
+            {'student_id': student_id, 'course_id': course_id} for student_id, course_id in chunk
+        ])
+        db.session.commit()
+    enrollment.recount_seats()
+
+    # Fees follow the first enrollments, one per (student, course) pair.
+    pairs = _pairs(random.Random(pair_seed), roll_nos, course_ids, sizes.enrollments)
+    for chunk in _chunks(itertools.islice(pairs, sizes.fees)):
+        _insert(Fee, 'fee_id', Fee.fee_id_seq, [
+            {
+                'student_id': student_id,
+                'course_id': course_id,
+                'amount': FEE_AMOUNTS[course_id % len(FEE_AMOUNTS)],
+                'fee_status': 'Paid' if (student_id + course_id) % 3 else 'Pending',
+                'term': TERMS[course_id % len(TERMS)],
+                'due_date': FIRST_DUE_DATE + datetime.timedelta(days=(course_id % len(TERMS)) * 150 + student_id % 30)
+            }
+            for student_id, course_id in chunk
+        ])
+        db.session.commit()
+
+    # Bulk inserts bypass the ledger and dashboard counter listeners.
+    fees.rebuild()
+    stats.reconcile()
+
+    return admin_id
+
+def _pairs(rng, roll_nos, course_ids, total):
+    '''
+    Yield total distinct (student, course) pairs spread evenly over the
+    students.
+    '''
+
+    if not roll_nos or not course_ids:
+        return
+
+    per_student, extra = divmod(total, len(roll_nos))
+    for index, roll_no in enumerate(roll_nos):
+        count = per_student + (1 if index < extra else 0)
+        for course_id in rng.sample(course_ids, count):
+            yield roll_no, course_id
+
+def sample_ids(model, key, limit, seed=0):
+    '''
+    Return a deterministic sample of primary keys from a generated table.
+    '''
+
+    ids = list(db.session.execute(select(getattr(model, key)).order_by(getattr(model, key))).scalars())
+    return random.Random(seed).sample(ids, min(limit, len(ids)))
@@ -0,0 +1,288 @@
+# benchmarks/runner.py
+
+import contextlib
+import io
+import json
+import math
+import threading
+import time
+import tracemalloc
+
+from sqlalchemy import event, select
+
+from app import db
+from app.jobs import job_workers
+from app.models import Course, Student, Teacher, User
+from .datagen import PASSWORD, sample_ids
+
+# Names, typos, partial names and numbers typed into the search box.
+SEARCH_QUERIES = ('ali', 'sara khan', 'maryam q', 'khna', 'student12', '1000', 'course 0001')
+
+class BenchmarkError(Exception):
+    '''
+    Raised when an endpoint under benchmark does not respond successfully.
+    '''
+
+class Scenario(object):
+    '''
+    A single endpoint to measure. request(client, i) issues the i-th
+    request; as_user selects which logged-in client it runs with, and
+    status is the response code every request must get. Scenarios that
+    queue a background job set jobs, and the job is run and measured as
+    a step of its own after each request.
+    '''
+
+    def __init__(self, name, request, as_user='admin', status=200, jobs=False):
+        self.name = name
+        self.request = request
+        self.as_user = as_user
+        self.status = status
+        self.jobs = jobs
+
+def percentile(values, pct):
+    '''
+    Nearest-rank percentile of a list of numbers.
+    '''
+
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100.0 * len(ordered)))
+    return ordered[rank - 1]
+
+class QueryCounter(object):
+    '''
+    Counts statements executed on the app's engine by the thread that
+    created it, so statements from other threads, such as job workers,
+    are not charged to the request being measured.
+    '''
+
+    def __init__(self):
+        self.count = 0
+        self.engine = db.engine
+        self.thread = threading.get_ident()
+        event.listen(self.engine, 'before_cursor_execute', self._count)
+
+    def _count(self, *args):
+        if threading.get_ident() == self.thread:
+            self.count += 1
+
+    def close(self):
+        event.remove(self.engine, 'before_cursor_execute', self._count)
+
+def build_scenarios(requests, seed=0):
+    '''
+    Build the scenario list, sampling the rows that edit, verify and
+    delete requests operate on. Destructive scenarios get a distinct row
+    for every request.
+    '''
+
+    needed = requests * 2 + 1
+    courses = {
+        row.course_id: row
+        for row in db.session.execute(
+            select(Course.course_id, Course.course_name, Course.credits, Course.teacher_id)
+            .where(Course.course_id.in_(sample_ids(Course, 'course_id', needed * 2, seed)))
+        )
+    }
+    course_ids = list(courses)
+    edit_courses, delete_courses = course_ids[:needed], course_ids[needed:]
+    students = sample_ids(Student, 'roll_no', needed * 2, seed)
+    edit_students, delete_students = students[:needed], students[needed:]
+    teachers = sample_ids(Teacher, 'teacher_id', needed * 2, seed)
+    edit_teachers, delete_teachers = teachers[:needed], teachers[needed:]
+    pending = list(db.session.execute(
+        select(User.id).where(User.status == False).order_by(User.id).limit(needed)
+    ).scalars())
+
+    def pick(ids, i):
+        return ids[i % len(ids)]
+
+    def edit_course(client, i):
+        course = courses[pick(edit_courses, i)]
+        return client.post(f'/admin/courses/edit/{course.course_id}', data={
+            'name': course.course_name, 'credits': course.credits, 'teacher_id': course.teacher_id
+        })
+
+    def register(client, i):
+        return client.post('/register', data={
+            'email': f'bench{seed}x{i}@uni.edu', 'username': f'bench{seed}x{i}',
+            'first_name': 'Bench', 'last_name': 'User', 'contact': f'9{seed:03d}{i:07d}',
+            'address': 'Benchmark', 'role': 'Student', 'password': PASSWORD, 'confirm_password': PASSWORD
+        })
+
+    scenarios = [
+        Scenario('login', lambda c, i: c.post('/login', data={'email': 'admin0@uni.edu', 'password': PASSWORD}), None, 302),
+        Scenario('register', register, None, 302),
+        Scenario('dashboard', lambda c, i: c.get('/dashboard'), 'student'),
+        Scenario('admin_dashboard', lambda c, i: c.get('/admin/dashboard')),
+        Scenario('list_courses', lambda c, i: c.get('/admin/courses')),
+        Scenario('list_students', lambda c, i: c.get('/admin/students')),
+        Scenario('list_teachers', lambda c, i: c.get('/admin/teachers')),
+        Scenario('list_unverified_users', lambda c, i: c.get('/admin/unverified_users')),
+        Scenario('edit_course_get', lambda c, i: c.get(f'/admin/courses/edit/{pick(edit_courses, i)}')),
+        Scenario('edit_course_post', edit_course, status=302),
+        Scenario('edit_student_get', lambda c, i: c.get(f'/admin/students/edit/{pick(edit_students, i)}')),
+        Scenario('edit_student_post', lambda c, i: c.post(
+            f'/admin/students/edit/{pick(edit_students, i)}', data={'department_id': i % 5 + 1}), status=302),
+        Scenario('edit_teacher_get', lambda c, i: c.get(f'/admin/teachers/edit/{pick(edit_teachers, i)}')),
+        Scenario('edit_teacher_post', lambda c, i: c.post(
+            f'/admin/teachers/edit/{pick(edit_teachers, i)}', data={'speciality': 'CS'}), status=302),
+        Scenario('search', lambda c, i: c.get('/admin/search', query_string={'q': pick(SEARCH_QUERIES, i)})),
+        Scenario('autocomplete', lambda c, i: c.get(
+            '/admin/search/autocomplete', query_string={'q': pick(SEARCH_QUERIES, i)[:i % 4 + 2]})),
+    ]
+    if pending:
+        scenarios.append(Scenario('verify_user', lambda c, i: c.post(
+            f'/admin/unverified_users/verify_user/{pick(pending, i)}', data={'submit': 'Verify User'}), status=302))
+    if len(delete_courses) >= needed:
+        scenarios.append(Scenario(
+            'delete_course', lambda c, i: c.get(f'/admin/courses/delete/{delete_courses[i]}'), status=302, jobs=True))
+    if len(delete_students) >= needed:
+        scenarios.append(Scenario(
+            'delete_student', lambda c, i: c.get(f'/admin/students/delete/{delete_students[i]}'), status=302, jobs=True))
+    if len(delete_teachers) >= needed:
+        scenarios.append(Scenario(
+            'delete_teacher', lambda c, i: c.get(f'/admin/teachers/delete/{delete_teachers[i]}'), status=302))
+
+    return scenarios
+
+def _login(app, email):
+    client = app.test_client()
+    with contextlib.redirect_stdout(io.StringIO()):
+        response = client.post('/login', data={'email': email, 'password': PASSWORD})
+    if response.status_code != 302:
+        raise BenchmarkError(f'Could not log in as {email}')
+    return client
+
+def measure(app, scenarios, requests, memory_samples=5):
+    '''
+    Run every scenario and return per-endpoint latency percentiles,
+    queries per request, peak allocated memory and the size of the
+    session cookie the client sends afterwards. Call it outside an app
+    context, so every request gets its own context, g and database
+    session, as it would from a real server. Queued jobs are run with
+    job_workers.run_pending() and reported as "<scenario>_jobs".
+    '''
+
+    with app.app_context():
+        student_email = db.session.execute(
+            select(User.email).where(User.role == 'Student', User.status == True).order_by(User.id).limit(1)
+        ).scalar()
+    clients = {
+        None: app.test_client(),
+        'admin': _login(app, 'admin0@uni.edu'),
+        'student': _login(app, student_email) if student_email else None
+    }
+
+    with app.app_context():
+        counter = QueryCounter()
+    results = {}
+    try:
+        for scenario in scenarios:
+            client = clients[scenario.as_user]
+            if client is None:
+                continue
+
+            def call(i):
+                response = scenario.request(client, i)
+                if response.status_code != scenario.status:
+                    raise BenchmarkError(
+                        f'{scenario.name} returned {response.status_code}, expected {scenario.status}'
+                    )
+
+            def run_jobs(i):
+                with app.app_context():
+                    ran = job_workers.run_pending()
+                if ran != 1:
+                    raise BenchmarkError(f'{scenario.name} left {ran} jobs to run, expected 1')
+
+            steps = [(scenario.name, call)]
+            if scenario.jobs:
+                steps.append((f'{scenario.name}_jobs', run_jobs))
+            latencies = {name: [] for name, _ in steps}
+            queries = {name: [] for name, _ in steps}
+            peaks = {name: 0 for name, _ in steps}
+
+            # The views print debugging output; keep it out of the report.
+            with contextlib.redirect_stdout(io.StringIO()):
+                for _, step in steps:
+                    step(0)
+
+                for i in range(1, requests + 1):
+                    for name, step in steps:
+                        counter.count = 0
+                        start = time.perf_counter()
+                        step(i)
+                        latencies[name].append((time.perf_counter() - start) * 1000.0)
+                        queries[name].append(counter.count)
+
+                tracemalloc.start()
+                for i in range(requests + 1, requests + 1 + min(memory_samples, requests)):
+                    for name, step in steps:
+                        tracemalloc.reset_peak()
+                        baseline = tracemalloc.get_traced_memory()[0]
+                        step(i)
+                        peaks[name] = max(peaks[name], tracemalloc.get_traced_memory()[1] - baseline)
+                tracemalloc.stop()
+
+            cookie = client.get_cookie(app.config['SESSION_COOKIE_NAME'])
+
+            for name, _ in steps:
+                results[name] = {
+                    'p50_ms': round(percentile(latencies[name], 50), 3),
+                    'p95_ms': round(percentile(latencies[name], 95), 3),
+                    'p99_ms': round(percentile(latencies[name], 99), 3),
+                    'queries': round(sum(queries[name]) / len(queries[name]), 2),
+                    'peak_kib': round(peaks[name] / 1024.0, 1),
+                    'cookie_bytes': 0 if cookie is None else len(cookie.value)
+                }
+    finally:
+        counter.close()
+
+    return results
+
+def format_report(results):
+    '''
+    Render results as a fixed-width table.
+    '''
+
+    lines = [
+        f'{"endpoint":<24}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}{"queries":>10}{"peak KiB":>11}{"cookie B":>10}'
+    ]
+    for name, r in results.items():
+        lines.append(
+            f'{name:<24}{r["p50_ms"]:>10.2f}{r["p95_ms"]:>10.2f}{r["p99_ms"]:>10.2f}'
+            f'{r["queries"]:>10.2f}{r["peak_kib"]:>11.1f}{r["cookie_bytes"]:>10}'
+        )
+    return '\n'.join(lines)
+
+def compare(results, baseline, tolerance=0.25):
+    '''
+    Compare results against a stored baseline. Any increase in queries
+    per request or in session cookie size is a regression; latency (p95)
+    and memory may grow by at most tolerance. Returns a list of
+    regression messages.
+    '''
+
+    regressions = []
+    for name, base in baseline.get('results', {}).items():
+        current = results.get(name)
+        if current is None:
+            regressions.append(f'{name}: missing from this run')
+            continue
+        if current['queries'] > base['queries']:
+            regressions.append(f'{name}: queries/request {base["queries"]} -> {current["queries"]}')
+        if current['cookie_bytes'] > base.get('cookie_bytes', current['cookie_bytes']):
+            regressions.append(f'{name}: session cookie {base["cookie_bytes"]}B -> {current["cookie_bytes"]}B')
+        if current['p95_ms'] > base['p95_ms'] * (1 + tolerance):
+            regressions.append(f'{name}: p95 {base["p95_ms"]}ms -> {current["p95_ms"]}ms')
+        if current['peak_kib'] > base['peak_kib'] * (1 + tolerance):
+            regressions.append(f'{name}: peak memory {base["peak_kib"]}KiB -> {current["peak_kib"]}KiB')
+    return regressions
+
+def save(path, results, meta):
+    with open(path, 'w') as f:
+        json.dump({'meta': meta, 'results': results}, f, indent=2, sort_keys=True)
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
@@ -0,0 +1,125 @@
+# benchmarks/sessions.py
+
+import secrets
+import time
+
+import click
+
+from app import create_app, db
+from app.models import User
+from .datagen import create_schema, temp_database_url
+from .runner import percentile
+
+BACKENDS = ('cookie', 'memory://', 'database')
+
+FLASH_MESSAGES = (
+    'You have successfully edited the student.',
+    'The course is full; you have been added to the waitlist.',
+    'Deleting the student and their records in the background.'
+)
+
+def login_state():
+    '''
+    Session keys written by a login: flask_login's user id, freshness
+    and session identifier, and Flask-WTF's CSRF token.
+    '''
+
+    return {'_user_id': '1', '_fresh': True, '_id': secrets.token_hex(64), 'csrf_token': secrets.token_hex(20)}
+
+def cycle(app, cookie, change):
+    '''
+    Open and save the session for one request carrying cookie, applying
+    change to it in between. Returns the seconds spent, the cookie the
+    client holds afterwards and the bytes of Set-Cookie sent back.
+    '''
+
+    interface = app.session_interface
+    name = app.config['SESSION_COOKIE_NAME']
+    headers = {'Cookie': f'{name}={cookie}'} if cookie else {}
+    with app.test_request_context(headers=headers) as context:
+        start = time.perf_counter()
+        session = interface.open_session(app, context.request)
+        change(session)
+        response = app.response_class()
+        interface.save_session(app, session, response)
+        elapsed = time.perf_counter() - start
+
+    set_cookie = response.headers.get('Set-Cookie', '')
+    if set_cookie:
+        value = set_cookie.split(';', 1)[0].split('=', 1)[1]
+        cookie = value or None
+    return elapsed, cookie, len(set_cookie)
+
+def measure(app, requests, flashes):
+    '''
+    Log in, then time page views that only read the login state and
+    flash round trips: a form post that flashes messages followed by the
+    page that shows them.
+    '''
+
+    def flash(session):
+        session.setdefault('_flashes', []).extend(('message', text) for text in FLASH_MESSAGES[:flashes])
+        session.modified = True
+
+    _, cookie, _ = cycle(app, None, lambda session: session.update(login_state()))
+
+    views, round_trips, sent = [], [], 0
+    for _ in range(requests):
+        elapsed, cookie, size = cycle(app, cookie, lambda session: session.get('_user_id'))
+        views.append(elapsed)
+        sent += size
+
+        posted, cookie, size = cycle(app, cookie, flash)
+        sent += size
+        flashed_cookie = cookie
+        shown, cookie, size = cycle(app, cookie, lambda session: session.pop('_flashes', None))
+        round_trips.append(posted + shown)
+        sent += size
+
+    return {
+        'view_us': percentile(views, 50) * 1e6,
+        'flash_us': percentile(round_trips, 50) * 1e6,
+        'cookie_bytes': len(cookie),
+        'flashed_cookie_bytes': len(flashed_cookie),
+        'set_cookie_bytes': sent / (3.0 * requests)
+    }
+
+@click.command()
+@click.option('--database-url', default=temp_database_url('ums-session-benchmark.db'), show_default=True,
+              help='Database for the "database" backend. Its tables are dropped and recreated.')
+@click.option('--requests', default=2000, show_default=True, help='Page views and flash round trips per backend.')
+@click.option('--flashes', default=2, show_default=True, type=click.IntRange(1, len(FLASH_MESSAGES)),
+              help='Messages flashed per round trip.')
+def main(database_url, requests, flashes):
+    '''
+    Compare the per-request cost of Flask's signed-cookie sessions with
+    the server-side session backends, and the cookie each one sends.
+    '''
+
+    click.echo(
+        f'{"backend":<12}{"view us":>10}{"flash us":>10}{"cookie B":>10}{"w/ flash B":>12}{"Set-Cookie B/req":>18}'
+    )
+    for backend in BACKENDS:
+        app = create_app('production', config_overrides={
+            'SQLALCHEMY_DATABASE_URI': database_url,
+            'SQLALCHEMY_ECHO': False,
+            'SECRET_KEY': 'benchmark',
+            'SESSION_STORE': None if backend == 'cookie' else backend
+        })
+        with app.app_context():
+            if backend == 'database':
+                create_schema()
+                db.session.add(User(
+                    id=1, email='bench@uni.edu', username='bench', _password='bench', first_name='Bench',
+                    last_name='Mark', contact='0000000000', address='Campus', role='Admin', is_admin=True, status=True
+                ))
+                db.session.commit()
+            result = measure(app, requests, flashes)
+
+        click.echo(
+            f'{backend:<12}{result["view_us"]:>10.1f}{result["flash_us"]:>10.1f}{result["cookie_bytes"]:>10}'
+            f'{result["flashed_cookie_bytes"]:>12}{result["set_cookie_bytes"]:>18.1f}'
+        )
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+# benchmarks/timetable.py
+
+import random
+import sys
+import time
+
+import click
+
+from app import timetable
+from config import Config
+
+ROOM_CAPACITIES = (80, 120, 160, 200, 250)
+
+def generate(courses, students, teachers, rooms, departments, per_student, seed=0):
+    '''
+    Build a synthetic timetabling problem shaped like a real campus.
+    Students belong to cohorts of about 200 and take most of their
+    courses from their cohort's core courses, plus one elective from
+    their department.
+    '''
+
+    rng = random.Random(seed)
+
+    slots = [
+        (index, day, timetable.minutes(start), timetable.minutes(end))
+        for index, (day, (start, end)) in enumerate(
+            (day, period) for day in Config.TIMETABLE_DAYS for period in Config.TIMETABLE_PERIODS
+        )
+    ]
+    room_rows = [(room_id, ROOM_CAPACITIES[room_id % len(ROOM_CAPACITIES)]) for room_id in range(rooms)]
+
+    electives_per_department = max(1, courses // 5 // departments)
+    electives = [
+        list(range(department * electives_per_department, (department + 1) * electives_per_department))
+        for department in range(departments)
+    ]
+    first_core = electives_per_department * departments
+    cohorts = max(1, students // 200)
+    cores_per_cohort = max(per_student, (courses - first_core) // cohorts)
+    core = [
+        list(range(first_core + cohort * cores_per_cohort, first_core + (cohort + 1) * cores_per_cohort))
+        for cohort in range(cohorts)
+    ]
+    course_ids = list(range(first_core + cohorts * cores_per_cohort))
+
+    student_courses = []
+    for student in range(students):
+        cohort = student % cohorts
+        department = cohort % departments
+        chosen = rng.sample(core[cohort], per_student - 1) + [rng.choice(electives[department])]
+        student_courses.append(chosen)
+
+    sizes = dict.fromkeys(course_ids, 0)
+    for chosen in student_courses:
+        for course_id in chosen:
+            sizes[course_id] += 1
+
+    sections, section_id = [], 0
+    for course_id in course_ids:
+        for _ in range(rng.randint(1, 3)):
+            sections.append((section_id, course_id))
+            section_id += 1
+
+    return timetable.Problem(
+        slots=slots,
+        rooms=room_rows,
+        sections=sections,
+        teachers={course_id: rng.randrange(teachers) for course_id in course_ids},
+        sizes=sizes,
+        students=student_courses
+    )
+
+@click.command()
+@click.option('--courses', default=2000, show_default=True)
+@click.option('--students', default=40000, show_default=True)
+@click.option('--teachers', default=400, show_default=True)
+@click.option('--rooms', default=150, show_default=True)
+@click.option('--departments', default=10, show_default=True)
+@click.option('--per-student', default=6, show_default=True, help='Courses each student takes.')
+@click.option('--seconds', default=20.0, show_default=True, help='Time limit for the solver.')
+@click.option('--seed', default=0, show_default=True)
+def main(courses, students, teachers, rooms, departments, per_student, seconds, seed):
+    '''
+    Benchmark the timetable solver and clash detection on a synthetic
+    campus. Exits 1 if the timetable has clashes or unplaced sections.
+    '''
+
+    start = time.perf_counter()
+    problem = generate(courses, students, teachers, rooms, departments, per_student, seed)
+    click.echo(
+        f'Generated {len(problem.sizes)} courses, {len(problem.sections)} sections, {len(problem.students)} students, '
+        f'{len(problem.rooms)} rooms, {len(problem.slots)} slots in {time.perf_counter() - start:.1f}s'
+    )
+
+    result = timetable.solve(problem, seconds, seed)
+    click.echo(
+        f'Solved in {result.seconds:.2f}s: {len(result.assignments)} placed, '
+        f'{len(result.clashing)} clashing, {len(result.unplaced)} unplaced'
+    )
+
+    start = time.perf_counter()
+    placed = [
+        (section_id, course_id) + result.assignments[section_id]
+        for section_id, course_id in problem.sections if section_id in result.assignments
+    ]
+    clashes = timetable.find_clashes(problem.slots, placed, problem.teachers, problem.students)
+    click.echo(
+        f'Checked in {time.perf_counter() - start:.2f}s: {len(clashes.teachers)} teacher, {len(clashes.rooms)} room '
+        f'and {sum(clashes.courses.values())} student clashes ({clashes.students} students affected)'
+    )
+
+    if not result.conflict_free or clashes.total:
+        sys.exit(1)
+    click.echo('Timetable is conflict-free.')
+
+if __name__ == '__main__':
+    main()
@@ -4,7 +4,144 @@ class Config(object):
     """
     Common configurations.
     """
-    pass
+
+    # Identity cache in front of the user loader. Set IDENTITY_CACHE_URL
+    # to "memory://" or a redis:// URL to share entries between workers.
+    IDENTITY_CACHE_SIZE = 10000
+    IDENTITY_CACHE_TTL = 60
+    IDENTITY_CACHE_URL = None
+
+    # Per-request SQL instrumentation, cheap enough to leave on everywhere.
+    # Statements repeated more than SQL_N_PLUS_ONE_THRESHOLD times in one
+    # request are reported as possible N+1 patterns.
+    SQL_INSTRUMENTATION = True
+    SQL_INSTRUMENTATION_HEADERS = True
+    SQL_SLOW_QUERY_MS = 100
+    SQL_N_PLUS_ONE_THRESHOLD = 10
+    SQL_SLOWEST_STATEMENTS = 5
+    SQL_RECENT_REQUESTS = 200
+
+    # Database connection pool, per worker process. Connections older than
+    # DB_POOL_RECYCLE seconds are replaced, DB_POOL_PRE_PING tests a pooled
+    # connection before handing it out, and checkouts give up after
+    # DB_POOL_TIMEOUT seconds. DB_DISABLE_POOL opens a connection per
+    # checkout instead, for running behind PgBouncer in transaction mode.
+    # DB_STATEMENT_TIMEOUT_MS aborts long statements (not on SQLite).
+    # Anything set in SQLALCHEMY_ENGINE_OPTIONS wins over these.
+    DB_POOL_SIZE = 5
+    DB_MAX_OVERFLOW = 10
+    DB_POOL_TIMEOUT = 30
+    DB_POOL_RECYCLE = -1
+    DB_POOL_PRE_PING = False
+    DB_POOL_USE_LIFO = False
+    DB_STATEMENT_TIMEOUT_MS = None
+    DB_DISABLE_POOL = False
+
+    # Optional read replica. GET views for listings, exports and reports
+    # read from DB_REPLICA_URL while its lag, checked at most every
+    # DB_REPLICA_LAG_CHECK_INTERVAL seconds, is within DB_REPLICA_MAX_LAG
+    # seconds. Writes always go to the primary, and a browser session that
+    # just wrote keeps reading from the primary until the replica has
+    # caught up. Leave unset to serve everything from the primary.
+    DB_REPLICA_URL = None
+    DB_REPLICA_MAX_LAG = 5
+    DB_REPLICA_LAG_CHECK_INTERVAL = 1
+
+    # In-memory departments, teacher names and course names for forms and
+    # labels, loaded at startup. Edits bump a version number; set
+    # REFERENCE_DATA_URL ("memory://" or redis://) to share it so every
+    # worker reloads at once, otherwise copies are kept at most
+    # REFERENCE_DATA_TTL seconds.
+    REFERENCE_DATA_PRELOAD = True
+    REFERENCE_DATA_TTL = 300
+    REFERENCE_DATA_CHECK_INTERVAL = 1
+    REFERENCE_DATA_URL = None
+
+    # In-process search index over people and courses, built on first
+    # search and kept current by this worker's commits. Edits made by
+    # other workers show up after the SEARCH_INDEX_TTL background rebuild.
+    SEARCH_INDEX_TTL = 600
+    SEARCH_RESULTS_LIMIT = 10
+
+    # Conditional GETs and fragment caching for the admin listings. Every
+    # committed write bumps the version of the tables it touched; pages
+    # carry an ETag over those versions and answer 304 while they hold.
+    # Set HTTP_CACHE_URL ("memory://" or redis://) to share versions
+    # between workers, otherwise a worker notices others' writes after at
+    # most HTTP_CACHE_TTL seconds.
+    HTTP_CACHE_ENABLED = True
+    HTTP_CACHE_URL = None
+    HTTP_CACHE_TTL = 60
+    HTTP_CACHE_CHECK_INTERVAL = 1
+    HTTP_CACHE_FRAGMENTS = 256
+
+    # JSON API under /api/v1 for integrations. Clients send
+    # "Authorization: Bearer <key>"; API_KEYS maps each key to the id of
+    # the admin user it acts as. Keep real keys in instance/config.py.
+    API_KEYS = {}
+    API_PAGE_SIZE = 100
+    API_MAX_PAGE_SIZE = 5000
+    API_MAX_BATCH = 1000
+
+    # Term that attendance is recorded against (e.g. "Fall 2026"). Each
+    # enrollment keeps one attendance bitmap per term.
+    CURRENT_TERM = None
+
+    # Grade book. GRADE_SCALE maps the minimum (curved) marks for each
+    # letter and GRADE_POINTS each letter's grade points. GRADE_CURVE is
+    # the default curve: "none", "top" (lift the top mark to 100) or
+    # "bell" (rescale to GRADE_BELL_MEAN and GRADE_BELL_SD).
+    GRADE_SCALE = [
+        (90, 'A+'), (86, 'A'), (82, 'A-'), (78, 'B+'), (74, 'B'), (70, 'B-'), (66, 'C+'),
+        (62, 'C'), (58, 'C-'), (54, 'D+'), (50, 'D'), (45, 'D-'), (0, 'F')
+    ]
+    GRADE_POINTS = {
+        'A+': 4.0, 'A': 4.0, 'A-': 3.67, 'B+': 3.33, 'B': 3.0, 'B-': 2.67, 'C+': 2.33,
+        'C': 2.0, 'C-': 1.67, 'D+': 1.33, 'D': 1.0, 'D-': 0.67, 'F': 0.0
+    }
+    GRADE_CURVE = 'none'
+    GRADE_BELL_MEAN = 75
+    GRADE_BELL_SD = 10
+
+    # Timetable grid: teaching days (0 is Monday) and periods as ("HH:MM",
+    # "HH:MM") start and end times. Every course meets once a week per
+    # credit; "flask build-timetable" assigns each meeting a slot and room.
+    TIMETABLE_DAYS = [0, 1, 2, 3, 4]
+    TIMETABLE_PERIODS = [
+        ('08:00', '09:20'), ('09:30', '10:50'), ('11:00', '12:20'), ('12:30', '13:50'),
+        ('14:00', '15:20'), ('15:30', '16:50'), ('17:00', '18:20'), ('18:30', '19:50')
+    ]
+    TIMETABLE_SOLVER_SECONDS = 20
+
+    # Background jobs for slow admin work (deletes, imports, rebuilds),
+    # queued in the jobs table. Each server process starts JOB_WORKERS
+    # threads with its first request; set it to 0 and run "flask run-jobs"
+    # to keep jobs out of the web processes. Idle workers poll every
+    # JOB_POLL_INTERVAL seconds. Running jobs report a heartbeat every
+    # JOB_HEARTBEAT_INTERVAL seconds, and one silent for JOB_STALE_AFTER
+    # seconds is requeued. Failed jobs with retries left run again after
+    # JOB_RETRY_DELAY seconds, doubling with each attempt.
+    JOB_WORKERS = 2
+    JOB_POLL_INTERVAL = 1
+    JOB_HEARTBEAT_INTERVAL = 30
+    JOB_STALE_AFTER = 300
+    JOB_PROGRESS_INTERVAL = 1
+    JOB_RETRY_DELAY = 30
+
+    # Optional server-side sessions, so the session cookie only carries a
+    # random id and sessions can be revoked. SESSION_STORE is None for
+    # Flask's signed-cookie sessions, a redis:// URL ("memory://" for a
+    # single process) or "database" for the sessions table. A store costs
+    # a lookup per request instead of verifying a signature: Redis is
+    # about as cheap, the database noticeably slower (see
+    # "python -m benchmarks.sessions"). Sessions expire
+    # PERMANENT_SESSION_LIFETIME seconds after their last write and are
+    # rewritten once half of that has passed. Expired rows are swept at
+    # most every SESSION_SWEEP_INTERVAL seconds, or with
+    # "flask sweep-sessions".
+    SESSION_STORE = None
+    PERMANENT_SESSION_LIFETIME = 7 * 24 * 3600
+    SESSION_SWEEP_INTERVAL = 3600
 
 class DevelopmentConfig(Config):
     """
@@ -12,7 +149,9 @@ class DevelopmentConfig(Config):
     """
 
     DEBUG = True
-    SQLALCHEMY_ECHO = True
+
+    DB_POOL_SIZE = 2
+    DB_MAX_OVERFLOW = 5
 
 class ProductionConfig(Config):
     """
@@ -21,6 +160,17 @@ class ProductionConfig(Config):
 
     DEBUG = False
 
+    # Keep few connections per worker so restarts do not storm the
+    # database, reuse the most recent ones first (LIFO) so spare ones
+    # can be recycled, and drop connections the server or a proxy closed.
+    DB_POOL_SIZE = 10
+    DB_MAX_OVERFLOW = 5
+    DB_POOL_TIMEOUT = 10
+    DB_POOL_RECYCLE = 1800
+    DB_POOL_PRE_PING = True
+    DB_POOL_USE_LIFO = True
+    DB_STATEMENT_TIMEOUT_MS = 30000
+
 app_config = {
     'development': DevelopmentConfig,
     'production': ProductionConfig
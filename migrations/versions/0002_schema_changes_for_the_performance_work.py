@@ -0,0 +1,403 @@
+"""Schema changes for the performance work
+
+Adds the summary, counter, archive, grade, attendance, timetable, job
+and session tables, the fee term and due date, course capacities and
+seat counts, the indexes the listings and audits rely on, and ON DELETE
+CASCADE / SET NULL on the foreign keys that bulk deletes depend on.
+
+The derived tables start empty. After upgrading an existing database,
+run "flask rebuild-fee-summary", "flask reconcile-stats" and "flask
+rebuild-gpa".
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 05:13:36.238193
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+SEQUENCES = (
+    'room_id_seq', 'slot_id_seq', 'job_id_seq', 'attendance_session_id_seq', 'section_id_seq', 'waitlist_id_seq'
+)
+
+# Foreign keys created before migrations were kept have no name. Batch
+# mode on SQLite names them by this convention so they can be dropped;
+# other backends report the names they generated.
+NAMING_CONVENTION = {'fk': 'fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s'}
+
+
+def next_id(name):
+    # Primary keys are drawn from sequences where the backend has them;
+    # elsewhere (SQLite) integer primary keys autoincrement.
+    if op.get_bind().dialect.supports_sequences:
+        return sa.Sequence(name).next_value()
+    return None
+
+
+def foreign_key(table, column):
+    for fk in sa.inspect(op.get_bind()).get_foreign_keys(table):
+        if fk['constrained_columns'] == [column]:
+            return fk['name'] or f"fk_{table}_{column}_{fk['referred_table']}"
+    raise LookupError(f'No foreign key on {table}.{column}')
+
+
+def check_existing_rows():
+    '''
+    Stop before changing anything if existing rows would break the new
+    constraints: duplicate enrollments, or (on SQLite, which did not
+    enforce foreign keys) rows pointing at deleted parents.
+    '''
+
+    bind = op.get_bind()
+    problems = []
+    duplicates = bind.execute(sa.text(
+        'SELECT student_id, course_id FROM enrollments GROUP BY student_id, course_id HAVING COUNT(*) > 1'
+    )).fetchall()
+    if duplicates:
+        problems.append(f'duplicate enrollments (student_id, course_id): {duplicates}')
+    if bind.dialect.name == 'sqlite':
+        orphans = bind.exec_driver_sql('PRAGMA foreign_key_check').fetchall()
+        if orphans:
+            problems.append('rows referencing missing parents (table, rowid, parent): '
+                            f'{[tuple(row[:3]) for row in orphans]}')
+    if problems:
+        raise RuntimeError('Fix these rows, then upgrade again: ' + '; '.join(problems))
+
+
+def upgrade():
+    check_existing_rows()
+    if op.get_bind().dialect.supports_sequences:
+        for name in SEQUENCES:
+            op.execute(sa.schema.CreateSequence(sa.Sequence(name, start=1, increment=1)))
+
+    # ### commands auto generated by Alembic - please adjust! ###
+    op.create_table('fee_summaries',
+    sa.Column('scope', sa.String(length=10), nullable=False),
+    sa.Column('scope_id', sa.Integer(), nullable=False),
+    sa.Column('term', sa.String(length=20), nullable=False),
+    sa.Column('paid_amount', sa.Float(), nullable=False),
+    sa.Column('paid_count', sa.Integer(), nullable=False),
+    sa.Column('pending_amount', sa.Float(), nullable=False),
+    sa.Column('pending_count', sa.Integer(), nullable=False),
+    sa.CheckConstraint("scope IN ('student', 'course', 'department', 'total')", name='check_scope_valid'),
+    sa.PrimaryKeyConstraint('scope', 'scope_id', 'term')
+    )
+    with op.batch_alter_table('fee_summaries', schema=None) as batch_op:
+        batch_op.create_index('ix_fee_summaries_scope_pending_amount', ['scope', 'pending_amount'], unique=False)
+
+    op.create_table('fees_archive',
+    sa.Column('fee_id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('student_id', sa.Integer(), nullable=True),
+    sa.Column('course_id', sa.Integer(), nullable=True),
+    sa.Column('amount', sa.Float(), nullable=False),
+    sa.Column('fee_status', sa.String(length=10), nullable=False),
+    sa.Column('term', sa.String(length=20), nullable=True),
+    sa.Column('due_date', sa.Date(), nullable=True),
+    sa.Column('archived_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('fee_id')
+    )
+    with op.batch_alter_table('fees_archive', schema=None) as batch_op:
+        batch_op.create_index('ix_fees_archive_student_id', ['student_id'], unique=False)
+        batch_op.create_index('ix_fees_archive_term', ['term'], unique=False)
+
+    op.create_table('rooms',
+    sa.Column('room_id', sa.Integer(), server_default=next_id('room_id_seq'), nullable=False),
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('capacity', sa.Integer(), nullable=False),
+    sa.CheckConstraint('capacity > 0', name='check_room_capacity_valid'),
+    sa.PrimaryKeyConstraint('room_id'),
+    sa.UniqueConstraint('name')
+    )
+    op.create_table('stat_counters',
+    sa.Column('name', sa.String(length=30), nullable=False),
+    sa.Column('scope_id', sa.Integer(), nullable=False),
+    sa.Column('slot', sa.Integer(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('name', 'scope_id', 'slot')
+    )
+    op.create_table('time_slots',
+    sa.Column('slot_id', sa.Integer(), server_default=next_id('slot_id_seq'), nullable=False),
+    sa.Column('day', sa.Integer(), nullable=False),
+    sa.Column('starts_at', sa.Integer(), nullable=False),
+    sa.Column('ends_at', sa.Integer(), nullable=False),
+    sa.CheckConstraint('day BETWEEN 0 AND 6', name='check_slot_day_valid'),
+    sa.CheckConstraint('starts_at >= 0 AND ends_at > starts_at AND ends_at <= 1440', name='check_slot_times_valid'),
+    sa.PrimaryKeyConstraint('slot_id'),
+    sa.UniqueConstraint('day', 'starts_at', 'ends_at', name='uq_time_slots_day_times')
+    )
+    op.create_table('jobs',
+    sa.Column('job_id', sa.Integer(), server_default=next_id('job_id_seq'), nullable=False),
+    sa.Column('kind', sa.String(length=50), nullable=False),
+    sa.Column('params', sa.Text(), nullable=False),
+    sa.Column('payload', sa.LargeBinary(), nullable=True),
+    sa.Column('status', sa.String(length=10), nullable=False),
+    sa.Column('description', sa.String(length=200), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('max_attempts', sa.Integer(), nullable=False),
+    sa.Column('cancel_requested', sa.Boolean(), nullable=False),
+    sa.Column('done', sa.Integer(), nullable=False),
+    sa.Column('total', sa.Integer(), nullable=True),
+    sa.Column('message', sa.String(length=200), nullable=True),
+    sa.Column('result', sa.Text(), nullable=True),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('worker', sa.String(length=100), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('run_at', sa.DateTime(), nullable=False),
+    sa.Column('started_at', sa.DateTime(), nullable=True),
+    sa.Column('heartbeat_at', sa.DateTime(), nullable=True),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.CheckConstraint("status IN ('queued', 'running', 'succeeded', 'failed', 'cancelled')", name='check_job_status_valid'),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='SET NULL'),
+    sa.PrimaryKeyConstraint('job_id')
+    )
+    with op.batch_alter_table('jobs', schema=None) as batch_op:
+        batch_op.create_index('ix_jobs_status_run_at', ['status', 'run_at', 'job_id'], unique=False)
+
+    op.create_table('sessions',
+    sa.Column('session_key', sa.String(length=64), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('data', sa.Text(), nullable=False),
+    sa.Column('expires_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('session_key')
+    )
+    with op.batch_alter_table('sessions', schema=None) as batch_op:
+        batch_op.create_index('ix_sessions_expires_at', ['expires_at'], unique=False)
+        batch_op.create_index('ix_sessions_user_id', ['user_id'], unique=False)
+
+    op.create_table('gpa_summaries',
+    sa.Column('student_id', sa.Integer(), nullable=False),
+    sa.Column('term', sa.String(length=20), nullable=False),
+    sa.Column('credits', sa.Integer(), nullable=False),
+    sa.Column('quality_points', sa.Float(), nullable=False),
+    sa.Column('gpa', sa.Float(), nullable=True),
+    sa.ForeignKeyConstraint(['student_id'], ['students.roll_no'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('student_id', 'term')
+    )
+    with op.batch_alter_table('gpa_summaries', schema=None) as batch_op:
+        batch_op.create_index('ix_gpa_summaries_term_gpa_student_id', ['term', 'gpa', 'student_id'], unique=False)
+
+    op.create_table('attendance_sessions',
+    sa.Column('session_id', sa.Integer(), server_default=next_id('attendance_session_id_seq'), nullable=False),
+    sa.Column('course_id', sa.Integer(), nullable=False),
+    sa.Column('term', sa.String(length=20), nullable=False),
+    sa.Column('held_on', sa.Date(), nullable=False),
+    sa.Column('session_no', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['course_id'], ['courses.course_id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('session_id'),
+    sa.UniqueConstraint('course_id', 'term', 'held_on', name='uq_attendance_sessions_course_term_date'),
+    sa.UniqueConstraint('course_id', 'term', 'session_no', name='uq_attendance_sessions_course_term_no')
+    )
+    op.create_table('grades',
+    sa.Column('student_id', sa.Integer(), nullable=False),
+    sa.Column('course_id', sa.Integer(), nullable=False),
+    sa.Column('term', sa.String(length=20), nullable=False),
+    sa.Column('marks', sa.Integer(), nullable=False),
+    sa.Column('grade', sa.String(length=2), nullable=False),
+    sa.Column('points', sa.Float(), nullable=False),
+    sa.Column('credits', sa.Integer(), nullable=False),
+    sa.CheckConstraint("grade IN ('F', 'D-', 'D', 'D+', 'C-', 'C', 'C+', 'B-', 'B', 'B+', 'A-', 'A', 'A+')", name='check_grade_valid'),
+    sa.CheckConstraint('marks BETWEEN 0 AND 100', name='check_marks_range'),
+    sa.ForeignKeyConstraint(['course_id'], ['courses.course_id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['student_id'], ['students.roll_no'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('student_id', 'course_id')
+    )
+    with op.batch_alter_table('grades', schema=None) as batch_op:
+        batch_op.create_index('ix_grades_course_id', ['course_id'], unique=False)
+
+    op.create_table('sections',
+    sa.Column('section_id', sa.Integer(), server_default=next_id('section_id_seq'), nullable=False),
+    sa.Column('course_id', sa.Integer(), nullable=False),
+    sa.Column('slot_id', sa.Integer(), nullable=True),
+    sa.Column('room_id', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['course_id'], ['courses.course_id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['room_id'], ['rooms.room_id'], ondelete='SET NULL'),
+    sa.ForeignKeyConstraint(['slot_id'], ['time_slots.slot_id'], ondelete='SET NULL'),
+    sa.PrimaryKeyConstraint('section_id'),
+    sa.UniqueConstraint('slot_id', 'room_id', name='uq_sections_slot_room')
+    )
+    with op.batch_alter_table('sections', schema=None) as batch_op:
+        batch_op.create_index('ix_sections_course_id', ['course_id'], unique=False)
+
+    op.create_table('waitlists',
+    sa.Column('waitlist_id', sa.Integer(), server_default=next_id('waitlist_id_seq'), nullable=False),
+    sa.Column('student_id', sa.Integer(), nullable=False),
+    sa.Column('course_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['course_id'], ['courses.course_id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['student_id'], ['students.roll_no'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('waitlist_id'),
+    sa.UniqueConstraint('student_id', 'course_id', name='uq_waitlists_student_course')
+    )
+    with op.batch_alter_table('waitlists', schema=None) as batch_op:
+        batch_op.create_index('ix_waitlists_course_id_waitlist_id', ['course_id', 'waitlist_id'], unique=False)
+
+    op.create_table('attendance',
+    sa.Column('enrollment_id', sa.Integer(), nullable=False),
+    sa.Column('term', sa.String(length=20), nullable=False),
+    sa.Column('marks', sa.LargeBinary(), nullable=False),
+    sa.Column('present', sa.Integer(), nullable=False),
+    sa.Column('late', sa.Integer(), nullable=False),
+    sa.Column('absent', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['enrollment_id'], ['enrollments.enrollment_id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('enrollment_id', 'term')
+    )
+    with op.batch_alter_table('courses', schema=None, naming_convention=NAMING_CONVENTION) as batch_op:
+        batch_op.add_column(sa.Column('capacity', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('seats_taken', sa.Integer(), server_default='0', nullable=False))
+        batch_op.create_index('ix_courses_credits_course_id', ['credits', 'course_id'], unique=False)
+        batch_op.create_index('ix_courses_seats_taken_course_id', ['seats_taken', 'course_id'], unique=False)
+        batch_op.create_index('ix_courses_teacher_id_course_id', ['teacher_id', 'course_id'], unique=False)
+        batch_op.drop_constraint(foreign_key('courses', 'teacher_id'), type_='foreignkey')
+        batch_op.create_foreign_key(
+            'fk_courses_teacher_id_teachers', 'teachers', ['teacher_id'], ['teacher_id'], ondelete='SET NULL'
+        )
+
+    # Seats already taken by existing enrollments.
+    op.execute(
+        'UPDATE courses SET seats_taken = '
+        '(SELECT COUNT(*) FROM enrollments WHERE enrollments.course_id = courses.course_id)'
+    )
+
+    with op.batch_alter_table('enrollments', schema=None, naming_convention=NAMING_CONVENTION) as batch_op:
+        batch_op.create_index('ix_enrollments_course_id_student_id', ['course_id', 'student_id'], unique=False)
+        batch_op.create_unique_constraint('uq_enrollments_student_course', ['student_id', 'course_id'])
+        batch_op.drop_constraint(foreign_key('enrollments', 'student_id'), type_='foreignkey')
+        batch_op.drop_constraint(foreign_key('enrollments', 'course_id'), type_='foreignkey')
+        batch_op.create_foreign_key(
+            'fk_enrollments_student_id_students', 'students', ['student_id'], ['roll_no'], ondelete='CASCADE'
+        )
+        batch_op.create_foreign_key(
+            'fk_enrollments_course_id_courses', 'courses', ['course_id'], ['course_id'], ondelete='CASCADE'
+        )
+
+    with op.batch_alter_table('fees', schema=None, naming_convention=NAMING_CONVENTION) as batch_op:
+        batch_op.add_column(sa.Column('term', sa.String(length=20), nullable=True))
+        batch_op.add_column(sa.Column('due_date', sa.Date(), nullable=True))
+        batch_op.create_index('ix_fees_course_id', ['course_id'], unique=False)
+        batch_op.create_index('ix_fees_status_term_due_amount', ['fee_status', 'term', 'due_date', 'amount'], unique=False)
+        batch_op.create_index('ix_fees_student_id_course_id', ['student_id', 'course_id'], unique=False)
+        batch_op.create_index('ix_fees_student_id_fee_status', ['student_id', 'fee_status'], unique=False)
+        batch_op.create_index('ix_fees_term_fee_id', ['term', 'fee_id'], unique=False)
+        batch_op.drop_constraint(foreign_key('fees', 'student_id'), type_='foreignkey')
+        batch_op.drop_constraint(foreign_key('fees', 'course_id'), type_='foreignkey')
+        batch_op.create_foreign_key(
+            'fk_fees_student_id_students', 'students', ['student_id'], ['roll_no'], ondelete='CASCADE'
+        )
+        batch_op.create_foreign_key(
+            'fk_fees_course_id_courses', 'courses', ['course_id'], ['course_id'], ondelete='CASCADE'
+        )
+
+    with op.batch_alter_table('students', schema=None) as batch_op:
+        batch_op.create_index('ix_students_department_id_roll_no', ['department_id', 'roll_no'], unique=False)
+        batch_op.create_index(batch_op.f('ix_students_user_id'), ['user_id'], unique=False)
+
+    with op.batch_alter_table('teachers', schema=None) as batch_op:
+        batch_op.create_index('ix_teachers_speciality_teacher_id', ['speciality', 'teacher_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_teachers_user_id'), ['user_id'], unique=False)
+
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.create_index('ix_users_last_name_id', ['last_name', 'id'], unique=False)
+        batch_op.create_index('ix_users_status_id', ['status', 'id'], unique=False)
+        batch_op.create_index('ix_users_status_role_id', ['status', 'role', 'id'], unique=False)
+
+    # ### end Alembic commands ###
+
+
+def downgrade():
+    # ### commands auto generated by Alembic - please adjust! ###
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_index('ix_users_status_role_id')
+        batch_op.drop_index('ix_users_status_id')
+        batch_op.drop_index('ix_users_last_name_id')
+
+    with op.batch_alter_table('teachers', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_teachers_user_id'))
+        batch_op.drop_index('ix_teachers_speciality_teacher_id')
+
+    with op.batch_alter_table('students', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_students_user_id'))
+        batch_op.drop_index('ix_students_department_id_roll_no')
+
+    with op.batch_alter_table('fees', schema=None, naming_convention=NAMING_CONVENTION) as batch_op:
+        batch_op.drop_constraint(foreign_key('fees', 'student_id'), type_='foreignkey')
+        batch_op.drop_constraint(foreign_key('fees', 'course_id'), type_='foreignkey')
+        batch_op.create_foreign_key('fk_fees_student_id_students', 'students', ['student_id'], ['roll_no'])
+        batch_op.create_foreign_key('fk_fees_course_id_courses', 'courses', ['course_id'], ['course_id'])
+        batch_op.drop_index('ix_fees_term_fee_id')
+        batch_op.drop_index('ix_fees_student_id_fee_status')
+        batch_op.drop_index('ix_fees_student_id_course_id')
+        batch_op.drop_index('ix_fees_status_term_due_amount')
+        batch_op.drop_index('ix_fees_course_id')
+        batch_op.drop_column('due_date')
+        batch_op.drop_column('term')
+
+    with op.batch_alter_table('enrollments', schema=None, naming_convention=NAMING_CONVENTION) as batch_op:
+        batch_op.drop_constraint(foreign_key('enrollments', 'student_id'), type_='foreignkey')
+        batch_op.drop_constraint(foreign_key('enrollments', 'course_id'), type_='foreignkey')
+        batch_op.create_foreign_key('fk_enrollments_student_id_students', 'students', ['student_id'], ['roll_no'])
+        batch_op.create_foreign_key('fk_enrollments_course_id_courses', 'courses', ['course_id'], ['course_id'])
+        batch_op.drop_constraint('uq_enrollments_student_course', type_='unique')
+        batch_op.drop_index('ix_enrollments_course_id_student_id')
+
+    with op.batch_alter_table('courses', schema=None, naming_convention=NAMING_CONVENTION) as batch_op:
+        batch_op.drop_constraint(foreign_key('courses', 'teacher_id'), type_='foreignkey')
+        batch_op.create_foreign_key('fk_courses_teacher_id_teachers', 'teachers', ['teacher_id'], ['teacher_id'])
+        batch_op.drop_index('ix_courses_teacher_id_course_id')
+        batch_op.drop_index('ix_courses_seats_taken_course_id')
+        batch_op.drop_index('ix_courses_credits_course_id')
+        batch_op.drop_column('seats_taken')
+        batch_op.drop_column('capacity')
+
+    op.drop_table('attendance')
+    with op.batch_alter_table('waitlists', schema=None) as batch_op:
+        batch_op.drop_index('ix_waitlists_course_id_waitlist_id')
+
+    op.drop_table('waitlists')
+    with op.batch_alter_table('sections', schema=None) as batch_op:
+        batch_op.drop_index('ix_sections_course_id')
+
+    op.drop_table('sections')
+    with op.batch_alter_table('grades', schema=None) as batch_op:
+        batch_op.drop_index('ix_grades_course_id')
+
+    op.drop_table('grades')
+    op.drop_table('attendance_sessions')
+    with op.batch_alter_table('gpa_summaries', schema=None) as batch_op:
+        batch_op.drop_index('ix_gpa_summaries_term_gpa_student_id')
+
+    op.drop_table('gpa_summaries')
+    with op.batch_alter_table('sessions', schema=None) as batch_op:
+        batch_op.drop_index('ix_sessions_user_id')
+        batch_op.drop_index('ix_sessions_expires_at')
+
+    op.drop_table('sessions')
+    with op.batch_alter_table('jobs', schema=None) as batch_op:
+        batch_op.drop_index('ix_jobs_status_run_at')
+
+    op.drop_table('jobs')
+    op.drop_table('time_slots')
+    op.drop_table('stat_counters')
+    op.drop_table('rooms')
+    with op.batch_alter_table('fees_archive', schema=None) as batch_op:
+        batch_op.drop_index('ix_fees_archive_term')
+        batch_op.drop_index('ix_fees_archive_student_id')
+
+    op.drop_table('fees_archive')
+    with op.batch_alter_table('fee_summaries', schema=None) as batch_op:
+        batch_op.drop_index('ix_fee_summaries_scope_pending_amount')
+
+    op.drop_table('fee_summaries')
+    # ### end Alembic commands ###
+
+    if op.get_bind().dialect.supports_sequences:
+        for name in reversed(SEQUENCES):
+            op.execute(sa.schema.DropSequence(sa.Sequence(name)))
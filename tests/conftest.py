@@ -0,0 +1,138 @@
+# tests/conftest.py
+
+import contextlib
+import contextvars
+
+import pytest
+from flask.testing import FlaskClient
+from sqlalchemy import event
+
+from app import create_app, db
+from app.models import Course, Department, Enrollment, Fee, Student, Teacher, User
+from benchmarks.datagen import create_schema
+
+PASSWORD = 'secret'
+
+class IsolatedClient(FlaskClient):
+    '''
+    Serves every request in its own app context, as a real server would,
+    instead of reusing the one the test has pushed (and its g and
+    database session). Responses are buffered, so streamed bodies are
+    read inside that context too.
+    '''
+
+    def open(self, *args, **kwargs):
+        kwargs['buffered'] = True
+        return contextvars.Context().run(super().open, *args, **kwargs)
+
+@pytest.fixture
+def app(tmp_path):
+    '''
+    An app on a fresh SQLite database, with an app context pushed.
+    Background job workers are off; tests run jobs synchronously.
+    '''
+
+    app = create_app('production', config_overrides={
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "test.db"}',
+        'SQLALCHEMY_ECHO': False,
+        'SECRET_KEY': 'test',
+        'TESTING': True,
+        'WTF_CSRF_ENABLED': False,
+        'JOB_WORKERS': 0
+    })
+    app.test_client_class = IsolatedClient
+    with app.app_context():
+        create_schema()
+        yield app
+        db.session.remove()
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+def make_user(email, role='Student', status=True, is_admin=False, **values):
+    name = email.split('@')[0]
+    return User(
+        email=email, username=name, _password=PASSWORD, first_name=name.title(), last_name='Test',
+        contact=values.pop('contact'), address='Campus', role=role, status=status, is_admin=is_admin, **values
+    )
+
+@contextlib.contextmanager
+def lose_insert_race(table, key):
+    '''
+    Right after the first UPDATE of table that matches no row, insert an
+    empty row with that UPDATE's key, as a concurrent request that
+    created the row first would. key names the columns the UPDATE's
+    WHERE clause binds last, in order. Yields the keys raced on.
+    '''
+
+    raced = []
+    columns = [column for column in table.columns if column.name not in key]
+
+    def after_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+        if raced or executemany or not statement.startswith(f'UPDATE {table.name} ') or cursor.rowcount:
+            return
+        values = tuple(parameters[-len(key):]) + tuple(column.default.arg for column in columns)
+        names = ', '.join(list(key) + [column.name for column in columns])
+        cursor.connection.execute(
+            f'INSERT INTO {table.name} ({names}) VALUES ({", ".join("?" * len(values))})', values
+        )
+        raced.append(values[:len(key)])
+
+    event.listen(db.engine, 'after_cursor_execute', after_cursor_execute)
+    try:
+        yield raced
+    finally:
+        event.remove(db.engine, 'after_cursor_execute', after_cursor_execute)
+
+@pytest.fixture
+def seed(app):
+    '''
+    Two departments, an admin, a teacher, four students (one pending
+    verification), two courses, enrollments and a fee per enrollment.
+    '''
+
+    cs, se = Department(dep_name='CS'), Department(dep_name='SE')
+    db.session.add_all([cs, se])
+    db.session.add(make_user('admin@uni.edu', role='Admin', is_admin=True, contact='0000000000'))
+    teacher = Teacher(users=make_user('teacher@uni.edu', role='Teacher', contact='1000000000'), speciality='CS')
+    db.session.add(teacher)
+    db.session.flush()
+
+    courses = [Course(course_name=f'Course {i}', credits=3, teacher_id=teacher.teacher_id) for i in range(2)]
+    students = [
+        Student(
+            users=make_user(f'student{i}@uni.edu', status=i != 3, contact=f'2{i:09d}'),
+            department_id=(cs if i % 2 == 0 else se).dep_id
+        )
+        for i in range(4)
+    ]
+    db.session.add_all(courses + students)
+    db.session.flush()
+
+    for i, student in enumerate(students):
+        for course in courses[:1 + i % 2]:
+            db.session.add(Enrollment(student_id=student.roll_no, course_id=course.course_id))
+            db.session.add(Fee(
+                student_id=student.roll_no, course_id=course.course_id, amount=100.0 * (i + 1),
+                fee_status='Paid' if i % 2 else 'Pending', term='Fall 2026'
+            ))
+    db.session.commit()
+
+    return {
+        'departments': [cs.dep_id, se.dep_id],
+        'teacher_id': teacher.teacher_id,
+        'courses': [course.course_id for course in courses],
+        'students': [student.roll_no for student in students],
+        'user_ids': [student.user_id for student in students]
+    }
+
+@pytest.fixture
+def login():
+    '''
+    Log a test client in: login(client, email).
+    '''
+
+    def login(client, email='admin@uni.edu', password=PASSWORD):
+        return client.post('/login', data={'email': email, 'password': password})
+    return login
@@ -0,0 +1,37 @@
+# tests/test_api.py
+
+import pytest
+from sqlalchemy import update
+
+from app import db
+from app.models import User
+
+@pytest.fixture
+def keys(app, seed):
+    app.config['API_KEYS'] = {'admin-key': 1, 'student-key': seed['user_ids'][0]}
+    return app.config['API_KEYS']
+
+def bearer(key):
+    return {'Authorization': f'Bearer {key}'}
+
+def test_key_authenticates_api_requests(client, keys):
+    assert client.get('/api/v1/students', headers=bearer('admin-key')).status_code == 200
+    assert client.get('/api/v1/students', headers=bearer('student-key')).status_code == 403
+    assert client.get('/api/v1/students', headers=bearer('unknown')).status_code == 401
+    assert client.get('/api/v1/students').status_code == 401
+
+def test_key_is_ignored_outside_the_api(client, keys):
+    response = client.get('/admin/dashboard', headers=bearer('admin-key'))
+    assert response.status_code == 302 and '/login' in response.headers['Location']
+
+def test_key_of_unverified_user_is_rejected(client, keys, seed):
+    student = seed['user_ids'][0]
+    keys['student-admin-key'] = student
+    db.session.execute(update(User).where(User.id == student).values(is_admin=True))
+    db.session.commit()
+    assert client.get('/api/v1/students', headers=bearer('student-admin-key')).status_code == 200
+
+    response = client.post('/api/v1/users/upsert', headers=bearer('admin-key'),
+                           json={'rows': [{'id': student, 'status': False}]})
+    assert response.status_code == 200
+    assert client.get('/api/v1/students', headers=bearer('student-admin-key')).status_code == 401
@@ -0,0 +1,73 @@
+# tests/test_attendance.py
+
+import datetime
+
+import pytest
+from sqlalchemy import select
+
+from app import attendance, db, deletion
+from app.attendance import ABSENT, LATE, PRESENT
+from app.models import Attendance
+
+MONDAY = datetime.date(2026, 9, 7)
+
+def assert_matches_rebuild():
+    '''
+    The counts kept next to each bitmap must be the ones rebuild()
+    recounts from it, so it should have nothing to correct.
+    '''
+
+    db.session.expire_all()
+    assert attendance.rebuild(batch_size=2) == 0
+
+def test_bitmap_round_trip():
+    marks = None
+    for session_no, status in enumerate([PRESENT, LATE, ABSENT, PRESENT, ABSENT]):
+        marks = attendance.set_mark(marks, session_no, status)
+    marks = attendance.set_mark(marks, 1, ABSENT)
+
+    assert [attendance.get_mark(marks, n) for n in range(6)] == [PRESENT, ABSENT, ABSENT, PRESENT, ABSENT, None]
+    assert attendance.tally(marks) == (2, 0, 3)
+
+def test_marking_and_correcting(app, seed):
+    course = seed['courses'][1]
+    student1, student3 = seed['students'][1], seed['students'][3]
+
+    assert attendance.mark_class(course, MONDAY, {student1: PRESENT, student3: ABSENT}) == 2
+    assert attendance.mark_class(course, MONDAY + datetime.timedelta(days=2), {student1: LATE}) == 1
+    assert_matches_rebuild()
+
+    # Marking the same day again corrects it; unchanged marks are not rewritten.
+    assert attendance.mark_class(course, MONDAY, {student1: PRESENT, student3: PRESENT}) == 1
+    assert_matches_rebuild()
+
+    students = attendance.roster(course, held_on=MONDAY)
+    assert [(s['student_id'], s['present'], s['late'], s['absent'], s['status']) for s in students] == [
+        (student1, 1, 1, 0, PRESENT), (student3, 1, 0, 0, PRESENT)
+    ]
+    assert attendance.class_percentage(students) == 100.0
+    assert attendance.sessions(course) == [MONDAY, MONDAY + datetime.timedelta(days=2)]
+
+def test_rebuild_fixes_drifted_counts(app, seed):
+    course = seed['courses'][0]
+    attendance.mark_class(course, MONDAY, {student: ABSENT for student in seed['students']})
+    row = db.session.execute(select(Attendance).limit(1)).scalar()
+    row.present, row.absent = 5, 0
+    db.session.commit()
+
+    assert attendance.rebuild() == 1
+    assert_matches_rebuild()
+
+def test_deletes(app, seed):
+    course = seed['courses'][0]
+    attendance.mark_class(course, MONDAY, {student: PRESENT for student in seed['students']})
+    assert deletion.delete_student(seed['students'][0])
+    assert deletion.delete_course(seed['courses'][1])
+    assert_matches_rebuild()
+    assert len(attendance.roster(course)) == 3
+
+def test_invalid_input(app, seed):
+    with pytest.raises(attendance.AttendanceError):
+        attendance.mark_class(seed['courses'][0], MONDAY, {seed['students'][0]: 'X'})
+    with pytest.raises(attendance.AttendanceError):
+        attendance.mark_class(-1, MONDAY, {})
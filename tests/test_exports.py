@@ -0,0 +1,35 @@
+# tests/test_exports.py
+
+import csv
+import io
+
+import pytest
+from openpyxl import load_workbook
+
+def rows(response, fmt):
+    if fmt == 'csv':
+        return [tuple(row) for row in csv.reader(io.StringIO(response.get_data(as_text=True)))]
+    return [tuple(str(value) for value in row) for row in load_workbook(io.BytesIO(response.data)).active.values]
+
+@pytest.mark.parametrize('fmt', ['csv', 'xlsx'])
+@pytest.mark.parametrize('kind', ['students', 'courses', 'enrollments', 'fees'])
+def test_export(client, seed, login, kind, fmt):
+    login(client)
+    response = client.get(f'/admin/export/{kind}.{fmt}')
+    assert response.status_code == 200
+    assert response.headers['Content-Disposition'] == f'attachment; filename={kind}.{fmt}'
+
+    exported = rows(response, fmt)
+    expected = {'students': 4, 'courses': 2, 'enrollments': 6, 'fees': 6}[kind]
+    assert len(exported) == expected + 1
+
+def test_unknown_export(client, seed, login):
+    login(client)
+    assert client.get('/admin/export/grades.csv').status_code == 404
+    assert client.get('/admin/export/fees.pdf').status_code == 404
+
+def test_fees_export_includes_term_and_due_date(client, seed, login):
+    login(client)
+    exported = rows(client.get('/admin/export/fees.csv'), 'csv')
+    assert exported[0][-2:] == ('term', 'due_date')
+    assert {row[-2] for row in exported[1:]} == {'Fall 2026'}
@@ -0,0 +1,119 @@
+# tests/test_fees.py
+
+import datetime
+
+import pytest
+from sqlalchemy import select
+
+from app import db, deletion, fees
+from app.models import Fee, FeeSummary, Student
+from conftest import lose_insert_race
+
+def summary():
+    rows = db.session.execute(select(FeeSummary)).scalars()
+    return sorted(
+        (row.scope, row.scope_id, row.term, row.paid_amount, row.paid_count, row.pending_amount, row.pending_count)
+        for row in rows if row.paid_count or row.pending_count
+    )
+
+def assert_matches_rebuild():
+    '''
+    The incrementally maintained summary must equal one rebuilt from the
+    ledger.
+    '''
+
+    db.session.expire_all()
+    incremental = summary()
+    fees.rebuild()
+    assert incremental == summary()
+
+def first_fee():
+    return db.session.execute(select(Fee).order_by(Fee.fee_id).limit(1)).scalar()
+
+def test_inserts(app, seed):
+    db.session.add(Fee(student_id=seed['students'][0], course_id=seed['courses'][1], amount=250.0, fee_status='Pending'))
+    db.session.commit()
+    assert_matches_rebuild()
+
+@pytest.mark.parametrize('field, value', [
+    ('fee_status', 'Paid'),
+    ('amount', 999.0),
+    ('term', None),
+    ('term', 'Spring 2027'),
+])
+def test_updates_on_expired_instances(app, seed, field, value):
+    fee = first_fee()
+    db.session.commit()  # expires fee, so history has no loaded old value
+    setattr(fee, field, value)
+    db.session.commit()
+    assert_matches_rebuild()
+
+def test_term_set_from_none(app, seed):
+    fee = first_fee()
+    fee.term = None
+    db.session.commit()
+
+    fee.term = 'Fall 2026'
+    db.session.commit()
+    assert_matches_rebuild()
+
+def test_first_fee_in_a_scope_loses_insert_race(app, seed):
+    with lose_insert_race(FeeSummary.__table__, ('scope', 'scope_id', 'term')) as raced:
+        db.session.add(Fee(student_id=seed['students'][2], course_id=seed['courses'][1], amount=75.0,
+                           fee_status='Pending', term='Spring 2027'))
+        db.session.commit()
+    assert raced == [('total', 0, 'Spring 2027')]
+    assert_matches_rebuild()
+
+def test_fee_moved_to_another_student_and_course(app, seed):
+    fee = first_fee()
+    db.session.commit()
+    fee.student_id, fee.course_id = seed['students'][1], seed['courses'][1]
+    db.session.commit()
+    assert_matches_rebuild()
+
+def test_no_op_assignment_leaves_summary_alone(app, seed):
+    fee = first_fee()
+    db.session.commit()
+    fee.fee_status = fee.fee_status
+    db.session.commit()
+    assert_matches_rebuild()
+
+def test_student_changes_department(app, seed):
+    student = db.session.get(Student, seed['students'][0])
+    db.session.commit()
+    student.department_id = seed['departments'][1]
+    db.session.commit()
+    assert_matches_rebuild()
+
+    student.department_id = None
+    db.session.commit()
+    assert_matches_rebuild()
+
+def test_deletes(app, seed):
+    db.session.delete(first_fee())
+    db.session.commit()
+    assert_matches_rebuild()
+
+def test_bulk_student_delete(app, seed):
+    assert deletion.delete_student(seed['students'][0])
+    assert_matches_rebuild()
+
+def test_bulk_course_delete(app, seed):
+    assert deletion.delete_course(seed['courses'][1])
+    assert_matches_rebuild()
+
+def test_retire_term(app, seed):
+    assert fees.retire_term('Fall 2026', batch_size=2) == 6
+    assert_matches_rebuild()
+    assert fees.totals()['pending_count'] == 0
+
+def test_aging_without_a_term(app, seed):
+    today = datetime.date(2026, 10, 1)
+    fee = first_fee()
+    fee.term, fee.due_date = None, today - datetime.timedelta(days=40)
+    db.session.commit()
+
+    aging = {label: (count, amount) for label, count, amount in fees.aging(as_of=today, term=fees.NO_TERM)}
+    assert aging['31-60 days'] == (1, fee.amount)
+    assert sum(count for count, _ in aging.values()) == 1
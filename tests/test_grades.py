@@ -0,0 +1,70 @@
+# tests/test_grades.py
+
+import pytest
+from sqlalchemy import select
+
+from app import db, deletion, grades
+from app.models import GpaSummary
+
+def summary():
+    rows = db.session.execute(select(GpaSummary)).scalars()
+    return sorted(
+        (row.student_id, row.term, row.credits, round(row.quality_points, 6), row.gpa and round(row.gpa, 6))
+        for row in rows
+    )
+
+def assert_matches_rebuild():
+    '''
+    The incrementally maintained GPA summary must equal one rebuilt from
+    the grades.
+    '''
+
+    db.session.expire_all()
+    incremental = summary()
+    grades.rebuild()
+    assert incremental == summary()
+
+@pytest.fixture
+def graded(app, seed):
+    students, courses = seed['students'], seed['courses']
+    grades.record_course(courses[0], {student: 60 + 10 * i for i, student in enumerate(students)}, term='Fall 2026')
+    grades.record_course(courses[1], {students[1]: 85, students[3]: 40}, term='Spring 2027')
+    return seed
+
+def test_first_grades(graded):
+    assert_matches_rebuild()
+    _, summaries = grades.transcript(graded['students'][1])
+    assert set(summaries) == {'Fall 2026', 'Spring 2027', grades.ALL_TERMS}
+
+def test_regrade_replaces_previous_grade(graded):
+    students, courses = graded['students'], graded['courses']
+    grades.record_course(courses[0], {students[0]: 100, students[2]: 0}, term='Fall 2026')
+    assert_matches_rebuild()
+
+    # Regrading in another term moves the grade's credits out of the old term.
+    grades.record_course(courses[1], {students[1]: 70}, term='Fall 2026', curve='top')
+    assert_matches_rebuild()
+    _, summaries = grades.transcript(students[1])
+    assert 'Spring 2027' not in summaries
+
+def test_bulk_course_delete(graded):
+    assert deletion.delete_course(graded['courses'][1])
+    assert_matches_rebuild()
+
+def test_bulk_student_delete(graded):
+    assert deletion.delete_student(graded['students'][1])
+    assert_matches_rebuild()
+
+def test_ranking_matches_cgpa_order(graded):
+    _, rows = grades.ranking()
+    cgpas = [row['gpa'] for row in rows]
+    assert cgpas == sorted(cgpas, reverse=True)
+    assert rows[0]['rank'] == 1
+
+def test_invalid_marks(graded):
+    students, courses = graded['students'], graded['courses']
+    with pytest.raises(grades.GradeError):
+        grades.record_course(courses[0], {students[0]: 101})
+    with pytest.raises(grades.GradeError):
+        grades.record_course(courses[1], {students[0]: 50})
+    assert_matches_rebuild()
@@ -0,0 +1,43 @@
+# tests/test_identity.py
+
+import json
+
+from sqlalchemy import select
+
+from app import db
+from app.cache import MemoryStore
+from app.identity import identity_cache
+from app.models import User
+
+def admin_id():
+    return db.session.execute(select(User.id).where(User.email == 'admin@uni.edu')).scalar()
+
+def test_passwords_are_not_cached(app, seed):
+    identity_cache.shared = MemoryStore()
+    user_id = admin_id()
+    db.session.remove()
+
+    identity_cache.load(User, user_id)
+
+    assert '_password' not in identity_cache.local.get(user_id)
+    assert '_password' not in json.loads(identity_cache.shared.get(f'identity:{user_id}'))
+
+def test_cached_user_loads_password_on_demand(app, seed):
+    user_id = admin_id()
+    identity_cache.load(User, user_id)
+    db.session.remove()
+
+    user = identity_cache.load(User, user_id)
+
+    assert identity_cache.stats()['hits'] == 1
+    assert user.verify_password('secret')
+    assert not user.verify_password('wrong')
+
+def test_updates_drop_cached_identity(app, seed):
+    user_id = admin_id()
+    identity_cache.load(User, user_id)
+
+    db.session.get(User, user_id).first_name = 'Renamed'
+    db.session.commit()
+
+    assert identity_cache.local.get(user_id) is None
@@ -0,0 +1,102 @@
+# tests/test_jobs.py
+
+import datetime
+
+import pytest
+from sqlalchemy import select, update
+
+from app import db, jobs
+from app.jobs import job_workers
+from app.models import Course, Job
+
+calls = []
+
+@jobs.task('test_echo')
+def echo(job, value):
+    job.progress(1, 2, 'Halfway.', force=True)
+    return {'value': value}
+
+@jobs.task('test_flaky', retries=2)
+def flaky(job, failures):
+    calls.append(job.job_id)
+    if len(calls) <= failures:
+        raise RuntimeError('Try again.')
+    return len(calls)
+
+@jobs.task('test_cancels_itself')
+def cancels_itself(job):
+    jobs.cancel(job.job_id)
+    job.progress(0, force=True)
+
+@pytest.fixture(autouse=True)
+def no_retry_delay(app, monkeypatch):
+    calls.clear()
+    monkeypatch.setattr(job_workers, 'retry_delay', 0)
+
+def status(job_id):
+    db.session.expire_all()
+    return jobs.get(job_id)
+
+def test_unknown_kind(app):
+    with pytest.raises(jobs.JobError):
+        jobs.enqueue('no_such_kind', 'Nothing')
+
+def test_run_pending(app):
+    job_id = jobs.enqueue('test_echo', 'Echo', params={'value': 7})
+    assert status(job_id)['status'] == jobs.QUEUED
+
+    assert job_workers.run_pending() == 1
+    job = status(job_id)
+    assert (job['status'], job['result'], job['done'], job['total'], job['percent']) == (jobs.SUCCEEDED, {'value': 7}, 2, 2, 100.0)
+    assert job_workers.run_pending() == 0
+
+def test_retries_then_succeeds(app):
+    job_id = jobs.enqueue('test_flaky', 'Flaky', params={'failures': 2})
+    assert job_workers.run_pending() == 3
+    job = status(job_id)
+    assert (job['status'], job['attempts'], job['result']) == (jobs.SUCCEEDED, 3, 3)
+
+def test_fails_once_retries_run_out(app):
+    job_id = jobs.enqueue('test_flaky', 'Flaky', params={'failures': 5})
+    assert job_workers.run_pending() == 3
+    job = status(job_id)
+    assert (job['status'], job['attempts'], job['error']) == (jobs.FAILED, 3, 'RuntimeError: Try again.')
+
+def test_retry_waits_for_its_delay(app, monkeypatch):
+    monkeypatch.setattr(job_workers, 'retry_delay', 60)
+    job_id = jobs.enqueue('test_flaky', 'Flaky', params={'failures': 1})
+    assert job_workers.run_pending() == 1
+    assert status(job_id)['status'] == jobs.QUEUED
+    assert jobs.claim('worker') is None
+
+def test_cancel_queued_and_running(app):
+    queued = jobs.enqueue('test_echo', 'Echo', params={'value': 1})
+    assert jobs.cancel(queued)
+    assert not jobs.cancel(queued)
+
+    running = jobs.enqueue('test_cancels_itself', 'Cancel')
+    assert job_workers.run_pending() == 1
+    assert status(queued)['status'] == status(running)['status'] == jobs.CANCELLED
+
+@pytest.mark.parametrize('kind, params, settled_as', [
+    ('test_flaky', {'failures': 0}, jobs.QUEUED),
+    ('test_echo', {'value': 1}, jobs.FAILED),
+])
+def test_recover_stale_jobs(app, kind, params, settled_as):
+    job_id = jobs.enqueue(kind, 'Stale', params=params)
+    assert jobs.claim('crashed-worker') == job_id
+    assert jobs.recover(stale_after=60) == 0
+
+    db.session.execute(
+        update(Job).where(Job.job_id == job_id).values(heartbeat_at=datetime.datetime.now() - datetime.timedelta(minutes=5))
+    )
+    db.session.commit()
+    assert jobs.recover(stale_after=60) == 1
+    assert status(job_id)['status'] == settled_as
+
+def test_registered_task(app, seed):
+    course_id = seed['courses'][1]
+    job_id = jobs.enqueue('delete_course', 'Delete a course', params={'course_id': course_id})
+    assert job_workers.run_pending() == 1
+    assert status(job_id)['result'] == {'deleted': True}
+    assert db.session.execute(select(Course).where(Course.course_id == course_id)).first() is None
@@ -0,0 +1,75 @@
+# tests/test_migrations.py
+
+import os
+import sqlite3
+
+import flask_migrate
+import pytest
+from sqlalchemy import text
+
+from app import create_app, db
+
+MIGRATIONS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'migrations')
+
+# A few rows in the tables as they were before migrations were kept.
+BASELINE_ROWS = (
+    "INSERT INTO departments (dep_id, dep_name) VALUES (1, 'CS')",
+    "INSERT INTO users VALUES (1, 's@uni.edu', 's', 'x', 'S', 'T', '1', 'Campus', 'Student', 0, 1)",
+    "INSERT INTO users VALUES (2, 't@uni.edu', 't', 'x', 'T', 'T', '2', 'Campus', 'Teacher', 0, 1)",
+    "INSERT INTO students VALUES (1, 1, 1)",
+    "INSERT INTO teachers VALUES (1, 2, 'CS')",
+    "INSERT INTO courses VALUES (1, 'Course 0', 3, 1)",
+    "INSERT INTO enrollments VALUES (1, 1, 1)",
+    "INSERT INTO fees VALUES (1, 1, 1, 100.0, 'Paid')",
+)
+
+@pytest.fixture
+def migrated_app(tmp_path):
+    app = create_app('production', config_overrides={
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "migrated.db"}',
+        'SQLALCHEMY_ECHO': False,
+        'SECRET_KEY': 'test',
+        'JOB_WORKERS': 0,
+        'REFERENCE_DATA_PRELOAD': False
+    })
+    with app.app_context():
+        yield app
+        db.session.remove()
+
+def scalar(sql):
+    return db.session.execute(text(sql)).scalar()
+
+def test_upgrade_matches_the_models(migrated_app):
+    flask_migrate.upgrade(MIGRATIONS)
+    # Exits if autogenerate finds the schema differs from the models.
+    flask_migrate.check(MIGRATIONS)
+
+    flask_migrate.downgrade(MIGRATIONS, revision='base')
+    assert scalar("SELECT COUNT(*) FROM sqlite_master WHERE name = 'fees'") == 0
+
+def test_upgrade_existing_database(migrated_app):
+    flask_migrate.upgrade(MIGRATIONS, revision='0001')
+    for statement in BASELINE_ROWS:
+        db.session.execute(text(statement))
+    db.session.commit()
+
+    flask_migrate.upgrade(MIGRATIONS)
+    db.session.remove()
+    assert scalar('SELECT seats_taken FROM courses WHERE course_id = 1') == 1
+
+    # Deleting the student now cascades to their enrollment and fee.
+    db.session.execute(text('DELETE FROM students WHERE roll_no = 1'))
+    db.session.commit()
+    assert scalar('SELECT COUNT(*) FROM enrollments') == scalar('SELECT COUNT(*) FROM fees') == 0
+
+def test_upgrade_refuses_orphaned_rows(migrated_app):
+    flask_migrate.upgrade(MIGRATIONS, revision='0001')
+    # Written without foreign key enforcement, as SQLite did before.
+    connection = sqlite3.connect(db.engine.url.database)
+    connection.execute('INSERT INTO enrollments VALUES (1, 5, 7)')
+    connection.commit()
+    connection.close()
+
+    with pytest.raises(SystemExit):
+        flask_migrate.upgrade(MIGRATIONS)
+    assert scalar('SELECT version_num FROM alembic_version') == '0001'
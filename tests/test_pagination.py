@@ -0,0 +1,43 @@
+# tests/test_pagination.py
+
+import base64
+import json
+
+import pytest
+
+from app import queries
+from app.pagination import InvalidCursor, decode_cursor, encode_cursor
+
+def raw_cursor(*parts):
+    return base64.urlsafe_b64encode(json.dumps(list(parts)).encode()).decode().rstrip('=')
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor('Khan', 42, 'next')) == ('Khan', 42, 'next')
+    assert decode_cursor(encode_cursor(None, 7, 'prev')) == (None, 7, 'prev')
+
+@pytest.mark.parametrize('cursor', [
+    'not base64!',
+    raw_cursor('a', 1),
+    raw_cursor('a', 1, 'sideways'),
+    raw_cursor(['a'], 1, 'next'),
+    raw_cursor('a', {'id': 1}, 'next'),
+    raw_cursor('a', 1, ['next']),
+])
+def test_malformed_cursors_are_rejected(cursor):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(cursor)
+
+def test_pages_cover_every_row_once(app, seed):
+    first = queries.list_courses(per_page=1)
+    second = queries.list_courses(cursor=first.next_cursor, per_page=1)
+    back = queries.list_courses(cursor=second.prev_cursor, per_page=1)
+
+    assert len(first.items) == len(second.items) == 1
+    assert first.items[0] != second.items[0]
+    assert back.items == first.items
+    assert not second.has_next
+
+def test_crafted_cursor_is_a_bad_request(client, seed, login):
+    login(client)
+    assert client.get('/admin/courses', query_string={'cursor': raw_cursor(['x'], 1, 'next')}).status_code == 400
+    assert client.get('/admin/courses', query_string={'cursor': raw_cursor('x', [1], 'next')}).status_code == 400
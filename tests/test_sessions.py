@@ -0,0 +1,108 @@
+# tests/test_sessions.py
+
+import datetime
+
+import pytest
+from sqlalchemy import select, update
+
+from app import db, deletion, verification
+from app.models import User, UserSession
+from app.sessions import session_store
+
+@pytest.fixture(params=['database', 'memory://'])
+def store(request, app):
+    app.config['SESSION_STORE'] = request.param
+    session_store.init_app(app)
+    yield request.param
+    app.config['SESSION_STORE'] = None
+    session_store.init_app(app)
+
+def user(email):
+    return db.session.execute(select(User).where(User.email == email)).scalar()
+
+def logged_in(client):
+    return client.get('/timetable').status_code == 200
+
+def test_cookie_holds_only_an_id(client, seed, store, login):
+    assert login(client, 'student0@uni.edu').status_code == 302
+    cookie = client.get_cookie('session').value
+    assert len(cookie) == 43 and '.' not in cookie
+    assert logged_in(client)
+
+def test_login_and_logout_rotate_the_id(client, seed, store, login):
+    client.get('/login')
+    client.set_cookie('session', 'planted-by-an-attacker')
+    login(client, 'student0@uni.edu')
+    first = client.get_cookie('session').value
+    assert first != 'planted-by-an-attacker'
+
+    client.get('/logout')
+    assert client.get_cookie('session') is None or client.get_cookie('session').value != first
+    assert not logged_in(client)
+
+def test_role_change_revokes(client, seed, store, login):
+    login(client, 'student0@uni.edu')
+    student = user('student0@uni.edu')
+    db.session.commit()
+    student.role = 'Teacher'
+    db.session.commit()
+    assert not logged_in(client)
+
+@pytest.mark.parametrize('field, value', [
+    ('role', 'Student'), ('status', True), ('is_admin', False), ('_password', 'secret'), ('first_name', 'Renamed')
+])
+def test_no_op_edit_keeps_sessions(client, seed, store, login, field, value):
+    login(client, 'student0@uni.edu')
+    student = user('student0@uni.edu')
+    db.session.commit()  # expired, as in an edit form that reassigns a field
+    setattr(student, field, value)
+    db.session.commit()
+    assert logged_in(client)
+
+def test_deletes_revoke(client, seed, store, login):
+    login(client, 'student0@uni.edu')
+    other = client.application.test_client()
+    login(other, 'teacher@uni.edu')
+
+    assert deletion.delete_student(seed['students'][0])
+    db.session.delete(user('teacher@uni.edu'))
+    db.session.commit()
+
+    assert not logged_in(client)
+    assert other.get('/timetable').status_code != 200
+
+def test_bulk_verification_revokes(app, seed, store):
+    pending = seed['user_ids'][3]
+    backend = session_store.backend
+    backend.save('k' * 64, '{}', pending, datetime.datetime.now() + datetime.timedelta(hours=1), None)
+    assert backend.load('k' * 64) is not None
+
+    verification.verify_users(user_ids=[pending])
+
+    assert backend.load('k' * 64) is None
+
+def test_forged_cookie_is_cleared(client, seed, store):
+    client.set_cookie('session', 'forged')
+    response = client.get('/login')
+    assert 'session=;' in response.headers.get('Set-Cookie', '')
+
+def test_sweep_removes_expired_sessions(client, seed, login):
+    client.application.config['SESSION_STORE'] = 'database'
+    session_store.init_app(client.application)
+    try:
+        login(client, 'student0@uni.edu')
+        db.session.execute(update(UserSession).values(expires_at=datetime.datetime.now()))
+        db.session.commit()
+
+        assert session_store.sweep(batch_size=1) == 1
+        assert db.session.execute(select(UserSession)).first() is None
+        assert not logged_in(client)
+    finally:
+        client.application.config['SESSION_STORE'] = None
+        session_store.init_app(client.application)
+
+def test_signed_cookies_by_default(client, seed, login):
+    login(client, 'student0@uni.edu')
+    assert not session_store.enabled
+    assert len(client.get_cookie('session').value) > 43
+    assert session_store.revoke(seed['user_ids'][0]) == 0
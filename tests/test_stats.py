@@ -0,0 +1,80 @@
+# tests/test_stats.py
+
+from sqlalchemy import select
+
+from app import db, deletion, stats
+from app.models import Department, Enrollment, StatCounter, Student, Teacher, User
+from conftest import lose_insert_race, make_user
+
+def assert_counters_exact():
+    '''
+    reconcile() recounts from the base tables and returns the corrections
+    it had to make; there should be none.
+    '''
+
+    db.session.expire_all()
+    assert stats.reconcile() == {}
+
+def user(email):
+    return db.session.execute(select(User).where(User.email == email)).scalar()
+
+def test_seeded_counters(app, seed):
+    assert_counters_exact()
+
+def test_role_change_on_expired_instance(app, seed):
+    student = user('student0@uni.edu')
+    db.session.commit()
+    student.role = 'Teacher'
+    db.session.commit()
+    assert_counters_exact()
+
+def test_status_change_on_expired_instance(app, seed):
+    pending = user('student3@uni.edu')
+    db.session.commit()
+    pending.status = True
+    db.session.commit()
+    assert_counters_exact()
+
+    pending.status = False
+    db.session.commit()
+    assert_counters_exact()
+
+def test_department_change_on_expired_instance(app, seed):
+    student = db.session.get(Student, seed['students'][0])
+    db.session.commit()
+    student.department_id = seed['departments'][1]
+    db.session.commit()
+    assert_counters_exact()
+
+def test_no_op_assignments(app, seed):
+    student = user('student1@uni.edu')
+    db.session.commit()
+    student.role, student.status = 'Student', True
+    db.session.commit()
+    assert_counters_exact()
+
+def test_inserts_and_orm_deletes(app, seed):
+    db.session.add(Student(users=make_user('new@uni.edu', contact='3000000000'), department_id=seed['departments'][0]))
+    db.session.add(Enrollment(student_id=seed['students'][2], course_id=seed['courses'][1]))
+    db.session.commit()
+    assert_counters_exact()
+
+    db.session.delete(db.session.get(Teacher, seed['teacher_id']))
+    db.session.commit()
+    assert_counters_exact()
+
+def test_first_student_in_a_new_department_loses_insert_race(app, seed):
+    department = Department(dep_name='EE')
+    db.session.add(department)
+    db.session.commit()
+
+    with lose_insert_race(StatCounter.__table__, ('name', 'scope_id', 'slot')) as raced:
+        db.session.add(Student(users=make_user('ee@uni.edu', contact='3000000001'), department_id=department.dep_id))
+        db.session.commit()
+    assert raced
+    assert_counters_exact()
+
+def test_bulk_deletes(app, seed):
+    assert deletion.delete_student(seed['students'][1])
+    assert deletion.delete_course(seed['courses'][0])
+    assert_counters_exact()
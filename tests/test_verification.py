@@ -0,0 +1,25 @@
+# tests/test_verification.py
+
+from sqlalchemy import select
+
+from app import db, stats, verification
+from app.models import User
+from app.search import PEOPLE, search_index
+
+def status_in_search(user_id):
+    return {doc.id: doc.fields['status'] for doc in search_index.search(PEOPLE, 'student3')}.get(user_id)
+
+def test_bulk_verify_refreshes_search(app, seed):
+    pending = seed['user_ids'][3]
+    search_index.build()
+    assert status_in_search(pending) is False
+
+    assert verification.verify_users(role='Student') == 1
+
+    assert status_in_search(pending) is True
+    assert db.session.execute(select(User.status).where(User.id == pending)).scalar() is True
+
+def test_bulk_verify_keeps_counters_exact(app, seed):
+    verification.verify_users(user_ids=[seed['user_ids'][3]])
+    assert verification.count_pending() == 0
+    assert stats.reconcile() == {}